@@ -1,4 +1,5 @@
 from pydantic_settings import BaseSettings
+from datetime import date
 from typing import List, Optional
 
 
@@ -26,7 +27,62 @@ class Settings(BaseSettings):
     # Firebase Cloud Messaging (FCM) for Push Notifications
     # Use Service Account JSON file path (recommended) or set GOOGLE_APPLICATION_CREDENTIALS env var
     FCM_SERVICE_ACCOUNT_PATH: Optional[str] = None  # Path to service account JSON file
-    
+
+    # Notification stream (Server-Sent Events)
+    NOTIFICATION_STREAM_HEARTBEAT_SECONDS: int = 25  # Keeps proxies from closing idle streams
+    NOTIFICATION_STREAM_MAX_PER_USER: int = 3  # Concurrent open streams allowed per user
+    NOTIFICATION_STREAM_REPLAY_BUFFER: int = 50  # Recent events kept per user for Last-Event-ID resume
+    NOTIFICATION_STREAM_RESUME_WINDOW_SECONDS: int = 300  # How long events are buffered after a stream closes
+
+    # Bulk notifications / broadcasts
+    NOTIFICATION_BULK_INSERT_BATCH_SIZE: int = 1000  # Rows per INSERT statement
+    NOTIFICATION_PUSH_GROUP_SIZE: int = 200  # Users per device lookup + FCM batch
+
+    # Notification retention (see database/migrations/add_notification_retention.sql)
+    NOTIFICATION_RETENTION_ENABLED: bool = True
+    NOTIFICATION_RETENTION_DAYS: int = 90  # Read notifications older than this are pruned
+    NOTIFICATION_RETENTION_ARCHIVE: bool = False  # Move to notifications_archive instead of deleting
+    NOTIFICATION_RETENTION_BATCH_SIZE: int = 1000  # Rows removed per statement
+    NOTIFICATION_RETENTION_MAX_BATCHES: int = 50  # Upper bound on batches per run
+    NOTIFICATION_RETENTION_INTERVAL_SECONDS: int = 3600
+
+    # Expiry of pending video call requests (see database/migrations/add_expire_video_calls_function.sql)
+    VIDEO_CALL_EXPIRY_ENABLED: bool = True
+    VIDEO_CALL_EXPIRY_GRACE_MINUTES: int = 30  # Pending requests this long past scheduled_time expire
+    VIDEO_CALL_EXPIRY_BATCH_SIZE: int = 500  # Requests expired per statement
+    VIDEO_CALL_EXPIRY_MAX_BATCHES: int = 20  # Upper bound on batches per run
+    VIDEO_CALL_EXPIRY_INTERVAL_SECONDS: int = 300
+
+    # Automatic booking / video call transitions (see database/migrations/add_scheduled_transitions.sql)
+    BOOKING_TRANSITIONS_ENABLED: bool = True
+    TRANSITION_TICK_SECONDS: float = 1.0  # Timing wheel resolution
+    TRANSITION_WHEEL_SIZE: int = 64  # Buckets per wheel level
+    TRANSITION_WHEEL_LEVELS: int = 4  # 64^4 one-second ticks covers ~194 days; later timers wait in overflow
+    TRANSITION_RETRY_SECONDS: int = 30  # Delay before retrying transitions whose update failed
+
+    # Idempotency-Key handling for POST endpoints
+    IDEMPOTENCY_TTL_SECONDS: int = 86400  # How long a stored response can be replayed
+    IDEMPOTENCY_MAX_KEYS: int = 100000  # Oldest keys are dropped beyond this
+    IDEMPOTENCY_WAIT_SECONDS: int = 30  # How long a retry waits for the original request to finish
+
+    # Notification preferences cache
+    NOTIFICATION_PREFERENCES_CACHE_SECONDS: int = 300
+    NOTIFICATION_PREFERENCES_CACHE_MAX_USERS: int = 50000
+
+    # Recurring booking expansion
+    RECURRING_MAX_WINDOW_DAYS: int = 366  # Longest date window a single request may expand
+    RECURRING_CACHE_SECONDS: int = 300  # How long expanded occurrences are reused
+    RECURRING_CACHE_MAX_ENTRIES: int = 10000  # Cached (booking, window) expansions
+
+    # Caregiver free/busy bitmaps
+    FREEBUSY_MAX_DAYS: int = 62  # Longest range one request may ask for
+    FREEBUSY_CACHE_SECONDS: int = 600  # Safety expiry; booking writes invalidate immediately
+    FREEBUSY_CACHE_MAX_CAREGIVERS: int = 10000
+
+    # Per-user dashboard cache
+    DASHBOARD_CACHE_SECONDS: int = 60  # Safety expiry; booking/video call/chat writes invalidate immediately
+    DASHBOARD_CACHE_MAX_USERS: int = 10000
+
     # Twilio Video Configuration
     TWILIO_ACCOUNT_SID: Optional[str] = None
     TWILIO_AUTH_TOKEN: Optional[str] = None
@@ -36,6 +92,46 @@ class Settings(BaseSettings):
     # Razorpay Payment Configuration
     RAZORPAY_KEY_ID: Optional[str] = None
     RAZORPAY_KEY_SECRET: Optional[str] = None
+    PAYMENT_GATEWAY: str = "razorpay"  # "razorpay", or "stub" for the in-memory gateway (local runs, tests, benchmarks)
+    PAYMENT_STUB_LATENCY_MS: float = 0.0  # Simulated round-trip of the stub gateway
+    RAZORPAY_API_BASE_URL: str = "https://api.razorpay.com/v1"
+    RAZORPAY_TIMEOUT_SECONDS: float = 10.0  # Per-call read/write timeout
+    RAZORPAY_CONNECT_TIMEOUT_SECONDS: float = 5.0
+    RAZORPAY_MAX_CONNECTIONS: int = 20  # Pooled keep-alive connections to the API
+    RAZORPAY_GET_RETRIES: int = 2  # Extra attempts for GETs on timeouts, 429 and 5xx (POSTs are never retried)
+    RAZORPAY_RETRY_BACKOFF_SECONDS: float = 0.5  # Doubled after each retry
+    PAYMENT_BYPASS_ENABLED: bool = True  # TEMPORARY: create-order marks the booking paid without Razorpay
+    PAYMENT_ORDER_REUSE_SECONDS: int = 6 * 3600  # A booking's unpaid order is handed out again for this long
+    
+    # Razorpay webhooks: the endpoint stores events, a worker applies them
+    RAZORPAY_WEBHOOK_SECRET: Optional[str] = None  # Falls back to RAZORPAY_KEY_SECRET
+    PAYMENT_WEBHOOK_WORKER_ENABLED: bool = True
+    PAYMENT_WEBHOOK_WORKER_INTERVAL_SECONDS: int = 10  # Sweep for events a wake-up missed (restarts, retries)
+    PAYMENT_WEBHOOK_BATCH_SIZE: int = 200
+    PAYMENT_WEBHOOK_MAX_ATTEMPTS: int = 10  # Then the event is marked failed
+    PAYMENT_WEBHOOK_RETRY_BASE_SECONDS: float = 10.0  # Delay after the first failed attempt, doubled after each further one
+    PAYMENT_WEBHOOK_RETRY_MAX_SECONDS: float = 3600.0  # Backoff cap
+    PAYMENT_WEBHOOK_PERSIST_TIMEOUT_SECONDS: float = 5.0  # Longer than this and the webhook answers 503 so Razorpay retries
+    PAYMENT_WEBHOOK_DEDUPE_CACHE_SIZE: int = 10000  # Recently stored event ids kept in memory
+    
+    # Payment reconciliation: bookings vs. the gateway's recent orders and payments
+    PAYMENT_RECONCILIATION_ENABLED: bool = True
+    PAYMENT_RECONCILIATION_INTERVAL_SECONDS: int = 3600
+    PAYMENT_RECONCILIATION_LOOKBACK_HOURS: float = 48.0
+    PAYMENT_RECONCILIATION_PAGE_SIZE: int = 100  # Razorpay's maximum per listing call
+    PAYMENT_RECONCILIATION_MAX_PAGES: int = 50  # Per listing, per run
+    PAYMENT_RECONCILIATION_LOOKUP_CHUNK: int = 200  # Order ids per bookings select
+    
+    # Caregiver payouts (direct PostgreSQL connection, see src/config/db.py)
+    PAYOUT_ENABLED: bool = False
+    PAYOUT_INTERVAL_SECONDS: int = 3600  # Each run computes every UTC day since the last batch once
+    PAYOUT_CHUNK_SIZE: int = 5000  # Bookings fetched from the server-side cursor per round-trip
+    PAYOUT_START_DATE: Optional[date] = None  # Day (UTC) of the first batch, default yesterday; bookings completed earlier are never paid out
+    
+    # Location ingestion: positions are kept in memory and written in batches
+    LOCATION_FLUSH_INTERVAL_SECONDS: int = 5  # users.current_location lags by at most this much
+    LOCATION_FLUSH_BATCH_SIZE: int = 500  # Users per flush_user_locations call
+    LOCATION_CACHE_MAX_USERS: int = 50000  # Last-known positions kept for GET /api/location/me
     
     class Config:
         env_file = ".env"
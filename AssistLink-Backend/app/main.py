@@ -4,6 +4,7 @@ from fastapi.responses import JSONResponse
 from app.routers import auth, users, caregivers, bookings, location, dashboard, chat, notifications, payments
 from app.config import settings
 from src.config.db import get_db_connection, return_db_connection
+import asyncio
 import time
 import traceback
 
@@ -174,9 +175,85 @@ async def health_check_db():
         )
 
 
+@app.on_event("startup")
+async def startup_event():
+    """Start periodic background jobs"""
+    from app.services.jobs import start_periodic_job
+    
+    from app.services.location_buffer import flush_locations
+    start_periodic_job(
+        "location_flush",
+        settings.LOCATION_FLUSH_INTERVAL_SECONDS,
+        flush_locations
+    )
+    
+    if settings.NOTIFICATION_RETENTION_ENABLED:
+        from app.services.notification_retention import prune_read_notifications
+        start_periodic_job(
+            "notification_retention",
+            settings.NOTIFICATION_RETENTION_INTERVAL_SECONDS,
+            prune_read_notifications,
+            initial_delay=60
+        )
+    
+    if settings.VIDEO_CALL_EXPIRY_ENABLED:
+        from app.services.video_call_expiry import expire_stale_video_calls
+        start_periodic_job(
+            "video_call_expiry",
+            settings.VIDEO_CALL_EXPIRY_INTERVAL_SECONDS,
+            expire_stale_video_calls,
+            initial_delay=30
+        )
+    
+    if settings.BOOKING_TRANSITIONS_ENABLED:
+        from app.services.booking_transitions import transition_scheduler
+        start_periodic_job(
+            "booking_transitions",
+            settings.TRANSITION_TICK_SECONDS,
+            transition_scheduler.tick
+        )
+    
+    if settings.PAYMENT_WEBHOOK_WORKER_ENABLED:
+        from app.services.payment_webhooks import process_pending_events
+        start_periodic_job(
+            "payment_webhooks",
+            settings.PAYMENT_WEBHOOK_WORKER_INTERVAL_SECONDS,
+            process_pending_events,
+            initial_delay=5
+        )
+    
+    if settings.PAYMENT_RECONCILIATION_ENABLED:
+        from app.services.payment_reconciliation import run_reconciliation_job
+        start_periodic_job(
+            "payment_reconciliation",
+            settings.PAYMENT_RECONCILIATION_INTERVAL_SECONDS,
+            run_reconciliation_job,
+            initial_delay=300
+        )
+    
+    if settings.PAYOUT_ENABLED:
+        from app.services.caregiver_payouts import run_daily_payouts
+        start_periodic_job(
+            "caregiver_payouts",
+            settings.PAYOUT_INTERVAL_SECONDS,
+            run_daily_payouts,
+            initial_delay=600
+        )
+
+
 @app.on_event("shutdown")
 async def shutdown_event():
-    """Clean up database connections on shutdown"""
+    """Stop background jobs and clean up database connections on shutdown"""
+    from app.services.jobs import stop_all_jobs
+    await stop_all_jobs()
+    
+    # Write positions that arrived since the last flush
+    from app.services.location_buffer import flush_locations
+    await asyncio.to_thread(flush_locations)
+    
+    from app.services.payment_gateway import close_payment_gateway
+    await close_payment_gateway()
+    
     from src.config.db import close_all_connections
     close_all_connections()
 
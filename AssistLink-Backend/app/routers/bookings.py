@@ -1,8 +1,9 @@
-from fastapi import APIRouter, HTTPException, status, Depends
+from fastapi import APIRouter, HTTPException, status, Depends, BackgroundTasks
 from datetime import datetime, timedelta
-from typing import Optional
+from typing import List, Optional
 from app.schemas import (
-    BookingCreate, BookingUpdate, BookingResponse,
+    BookingCreate, BookingUpdate, BookingResponse, OccurrenceExceptionUpdate,
+    BookingBulkCreate, BookingBulkStatusUpdate,
     VideoCallRequestCreate, VideoCallRequestResponse, VideoCallAcceptRequest,
     ChatSessionResponse, ChatAcceptRequest
 )
@@ -16,14 +17,24 @@ from app.services.notifications import (
     notify_video_call_status_change,
     notify_booking_created,
     notify_booking_status_change,
+    notify_bookings_created_bulk,
+    notify_bookings_status_change_bulk,
     notify_chat_enabled
 )
+from app.services.booking_payments import mark_booking_paid, schedule_booking_paid_notifications
+from app.services.idempotency import idempotent
+from app.services.booking_conflicts import ACTIVE_BOOKING_STATUSES, booking_window, is_overlap_error, overlap_http_exception
+from app.services.recurrence import invalidate_booking, iter_occurrence_starts, parse_datetime
+from app.services.freebusy import invalidate_caregiver
+from app.services.dashboard_cache import invalidate_users
+from app.services.booking_transitions import transition_scheduler
 import uuid
 
 router = APIRouter()
 
 
 @router.post("/video-call/request", response_model=VideoCallRequestResponse, status_code=status.HTTP_201_CREATED)
+@idempotent
 async def create_video_call_request(
     video_call_data: VideoCallRequestCreate,
     current_user: dict = Depends(verify_care_recipient)
@@ -108,6 +119,7 @@ async def create_video_call_request(
         
         video_call = response.data[0]
         print(f"[INFO] Video call request created with ID: {video_call['id']}", flush=True)
+        invalidate_users(video_call["care_recipient_id"], video_call["caregiver_id"])
         
         # Get user names for notifications and send them
         # Do this separately so notifications are sent even if name lookup fails
@@ -220,294 +232,132 @@ async def get_video_call_request(
 async def accept_video_call_request(
     video_call_id: str,
     accept_data: VideoCallAcceptRequest,
+    background_tasks: BackgroundTasks,
     current_user: dict = Depends(get_current_user)
 ):
     """
     Accept or decline video call request.
     Both care recipient and caregiver must accept for the call to proceed.
+    
+    The whole state transition (acceptance flags, pending-payment booking,
+    caregiver availability, disabled chat session) runs in the
+    `accept_video_call` database function in a single round-trip, with the
+    request row locked so concurrent accepts cannot race. Notifications are
+    sent after the response.
     """
     print(f"[INFO] ===== ACCEPT VIDEO CALL REQUEST STARTED =====", flush=True)
     print(f"[INFO] Video call ID: {video_call_id}", flush=True)
     print(f"[INFO] Accept: {accept_data.accept}", flush=True)
     print(f"[INFO] Current User ID: {current_user.get('id')}", flush=True)
     try:
-        # Get video call request - use supabase_admin to bypass RLS
-        print(f"[INFO] Fetching video call request from database...", flush=True)
         try:
-            response = supabase_admin.table("video_call_requests").select("*").eq("id", video_call_id).single().execute()
-        except Exception as fetch_error:
-            print(f"[WARN] Admin fetch failed, trying regular supabase: {fetch_error}", flush=True)
-            # Fallback to regular supabase
-            response = supabase.table("video_call_requests").select("*").eq("id", video_call_id).single().execute()
-        
-        if not response.data:
-            raise HTTPException(
-                status_code=status.HTTP_404_NOT_FOUND,
-                detail="Video call request not found"
-            )
-        
-        video_call = response.data
-        
-        # Verify user has access
-        if video_call["care_recipient_id"] != current_user["id"] and video_call["caregiver_id"] != current_user["id"]:
-            raise HTTPException(
-                status_code=status.HTTP_403_FORBIDDEN,
-                detail="Access denied"
-            )
-        
-        # Determine which party is accepting
-        is_care_recipient = video_call["care_recipient_id"] == current_user["id"]
-        is_caregiver = video_call["caregiver_id"] == current_user["id"]
-        
-        update_data = {}
-        if is_care_recipient:
-            update_data["care_recipient_accepted"] = accept_data.accept
-        if is_caregiver:
-            update_data["caregiver_accepted"] = accept_data.accept
-        
-        if not accept_data.accept:
-            # If declined, update status
-            update_data["status"] = "declined"
-        else:
-            # If accepted, check if both parties will have accepted after this update
-            # Calculate what the values will be after the update
-            care_recipient_accepted_after = update_data.get("care_recipient_accepted") if is_care_recipient else video_call.get("care_recipient_accepted", False)
-            caregiver_accepted_after = update_data.get("caregiver_accepted") if is_caregiver else video_call.get("caregiver_accepted", False)
-            
-            # If we're not updating a field, use the existing value
-            if "care_recipient_accepted" not in update_data:
-                care_recipient_accepted_after = video_call.get("care_recipient_accepted", False)
-            if "caregiver_accepted" not in update_data:
-                caregiver_accepted_after = video_call.get("caregiver_accepted", False)
-            
-            print(f"   After update - CR accepted: {care_recipient_accepted_after}, CG accepted: {caregiver_accepted_after}", flush=True)
-            
-            if care_recipient_accepted_after and caregiver_accepted_after:
-                update_data["status"] = "accepted"
-                print(f"   Both parties accepted - setting status to 'accepted'", flush=True)
-            else:
-                # Keep status as "pending" if only one party has accepted
-                # Don't change status if it's already pending
-                if video_call.get("status") != "pending":
-                    update_data["status"] = "pending"
-                print(f"   Only one party accepted - keeping status as 'pending'", flush=True)
-        
-        # Update video call request - use supabase_admin to bypass RLS
-        try:
-            update_response = supabase_admin.table("video_call_requests").update(update_data).eq("id", video_call_id).execute()
-        except Exception as update_error:
-            # Fallback to regular supabase if admin fails
-            update_response = supabase.table("video_call_requests").update(update_data).eq("id", video_call_id).execute()
+            rpc_response = supabase_admin.rpc("accept_video_call", {
+                "p_video_call_id": video_call_id,
+                "p_user_id": current_user["id"],
+                "p_accept": accept_data.accept
+            }).execute()
+        except Exception as rpc_error:
+            error_msg = str(rpc_error)
+            if "video_call_not_found" in error_msg or "invalid input syntax for type uuid" in error_msg:
+                raise HTTPException(
+                    status_code=status.HTTP_404_NOT_FOUND,
+                    detail="Video call request not found"
+                )
+            if "access_denied" in error_msg:
+                raise HTTPException(
+                    status_code=status.HTTP_403_FORBIDDEN,
+                    detail="Access denied"
+                )
+            if "video_call_not_pending" in error_msg:
+                raise HTTPException(
+                    status_code=status.HTTP_409_CONFLICT,
+                    detail="Video call request is no longer pending"
+                )
+            if is_overlap_error(rpc_error):
+                raise HTTPException(
+                    status_code=status.HTTP_409_CONFLICT,
+                    detail="Caregiver already has a booking at the scheduled call time"
+                )
+            raise
         
-        if not update_response.data:
+        transition = rpc_response.data
+        if not transition or not transition.get("video_call"):
             raise HTTPException(
                 status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
                 detail="Failed to update video call request"
             )
         
-        updated_call = update_response.data[0]
-        print(f"[INFO] Video call {video_call_id} updated. Status: {updated_call.get('status')}, CR accepted: {updated_call.get('care_recipient_accepted')}, CG accepted: {updated_call.get('caregiver_accepted')}", flush=True)
-        
-        # If caregiver accepts, create booking automatically (whether or not care_recipient has accepted)
-        # This ensures a booking is created as soon as caregiver accepts
-        chat_session_id = None
-        booking_id = None
-        
-        # Check if caregiver just accepted
-        caregiver_just_accepted = is_caregiver and accept_data.accept and not video_call.get("caregiver_accepted", False)
-        
-        # Check if care recipient just accepted and caregiver already accepted (booking might not exist yet)
-        care_recipient_just_accepted = is_care_recipient and accept_data.accept and not video_call.get("care_recipient_accepted", False)
-        caregiver_already_accepted = video_call.get("caregiver_accepted", False)
-        
-        # Check if both parties have accepted (after update)
-        both_accepted = updated_call.get("care_recipient_accepted", False) and updated_call.get("caregiver_accepted", False)
-        
-        # Check if status just became "accepted" (this is the key trigger per user requirement)
-        status_just_became_accepted = updated_call.get("status") == "accepted" and video_call.get("status") != "accepted"
-        
-        print(f"[INFO] Booking creation check:", flush=True)
-        print(f"[INFO]   is_caregiver: {is_caregiver}, is_care_recipient: {is_care_recipient}, accept_data.accept: {accept_data.accept}", flush=True)
-        print(f"[INFO]   video_call.caregiver_accepted: {video_call.get('caregiver_accepted', False)}, video_call.care_recipient_accepted: {video_call.get('care_recipient_accepted', False)}", flush=True)
-        print(f"[INFO]   video_call.status (before): {video_call.get('status')}, updated_call.status (after): {updated_call.get('status')}", flush=True)
-        print(f"[INFO]   caregiver_just_accepted: {caregiver_just_accepted}, care_recipient_just_accepted: {care_recipient_just_accepted}, caregiver_already_accepted: {caregiver_already_accepted}, both_accepted: {both_accepted}, status_just_became_accepted: {status_just_became_accepted}", flush=True)
-        
-        # Create booking when:
-        # 1. Caregiver accepts (even if care_recipient hasn't accepted yet) - PRIMARY TRIGGER
-        # 2. Care recipient accepts and caregiver already accepted (booking might not exist yet)
-        # 3. Status transitions to "accepted" (per user requirement: "when a Video Call request transitions to the status Accepted")
-        # 4. Both parties have accepted
-        # But check if booking already exists to avoid duplicates
-        should_create_booking = caregiver_just_accepted or (care_recipient_just_accepted and caregiver_already_accepted) or status_just_became_accepted or both_accepted
-        
-        if should_create_booking:
-            print(f"[INFO] Caregiver accepted video call {video_call_id}", flush=True)
-            print(f"[INFO] Checking for existing booking and creating if needed...", flush=True)
-            
-            # Check if booking already exists for this video call
-            existing_booking_check = supabase_admin.table("bookings").select("id").eq("video_call_request_id", video_call_id).execute()
-            
-            if existing_booking_check.data and len(existing_booking_check.data) > 0:
-                booking_id = existing_booking_check.data[0]["id"]
-                print(f"[INFO] Booking already exists with ID: {booking_id}", flush=True)
-            else:
-                # Auto-create booking for payment when caregiver accepts
-                try:
-                    # Get service type from video call request or use default
-                    # We'll use the scheduled_time from video call as the booking date
-                    booking_dict = {
-                        "care_recipient_id": video_call["care_recipient_id"],
-                        "caregiver_id": video_call["caregiver_id"],
-                        "video_call_request_id": video_call_id,
-                        "service_type": "video_call_session",  # Use video_call_session type
-                        "scheduled_date": video_call["scheduled_time"],
-                        "duration_hours": video_call.get("duration_seconds", 900) / 3600,  # Convert seconds to hours
-                        "status": "pending",  # Pending payment
-                    }
-                    
-                    print(f"[INFO] Creating booking with data: {booking_dict}", flush=True)
-                    booking_response = supabase_admin.table("bookings").insert(booking_dict).execute()
-                    if booking_response.data:
-                        booking_id = booking_response.data[0]["id"]
-                        print(f"[INFO] Booking created with ID: {booking_id}", flush=True)
-                        
-                        # Mark caregiver as unavailable
-                        try:
-                            profile_check = supabase_admin.table("caregiver_profile").select("id").eq("user_id", video_call["caregiver_id"]).execute()
-                            if profile_check.data and len(profile_check.data) > 0:
-                                supabase_admin.table("caregiver_profile").update({
-                                    "availability_status": "unavailable"
-                                }).eq("user_id", video_call["caregiver_id"]).execute()
-                            else:
-                                supabase_admin.table("caregiver_profile").insert({
-                                    "user_id": video_call["caregiver_id"],
-                                    "availability_status": "unavailable"
-                                }).execute()
-                        except Exception as avail_error:
-                            print(f"[WARN] Error updating caregiver availability: {avail_error}", flush=True)
-                        
-                        # Send booking notification to caregiver
-                        try:
-                            care_recipient_response = supabase_admin.table("users").select("full_name").eq("id", video_call["care_recipient_id"]).single().execute()
-                            care_recipient_name = care_recipient_response.data.get("full_name", "A care recipient") if care_recipient_response.data else "A care recipient"
-                            
-                            await notify_booking_created(
-                                caregiver_id=str(video_call["caregiver_id"]),
-                                care_recipient_name=care_recipient_name,
-                                booking_id=booking_id
-                            )
-                            print(f"[INFO] Booking notification sent to caregiver", flush=True)
-                        except Exception as notif_error:
-                            print(f"[WARN] Error sending booking notification: {notif_error}", flush=True)
-                        
-                        # Also notify care recipient that booking was created (pending payment)
-                        try:
-                            caregiver_response = supabase_admin.table("users").select("full_name").eq("id", video_call["caregiver_id"]).single().execute()
-                            caregiver_name = caregiver_response.data.get("full_name", "A caregiver") if caregiver_response.data else "A caregiver"
-                            
-                            await notify_booking_status_change(
-                                user_id=video_call["care_recipient_id"],
-                                booking_id=booking_id,
-                                status="pending",
-                                other_party_name=caregiver_name
-                            )
-                            print(f"[INFO] Booking created notification sent to care recipient", flush=True)
-                        except Exception as notif_error:
-                            print(f"[WARN] Error sending booking notification to care recipient: {notif_error}", flush=True)
-                except Exception as booking_error:
-                    import traceback
-                    print(f"[ERROR] Error creating booking: {booking_error}", flush=True)
-                    traceback.print_exc()
-                    # Don't fail the entire request if booking creation fails
-                    # Log it but continue - the video call acceptance should still succeed
-                    print(f"[WARN] Video call accepted but booking creation failed. User may need to create booking manually.", flush=True)
-            
-            # Create chat session (initially disabled, will be enabled after payment)
-            chat_response = supabase_admin.table("chat_sessions").select("id").eq("care_recipient_id", video_call["care_recipient_id"]).eq("caregiver_id", video_call["caregiver_id"]).execute()
-            
-            if not chat_response.data:
-                new_chat = supabase_admin.table("chat_sessions").insert({
-                    "care_recipient_id": video_call["care_recipient_id"],
-                    "caregiver_id": video_call["caregiver_id"],
-                    "video_call_request_id": video_call_id,
-                    "is_enabled": False,  # Will be enabled after payment
-                    "care_recipient_accepted": False,
-                    "caregiver_accepted": False
-                }).execute()
-                if new_chat.data:
-                    chat_session_id = new_chat.data[0]["id"]
-            else:
-                chat_session_id = chat_response.data[0]["id"]
+        video_call = transition["video_call"]
+        booking_id = transition.get("booking_id")
+        chat_session_id = transition.get("chat_session_id")
+        is_care_recipient = transition.get("is_care_recipient", False)
+        care_recipient_id = video_call["care_recipient_id"]
+        caregiver_id = video_call["caregiver_id"]
+        care_recipient_name = transition.get("care_recipient_name") or "Care recipient"
+        caregiver_name = transition.get("caregiver_name") or "Caregiver"
+        print(f"[INFO] Video call {video_call_id} updated. Status: {video_call.get('status')}, CR accepted: {video_call.get('care_recipient_accepted')}, CG accepted: {video_call.get('caregiver_accepted')}, booking: {booking_id} (created: {transition.get('booking_created')}), chat: {chat_session_id}", flush=True)
         
         # Include chat_session_id and booking_id in response if created
-        result = update_response.data[0].copy()
+        result = video_call.copy()
         if chat_session_id:
             result["chat_session_id"] = chat_session_id
         if booking_id:
             result["booking_id"] = booking_id
         
+        invalidate_users(care_recipient_id, caregiver_id)
+        if transition.get("booking_created"):
+            invalidate_caregiver(caregiver_id)
+        if video_call.get("status") == "accepted":
+            transition_scheduler.schedule_video_call_end(video_call)
+        
         # Send notifications
+        if transition.get("booking_created"):
+            background_tasks.add_task(
+                notify_booking_created,
+                caregiver_id=str(caregiver_id),
+                care_recipient_name=care_recipient_name,
+                booking_id=booking_id
+            )
+        
         if accept_data.accept:
-            # Get user names for notifications
-            care_recipient_response = supabase_admin.table("users").select("full_name").eq("id", video_call["care_recipient_id"]).single().execute()
-            caregiver_response = supabase_admin.table("users").select("full_name").eq("id", video_call["caregiver_id"]).single().execute()
-            
-            care_recipient_name = care_recipient_response.data.get("full_name", "Care recipient") if care_recipient_response.data else "Care recipient"
-            caregiver_name = caregiver_response.data.get("full_name", "Caregiver") if caregiver_response.data else "Caregiver"
-            
-            # Notify the other party
             # Note: We do NOT notify when care recipient accepts - only when caregiver accepts/declines
             if not is_care_recipient:
                 # Caregiver accepted, notify care recipient
-                try:
-                    await notify_video_call_accepted(
-                        user_id=video_call["care_recipient_id"],
-                        other_party_name=caregiver_name,
-                        video_call_id=video_call_id,
-                        is_caregiver=True
-                    )
-                    print(f"[INFO] Notification sent to care recipient about caregiver acceptance", flush=True)
-                    
-                    # If booking was created, also send a booking notification to care recipient
-                    if booking_id:
-                        try:
-                            await notify_booking_status_change(
-                                user_id=video_call["care_recipient_id"],
-                                booking_id=booking_id,
-                                status="pending",
-                                other_party_name=caregiver_name
-                            )
-                            print(f"[INFO] Booking created notification sent to care recipient", flush=True)
-                        except Exception as booking_notif_error:
-                            print(f"[WARN] Error sending booking notification to care recipient: {booking_notif_error}", flush=True)
-                except Exception as notif_error:
-                    print(f"[WARN] Error sending notification to care recipient: {notif_error}", flush=True)
-        
-        # If declined, notify the other party about the decline
-        if not accept_data.accept:
-            # Get user names for notifications
-            care_recipient_response = supabase_admin.table("users").select("full_name").eq("id", video_call["care_recipient_id"]).single().execute()
-            caregiver_response = supabase_admin.table("users").select("full_name").eq("id", video_call["caregiver_id"]).single().execute()
-
-            care_recipient_name = care_recipient_response.data.get("full_name", "Care recipient") if care_recipient_response.data else "Care recipient"
-            caregiver_name = caregiver_response.data.get("full_name", "Caregiver") if caregiver_response.data else "Caregiver"
-
+                background_tasks.add_task(
+                    notify_video_call_accepted,
+                    user_id=care_recipient_id,
+                    other_party_name=caregiver_name,
+                    video_call_id=video_call_id,
+                    is_caregiver=True
+                )
+            # Let the care recipient know a booking is waiting for payment
+            if booking_id and (not is_care_recipient or transition.get("booking_created")):
+                background_tasks.add_task(
+                    notify_booking_status_change,
+                    user_id=care_recipient_id,
+                    booking_id=booking_id,
+                    status="pending",
+                    other_party_name=caregiver_name
+                )
+        else:
             # Notify the opposite party that the call was declined
             if is_care_recipient:
-                await notify_video_call_status_change(
-                    user_id=video_call["caregiver_id"],
+                background_tasks.add_task(
+                    notify_video_call_status_change,
+                    user_id=caregiver_id,
                     other_party_name=care_recipient_name,
                     video_call_id=video_call_id,
                     status="declined"
                 )
             else:
-                await notify_video_call_status_change(
-                    user_id=video_call["care_recipient_id"],
+                background_tasks.add_task(
+                    notify_video_call_status_change,
+                    user_id=care_recipient_id,
                     other_party_name=caregiver_name,
                     video_call_id=video_call_id,
                     status="declined"
                 )
-
+        
         print(f"[INFO] ===== ACCEPT VIDEO CALL REQUEST SUCCESSFUL =====", flush=True)
         return result
     
@@ -582,6 +432,7 @@ async def enable_chat_session(
             )
         
         updated_session = update_response.data[0]
+        invalidate_users(chat_session["care_recipient_id"], chat_session["caregiver_id"])
         
         # If chat is now enabled, notify both parties
         if updated_session.get("is_enabled") and accept_data.accept:
@@ -620,6 +471,7 @@ async def enable_chat_session(
 
 
 @router.post("", response_model=BookingResponse, status_code=status.HTTP_201_CREATED)
+@idempotent
 async def create_booking(
     booking_data: BookingCreate,
     current_user: dict = Depends(verify_care_recipient)
@@ -660,7 +512,15 @@ async def create_booking(
                 if chat_check.data:
                     booking_dict["chat_session_id"] = chat_check.data["id"]
         
-        response = supabase.table("bookings").insert(booking_dict).execute()
+        # Overlapping bookings for the caregiver are rejected by the
+        # bookings_no_caregiver_overlap exclusion constraint
+        try:
+            response = supabase.table("bookings").insert(booking_dict).execute()
+        except Exception as insert_error:
+            if booking_data.caregiver_id and is_overlap_error(insert_error):
+                start, end = booking_window(booking_data.scheduled_date, booking_data.duration_hours)
+                raise overlap_http_exception(str(booking_data.caregiver_id), start, end)
+            raise
         
         if not response.data:
             raise HTTPException(
@@ -669,6 +529,8 @@ async def create_booking(
             )
         
         booking = response.data[0]
+        invalidate_caregiver(booking.get("caregiver_id"))
+        invalidate_users(booking["care_recipient_id"], booking.get("caregiver_id"))
         
         # If caregiver is assigned, mark them as unavailable and notify them
         if booking.get("caregiver_id"):
@@ -758,6 +620,258 @@ async def create_booking(
         )
 
 
+@router.post("/bulk", response_model=List[BookingResponse], status_code=status.HTTP_201_CREATED)
+@idempotent
+async def create_bookings_bulk(
+    bulk_data: BookingBulkCreate,
+    background_tasks: BackgroundTasks,
+    current_user: dict = Depends(verify_care_recipient)
+):
+    """
+    Create several bookings at once (e.g. a week of shifts).
+    
+    All rows are validated up front and inserted with a single statement, so
+    either every booking is created or none is. Each caregiver is marked
+    unavailable once and receives one notification for all of their new
+    bookings.
+    """
+    try:
+        user_id = current_user.get("id") if isinstance(current_user, dict) else str(current_user.get("id", ""))
+        if not user_id:
+            raise HTTPException(
+                status_code=status.HTTP_401_UNAUTHORIZED,
+                detail="User ID not found in authentication token"
+            )
+        user_id = str(user_id)
+        
+        # Reject shifts that overlap each other before touching the database
+        windows_by_caregiver = {}
+        for booking_data in bulk_data.bookings:
+            if booking_data.caregiver_id:
+                windows_by_caregiver.setdefault(str(booking_data.caregiver_id), []).append(
+                    booking_window(booking_data.scheduled_date, booking_data.duration_hours)
+                )
+        for caregiver_id, windows in windows_by_caregiver.items():
+            windows.sort()
+            for (_, previous_end), (next_start, _) in zip(windows, windows[1:]):
+                if next_start < previous_end:
+                    raise HTTPException(
+                        status_code=status.HTTP_409_CONFLICT,
+                        detail=f"Bookings for caregiver {caregiver_id} overlap each other at {next_start.isoformat()}"
+                    )
+        
+        # Accepted video calls and enabled chats for every caregiver, one query each
+        caregiver_ids = list(windows_by_caregiver)
+        video_call_ids = {}
+        chat_session_ids = {}
+        if caregiver_ids:
+            video_calls = supabase.table("video_call_requests").select("id, caregiver_id").eq("care_recipient_id", user_id).in_("caregiver_id", caregiver_ids).eq("status", "accepted").order("created_at", desc=True).execute()
+            for video_call in video_calls.data or []:
+                video_call_ids.setdefault(str(video_call["caregiver_id"]), video_call["id"])
+            
+            chats = supabase.table("chat_sessions").select("id, caregiver_id").eq("care_recipient_id", user_id).in_("caregiver_id", caregiver_ids).eq("is_enabled", True).execute()
+            for chat in chats.data or []:
+                chat_session_ids[str(chat["caregiver_id"])] = chat["id"]
+        
+        rows = []
+        for booking_data in bulk_data.bookings:
+            booking_dict = booking_data.model_dump(mode="json", exclude_unset=True)
+            booking_dict["care_recipient_id"] = user_id
+            booking_dict["status"] = "pending"
+            caregiver_id = booking_dict.get("caregiver_id")
+            if caregiver_id and caregiver_id in video_call_ids:
+                booking_dict["video_call_request_id"] = video_call_ids[caregiver_id]
+                if caregiver_id in chat_session_ids:
+                    booking_dict["chat_session_id"] = chat_session_ids[caregiver_id]
+            rows.append(booking_dict)
+        
+        # PostgREST inserts every row in one statement, so the batch is atomic
+        try:
+            response = supabase.table("bookings").insert(rows).execute()
+        except Exception as insert_error:
+            if is_overlap_error(insert_error):
+                raise HTTPException(
+                    status_code=status.HTTP_409_CONFLICT,
+                    detail="One or more bookings overlap an existing booking of the caregiver"
+                )
+            raise
+        
+        if not response.data:
+            raise HTTPException(
+                status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
+                detail="Failed to create bookings"
+            )
+        
+        bookings = response.data
+        invalidate_users(user_id, *{booking.get("caregiver_id") for booking in bookings})
+        booking_ids_by_caregiver = {}
+        for booking in bookings:
+            if booking.get("caregiver_id"):
+                booking_ids_by_caregiver.setdefault(str(booking["caregiver_id"]), []).append(str(booking["id"]))
+        
+        if booking_ids_by_caregiver:
+            # Mark every assigned caregiver unavailable with one upsert
+            try:
+                supabase_admin.table("caregiver_profile").upsert([
+                    {"user_id": caregiver_id, "availability_status": "unavailable"}
+                    for caregiver_id in booking_ids_by_caregiver
+                ], on_conflict="user_id").execute()
+            except Exception as avail_error:
+                print(f"[WARN] Error updating caregiver availability: {avail_error}", flush=True)
+            
+            care_recipient_name = "A care recipient"
+            try:
+                care_recipient_response = supabase_admin.table("users").select("full_name").eq("id", user_id).single().execute()
+                if care_recipient_response.data:
+                    care_recipient_name = care_recipient_response.data.get("full_name") or care_recipient_name
+            except Exception as name_error:
+                print(f"[WARN] Error getting care recipient name: {name_error}", flush=True)
+            
+            for caregiver_id, booking_ids in booking_ids_by_caregiver.items():
+                invalidate_caregiver(caregiver_id)
+                background_tasks.add_task(
+                    notify_bookings_created_bulk,
+                    caregiver_id=caregiver_id,
+                    care_recipient_name=care_recipient_name,
+                    booking_ids=booking_ids
+                )
+        
+        print(f"[INFO] Created {len(bookings)} bookings in bulk for {len(booking_ids_by_caregiver)} caregiver(s)", flush=True)
+        return bookings
+    
+    except HTTPException:
+        raise
+    except Exception as e:
+        raise HTTPException(
+            status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
+            detail=str(e)
+        )
+
+
+@router.patch("/bulk-status", response_model=List[BookingResponse])
+async def update_bookings_status_bulk(
+    bulk_data: BookingBulkStatusUpdate,
+    background_tasks: BackgroundTasks,
+    current_user: dict = Depends(get_current_user)
+):
+    """
+    Set the same status on several bookings with a single update.
+    
+    The caller must be a party to every booking. Caregiver availability is
+    updated once per caregiver and each counterpart gets one notification.
+    """
+    try:
+        user_id = str(current_user["id"])
+        booking_ids = list(dict.fromkeys(str(booking_id) for booking_id in bulk_data.booking_ids))
+        new_status = bulk_data.status
+        
+        existing = supabase_admin.table("bookings").select("id, care_recipient_id, caregiver_id").in_("id", booking_ids).execute()
+        found = {str(booking["id"]): booking for booking in existing.data or []}
+        
+        missing = [booking_id for booking_id in booking_ids if booking_id not in found]
+        if missing:
+            raise HTTPException(
+                status_code=status.HTTP_404_NOT_FOUND,
+                detail=f"Bookings not found: {', '.join(missing)}"
+            )
+        
+        forbidden = [
+            booking_id for booking_id, booking in found.items()
+            if booking["care_recipient_id"] != user_id and booking.get("caregiver_id") != user_id
+        ]
+        if forbidden:
+            raise HTTPException(
+                status_code=status.HTTP_403_FORBIDDEN,
+                detail=f"Access denied for bookings: {', '.join(forbidden)}"
+            )
+        
+        update_data = {"status": new_status}
+        if new_status == "accepted":
+            update_data["accepted_at"] = datetime.utcnow().isoformat()
+        elif new_status == "completed":
+            update_data["completed_at"] = datetime.utcnow().isoformat()
+        
+        try:
+            response = supabase_admin.table("bookings").update(update_data).in_("id", booking_ids).execute()
+        except Exception as update_error:
+            if is_overlap_error(update_error):
+                raise HTTPException(
+                    status_code=status.HTTP_409_CONFLICT,
+                    detail="Reactivating these bookings would double-book a caregiver"
+                )
+            raise
+        
+        updated_bookings = response.data or []
+        caregiver_ids = list({str(b["caregiver_id"]) for b in updated_bookings if b.get("caregiver_id")})
+        
+        for booking_id in booking_ids:
+            invalidate_booking(booking_id)
+        for caregiver_id in caregiver_ids:
+            invalidate_caregiver(caregiver_id)
+        invalidate_users(*{b["care_recipient_id"] for b in updated_bookings}, *caregiver_ids)
+        
+        if new_status in ("accepted", "in_progress"):
+            transition_scheduler.schedule_bookings(updated_bookings)
+        else:
+            transition_scheduler.cancel_bookings(booking_ids)
+        
+        # Caregiver availability, once per caregiver
+        if caregiver_ids:
+            try:
+                if new_status in ("pending", "accepted", "in_progress"):
+                    supabase_admin.table("caregiver_profile").upsert([
+                        {"user_id": caregiver_id, "availability_status": "unavailable"}
+                        for caregiver_id in caregiver_ids
+                    ], on_conflict="user_id").execute()
+                else:
+                    # Caregivers with no remaining active bookings or calls become available
+                    still_booked = supabase_admin.table("bookings").select("caregiver_id").in_("caregiver_id", caregiver_ids).in_("status", ACTIVE_BOOKING_STATUSES).execute()
+                    in_calls = supabase_admin.table("video_call_requests").select("caregiver_id").in_("caregiver_id", caregiver_ids).eq("status", "accepted").is_("completed_at", "null").execute()
+                    busy = {str(row["caregiver_id"]) for row in (still_booked.data or []) + (in_calls.data or [])}
+                    free = [caregiver_id for caregiver_id in caregiver_ids if caregiver_id not in busy]
+                    if free:
+                        supabase_admin.table("caregiver_profile").update({
+                            "availability_status": "available"
+                        }).in_("user_id", free).execute()
+            except Exception as avail_error:
+                print(f"[WARN] Error updating caregiver availability: {avail_error}", flush=True)
+        
+        # One notification per counterpart
+        booking_ids_by_counterpart = {}
+        for booking in updated_bookings:
+            counterpart = booking.get("caregiver_id") if booking["care_recipient_id"] == user_id else booking["care_recipient_id"]
+            if counterpart and str(counterpart) != user_id:
+                booking_ids_by_counterpart.setdefault(str(counterpart), []).append(str(booking["id"]))
+        
+        if booking_ids_by_counterpart:
+            actor_name = "Someone"
+            try:
+                actor_response = supabase_admin.table("users").select("full_name").eq("id", user_id).single().execute()
+                if actor_response.data:
+                    actor_name = actor_response.data.get("full_name") or actor_name
+            except Exception as name_error:
+                print(f"[WARN] Error getting user name: {name_error}", flush=True)
+            
+            for counterpart_id, counterpart_booking_ids in booking_ids_by_counterpart.items():
+                background_tasks.add_task(
+                    notify_bookings_status_change_bulk,
+                    user_id=counterpart_id,
+                    booking_ids=counterpart_booking_ids,
+                    status=new_status,
+                    other_party_name=actor_name
+                )
+        
+        return updated_bookings
+    
+    except HTTPException:
+        raise
+    except Exception as e:
+        raise HTTPException(
+            status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
+            detail=str(e)
+        )
+
+
 @router.get("/{booking_id}", response_model=BookingResponse)
 async def get_booking(
     booking_id: str,
@@ -795,122 +909,17 @@ async def get_booking(
 @router.post("/{booking_id}/complete-payment")
 async def complete_payment(
     booking_id: str,
+    background_tasks: BackgroundTasks,
     current_user: dict = Depends(get_current_user)
 ):
     """Complete payment for a booking and enable chat session"""
     try:
-        # Get booking to verify access
-        booking_response = supabase_admin.table("bookings").select("*").eq("id", booking_id).single().execute()
-        
-        if not booking_response.data:
-            raise HTTPException(
-                status_code=status.HTTP_404_NOT_FOUND,
-                detail="Booking not found"
-            )
-        
-        booking = booking_response.data
-        
-        # Verify user is the care recipient
-        if booking["care_recipient_id"] != current_user["id"]:
-            raise HTTPException(
-                status_code=status.HTTP_403_FORBIDDEN,
-                detail="Only care recipient can complete payment"
-            )
-        
-        # Update booking status to accepted (payment completed)
-        update_data = {
-            "status": "accepted",
-            "accepted_at": datetime.utcnow().isoformat()
-        }
-        
-        booking_update_response = supabase_admin.table("bookings").update(update_data).eq("id", booking_id).execute()
-        
-        if not booking_update_response.data:
-            raise HTTPException(
-                status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
-                detail="Failed to update booking"
-            )
-        
-        updated_booking = booking_update_response.data[0]
+        # Ownership check, booking update, caregiver availability and chat
+        # session all happen in one idempotent database call
+        result = mark_booking_paid(booking_id, care_recipient_id=current_user["id"])
+        schedule_booking_paid_notifications(background_tasks, result)
         
-        # Enable chat session and mark caregiver as unavailable if caregiver is assigned
-        if updated_booking.get("caregiver_id"):
-            caregiver_id_str = str(updated_booking["caregiver_id"])
-            
-            # Mark caregiver as unavailable (they are now assigned to this booking)
-            # Create profile if it doesn't exist
-            try:
-                profile_check = supabase_admin.table("caregiver_profile").select("id").eq("user_id", caregiver_id_str).execute()
-                if profile_check.data and len(profile_check.data) > 0:
-                    # Profile exists, update availability
-                    supabase_admin.table("caregiver_profile").update({
-                        "availability_status": "unavailable"
-                    }).eq("user_id", caregiver_id_str).execute()
-                else:
-                    # Profile doesn't exist, create it with unavailable status
-                    supabase_admin.table("caregiver_profile").insert({
-                        "user_id": caregiver_id_str,
-                        "availability_status": "unavailable"
-                    }).execute()
-            except Exception as avail_error:
-                import traceback
-                print(f"Error updating caregiver availability: {avail_error}")
-                traceback.print_exc()
-            
-            # Check if chat session exists
-            chat_check = supabase_admin.table("chat_sessions").select("*").eq("care_recipient_id", booking["care_recipient_id"]).eq("caregiver_id", updated_booking["caregiver_id"]).execute()
-            
-            chat_session_id = None
-            if chat_check.data and len(chat_check.data) > 0:
-                # Update existing chat session
-                chat_session_id = chat_check.data[0]["id"]
-                supabase_admin.table("chat_sessions").update({
-                    "is_enabled": True,
-                    "care_recipient_accepted": True,
-                    "caregiver_accepted": True,
-                    "enabled_at": datetime.utcnow().isoformat()
-                }).eq("id", chat_session_id).execute()
-            else:
-                # Create new chat session
-                new_chat = supabase_admin.table("chat_sessions").insert({
-                    "care_recipient_id": booking["care_recipient_id"],
-                    "caregiver_id": updated_booking["caregiver_id"],
-                    "is_enabled": True,
-                    "care_recipient_accepted": True,
-                    "caregiver_accepted": True,
-                    "enabled_at": datetime.utcnow().isoformat()
-                }).execute()
-                if new_chat.data:
-                    chat_session_id = new_chat.data[0]["id"]
-            
-            # Update booking with chat_session_id if not already set
-            if chat_session_id and not updated_booking.get("chat_session_id"):
-                supabase_admin.table("bookings").update({
-                    "chat_session_id": chat_session_id
-                }).eq("id", booking_id).execute()
-            
-            # Notify both parties that chat is enabled
-            try:
-                care_recipient_response = supabase_admin.table("users").select("full_name").eq("id", booking["care_recipient_id"]).single().execute()
-                caregiver_response = supabase_admin.table("users").select("full_name").eq("id", updated_booking["caregiver_id"]).single().execute()
-                
-                care_recipient_name = care_recipient_response.data.get("full_name", "Care recipient") if care_recipient_response.data else "Care recipient"
-                caregiver_name = caregiver_response.data.get("full_name", "Caregiver") if caregiver_response.data else "Caregiver"
-                
-                await notify_chat_enabled(
-                    user_id=booking["care_recipient_id"],
-                    other_party_name=caregiver_name,
-                    chat_session_id=chat_session_id
-                )
-                await notify_chat_enabled(
-                    user_id=updated_booking["caregiver_id"],
-                    other_party_name=care_recipient_name,
-                    chat_session_id=chat_session_id
-                )
-            except Exception as notif_error:
-                print(f"Error sending chat enabled notification: {notif_error}")
-        
-        return {"message": "Payment completed and chat enabled", "booking": updated_booking}
+        return {"message": "Payment completed and chat enabled", "booking": result["booking"]}
     
     except HTTPException:
         raise
@@ -961,6 +970,9 @@ async def complete_booking(
         
         response = supabase_admin.table("bookings").update(update_data).eq("id", booking_id).execute()
         print(f"[INFO] Booking status updated successfully", flush=True)
+        invalidate_caregiver(booking.get("caregiver_id"))
+        invalidate_users(booking["care_recipient_id"], booking.get("caregiver_id"))
+        transition_scheduler.cancel_booking(booking_id)
         
         if not response.data:
             raise HTTPException(
@@ -1114,7 +1126,20 @@ async def update_booking(
         if "status" in update_data and update_data["status"] == "accepted":
             update_data["accepted_at"] = datetime.utcnow().isoformat()
         
-        response = supabase.table("bookings").update(update_data).eq("id", booking_id).execute()
+        if isinstance(update_data.get("scheduled_date"), datetime):
+            update_data["scheduled_date"] = update_data["scheduled_date"].isoformat()
+        
+        try:
+            response = supabase.table("bookings").update(update_data).eq("id", booking_id).execute()
+        except Exception as update_error:
+            if booking.get("caregiver_id") and is_overlap_error(update_error):
+                scheduled_date = booking_update.scheduled_date or datetime.fromisoformat(
+                    str(booking["scheduled_date"]).replace("Z", "+00:00")
+                )
+                duration_hours = update_data.get("duration_hours", booking.get("duration_hours"))
+                start, end = booking_window(scheduled_date, duration_hours)
+                raise overlap_http_exception(booking["caregiver_id"], start, end, exclude_booking_id=booking_id)
+            raise
         
         if not response.data:
             raise HTTPException(
@@ -1122,7 +1147,17 @@ async def update_booking(
                 detail="Failed to update booking"
             )
         
-        return response.data[0]
+        invalidate_booking(booking_id)
+        invalidate_caregiver(booking.get("caregiver_id"))
+        invalidate_users(booking["care_recipient_id"], booking.get("caregiver_id"))
+        
+        updated_booking = response.data[0]
+        if updated_booking.get("status") in ("accepted", "in_progress"):
+            transition_scheduler.schedule_booking(updated_booking)
+        else:
+            transition_scheduler.cancel_booking(booking_id)
+        
+        return updated_booking
     
     except HTTPException:
         raise
@@ -1132,3 +1167,104 @@ async def update_booking(
             detail=str(e)
         )
 
+
+def _get_recurring_booking_for_party(booking_id: str, user_id: str) -> dict:
+    """Load a recurring booking the user is a party to, or raise 404/403/400."""
+    booking_response = supabase_admin.table("bookings").select("*").eq("id", booking_id).execute()
+    
+    if not booking_response.data:
+        raise HTTPException(
+            status_code=status.HTTP_404_NOT_FOUND,
+            detail="Booking not found"
+        )
+    
+    booking = booking_response.data[0]
+    
+    if booking["care_recipient_id"] != user_id and booking.get("caregiver_id") != user_id:
+        raise HTTPException(
+            status_code=status.HTTP_403_FORBIDDEN,
+            detail="Access denied"
+        )
+    
+    if not booking.get("is_recurring"):
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail="Booking is not recurring"
+        )
+    
+    return booking
+
+
+@router.put("/{booking_id}/occurrences")
+async def update_booking_occurrence(
+    booking_id: str,
+    exception_data: OccurrenceExceptionUpdate,
+    current_user: dict = Depends(get_current_user)
+):
+    """Cancel or reschedule a single occurrence of a recurring booking"""
+    try:
+        booking = _get_recurring_booking_for_party(booking_id, current_user["id"])
+        
+        if not exception_data.is_cancelled and exception_data.scheduled_date is None and exception_data.duration_hours is None:
+            raise HTTPException(
+                status_code=status.HTTP_400_BAD_REQUEST,
+                detail="Set is_cancelled, scheduled_date or duration_hours"
+            )
+        
+        # The occurrence must exist in the series
+        occurrence_start = parse_datetime(exception_data.occurrence_start)
+        probe_end = occurrence_start + timedelta(seconds=1)
+        if occurrence_start not in iter_occurrence_starts(booking, occurrence_start, probe_end):
+            raise HTTPException(
+                status_code=status.HTTP_400_BAD_REQUEST,
+                detail="No occurrence of this booking starts at occurrence_start"
+            )
+        
+        response = supabase_admin.table("booking_occurrence_exceptions").upsert({
+            "booking_id": booking_id,
+            "occurrence_start": occurrence_start.isoformat(),
+            "is_cancelled": exception_data.is_cancelled,
+            "scheduled_date": parse_datetime(exception_data.scheduled_date).isoformat() if exception_data.scheduled_date else None,
+            "duration_hours": exception_data.duration_hours
+        }, on_conflict="booking_id,occurrence_start").execute()
+        
+        invalidate_booking(booking_id)
+        invalidate_caregiver(booking.get("caregiver_id"))
+        invalidate_users(booking["care_recipient_id"], booking.get("caregiver_id"))
+        
+        return response.data[0] if response.data else {}
+    
+    except HTTPException:
+        raise
+    except Exception as e:
+        raise HTTPException(
+            status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
+            detail=str(e)
+        )
+
+
+@router.delete("/{booking_id}/occurrences")
+async def restore_booking_occurrence(
+    booking_id: str,
+    occurrence_start: datetime,
+    current_user: dict = Depends(get_current_user)
+):
+    """Remove an occurrence exception so the occurrence follows the pattern again"""
+    try:
+        booking = _get_recurring_booking_for_party(booking_id, current_user["id"])
+        
+        supabase_admin.table("booking_occurrence_exceptions").delete().eq("booking_id", booking_id).eq("occurrence_start", parse_datetime(occurrence_start).isoformat()).execute()
+        
+        invalidate_booking(booking_id)
+        invalidate_caregiver(booking.get("caregiver_id"))
+        invalidate_users(booking["care_recipient_id"], booking.get("caregiver_id"))
+        
+        return {"message": "Occurrence restored"}
+    
+    except HTTPException:
+        raise
+    except Exception as e:
+        raise HTTPException(
+            status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
+            detail=str(e)
+        )
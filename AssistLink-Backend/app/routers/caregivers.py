@@ -1,11 +1,21 @@
-from fastapi import APIRouter, HTTPException, status, Depends, Query
+from fastapi import APIRouter, HTTPException, status, Depends, Query, Header, Response
+from datetime import date, datetime
 from typing import Optional, List
 from app.schemas import CaregiverProfileCreate, CaregiverProfileUpdate, CaregiverProfileResponse
 from app.database import supabase
 from app.dependencies import get_current_user, get_optional_user, verify_caregiver
+from app.config import settings
+from app.services.booking_conflicts import booking_window, find_conflicts
+from app.services.freebusy import SLOT_MINUTES, SLOTS_PER_DAY, get_freebusy, invalidate_caregiver
+from app.services.etag import etag_matches, not_modified, weak_etag
+from app.services.projections import parse_fields, select_list, trim_rows
 
 router = APIRouter()
 
+CAREGIVER_EMBEDS = {"caregiver_profile": ("caregiver_profile", "caregiver_profile_public")}
+# Columns the list filters read, fetched even when ?fields= leaves them out
+CAREGIVER_FILTER_COLUMNS = ("id", "full_name", "caregiver_profile")
+
 
 @router.post("/profile", response_model=CaregiverProfileResponse, status_code=status.HTTP_201_CREATED)
 async def create_caregiver_profile(
@@ -41,6 +51,8 @@ async def create_caregiver_profile(
                 detail="Failed to create/update caregiver profile"
             )
         
+        invalidate_caregiver(user_id)
+        
         return response.data[0]
     
     except HTTPException:
@@ -107,6 +119,9 @@ async def update_caregiver_profile(
                 detail="Failed to update caregiver profile. No data returned."
             )
         
+        if "availability_schedule" in update_data:
+            invalidate_caregiver(user_id)
+        
         return response.data[0]
     except HTTPException:
         raise
@@ -181,6 +196,7 @@ async def list_caregivers(
     skills: Optional[str] = Query(None, description="Comma-separated list of skills"),
     limit: int = Query(20, ge=1, le=100),
     offset: int = Query(0, ge=0),
+    fields: Optional[str] = Query(None, description="Comma-separated subset of columns to return"),
     current_user: Optional[dict] = Depends(get_optional_user)
 ):
     """List available caregivers with filters"""
@@ -189,8 +205,12 @@ async def list_caregivers(
         # This is safe because we're only reading public caregiver information
         from app.database import supabase_admin
 
+        field_list = parse_fields(fields, "caregiver_list", CAREGIVER_EMBEDS)
+
         # Get all active caregivers with their profiles
-        query = supabase_admin.table("users").select("*, caregiver_profile(*)").eq("role", "caregiver").eq("is_active", True)
+        query = supabase_admin.table("users").select(
+            select_list("caregiver_list", CAREGIVER_EMBEDS, field_list, required=CAREGIVER_FILTER_COLUMNS)
+        ).eq("role", "caregiver").eq("is_active", True)
 
         # Execute query to get all caregivers first
         response = query.execute()
@@ -383,8 +403,10 @@ async def list_caregivers(
         # Apply pagination
         caregivers = caregivers[offset : offset + limit]
 
-        return caregivers
+        return trim_rows(caregivers, field_list, CAREGIVER_FILTER_COLUMNS)
 
+    except HTTPException:
+        raise
     except Exception as e:
         # Log full traceback for easier debugging (ASCII-only)
         import traceback
@@ -396,22 +418,41 @@ async def list_caregivers(
         )
 
 
+def _caregiver_etag(caregiver: dict) -> str:
+    profile = caregiver.get("caregiver_profile")
+    if isinstance(profile, list):
+        profile = profile[0] if profile else None
+    return weak_etag(caregiver.get("id"), caregiver.get("updated_at"), (profile or {}).get("updated_at"))
+
+
 @router.get("/{caregiver_id}", response_model=dict)
 async def get_caregiver(
     caregiver_id: str,
+    response: Response,
+    if_none_match: Optional[str] = Header(None),
     current_user: Optional[dict] = Depends(get_optional_user)
 ):
-    """Get caregiver details by ID"""
+    """Get caregiver details by ID (weak ETag / If-None-Match supported)"""
     try:
-        response = supabase.table("users").select("*, caregiver_profile(*)").eq("id", caregiver_id).eq("role", "caregiver").single().execute()
+        if if_none_match:
+            version_response = supabase.table("users").select("id, updated_at, caregiver_profile(updated_at)").eq("id", caregiver_id).eq("role", "caregiver").limit(1).execute()
+            if version_response.data:
+                etag = _caregiver_etag(version_response.data[0])
+                if etag_matches(if_none_match, etag):
+                    return not_modified(etag)
         
-        if not response.data:
+        caregiver_response = supabase.table("users").select(select_list("caregiver_list", CAREGIVER_EMBEDS)).eq("id", caregiver_id).eq("role", "caregiver").single().execute()
+        
+        if not caregiver_response.data:
             raise HTTPException(
                 status_code=status.HTTP_404_NOT_FOUND,
                 detail="Caregiver not found"
             )
         
-        return response.data
+        response.headers["ETag"] = _caregiver_etag(caregiver_response.data)
+        return caregiver_response.data
+    except HTTPException:
+        raise
     except Exception as e:
         if "not found" in str(e).lower():
             raise HTTPException(
@@ -424,6 +465,84 @@ async def get_caregiver(
         )
 
 
+@router.get("/{caregiver_id}/freebusy")
+async def get_caregiver_freebusy(
+    caregiver_id: str,
+    from_date: date = Query(..., alias="from", description="First UTC day (YYYY-MM-DD)"),
+    to_date: date = Query(..., alias="to", description="Last UTC day, inclusive (YYYY-MM-DD)"),
+    current_user: dict = Depends(get_current_user)
+):
+    """
+    Caregiver free/busy bitmap as raw bytes (application/octet-stream).
+    
+    One bit per 15-minute slot, 1 = busy, most significant bit first;
+    12 bytes per UTC day from `from` to `to`. Busy means an active booking or
+    recurring occurrence, or outside the caregiver's availability_schedule.
+    """
+    try:
+        days = (to_date - from_date).days + 1
+        if days < 1:
+            raise HTTPException(
+                status_code=status.HTTP_400_BAD_REQUEST,
+                detail="'to' must not be before 'from'"
+            )
+        if days > settings.FREEBUSY_MAX_DAYS:
+            raise HTTPException(
+                status_code=status.HTTP_400_BAD_REQUEST,
+                detail=f"Range can be at most {settings.FREEBUSY_MAX_DAYS} days"
+            )
+        
+        bitmap = get_freebusy(caregiver_id, from_date, to_date)
+        return Response(
+            content=bitmap,
+            media_type="application/octet-stream",
+            headers={
+                "X-Slot-Minutes": str(SLOT_MINUTES),
+                "X-Slots-Per-Day": str(SLOTS_PER_DAY),
+                "X-From": from_date.isoformat(),
+                "X-Days": str(days)
+            }
+        )
+    except HTTPException:
+        raise
+    except Exception as e:
+        raise HTTPException(
+            status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
+            detail=str(e)
+        )
+
+
+@router.get("/{caregiver_id}/availability", response_model=dict)
+async def check_caregiver_availability(
+    caregiver_id: str,
+    start: datetime = Query(..., description="Requested start time (ISO 8601)"),
+    duration_hours: float = Query(2.0, ge=0.5, le=24.0),
+    exclude_booking_id: Optional[str] = Query(None, description="Ignore this booking (when rescheduling it)"),
+    current_user: dict = Depends(get_current_user)
+):
+    """
+    Check whether a caregiver is free for [start, start + duration_hours).
+    
+    Answered by one probe of the GiST index behind the bookings overlap
+    constraint, so the cost does not grow with the caregiver's booking history.
+    """
+    try:
+        slot_start, slot_end = booking_window(start, duration_hours)
+        conflicts = find_conflicts(caregiver_id, slot_start, slot_end, exclude_booking_id)
+        return {
+            "caregiver_id": caregiver_id,
+            "start": slot_start.isoformat(),
+            "end": slot_end.isoformat(),
+            "available": not conflicts,
+            "conflicts": conflicts
+        }
+    except Exception as e:
+        raise HTTPException(
+            status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
+            detail=str(e)
+        )
+
+
 @router.post("/profile", response_model=CaregiverProfileResponse, status_code=status.HTTP_201_CREATED)
 async def create_caregiver_profile(
     profile_data: CaregiverProfileCreate,
@@ -5,6 +5,7 @@ from app.schemas import MessageCreate, MessageResponse, ChatSessionResponse
 from app.database import supabase, supabase_admin
 from app.dependencies import get_current_user
 from app.services.notifications import notify_new_message
+from app.services.projections import columns
 
 router = APIRouter()
 
@@ -38,7 +39,7 @@ async def get_chat_sessions(current_user: dict = Depends(get_current_user)):
             # Fetch care_recipient user data
             if session.get("care_recipient_id"):
                 try:
-                    care_recipient_response = supabase_admin.table("users").select("id, full_name, profile_photo_url, email").eq("id", session["care_recipient_id"]).single().execute()
+                    care_recipient_response = supabase_admin.table("users").select(columns("user_card")).eq("id", session["care_recipient_id"]).single().execute()
                     if care_recipient_response.data:
                         enriched_session["care_recipient"] = care_recipient_response.data
                 except Exception as e:
@@ -48,7 +49,7 @@ async def get_chat_sessions(current_user: dict = Depends(get_current_user)):
             # Fetch caregiver user data
             if session.get("caregiver_id"):
                 try:
-                    caregiver_response = supabase_admin.table("users").select("id, full_name, profile_photo_url, email").eq("id", session["caregiver_id"]).single().execute()
+                    caregiver_response = supabase_admin.table("users").select(columns("user_card")).eq("id", session["caregiver_id"]).single().execute()
                     if caregiver_response.data:
                         enriched_session["caregiver"] = caregiver_response.data
                 except Exception as e:
@@ -173,7 +174,8 @@ async def get_messages(
             )
         
         # Get messages using admin client to bypass RLS
-        query = supabase_admin.table("messages").select("*, sender:sender_id(*), recipient:recipient_id(*)").eq("chat_session_id", chat_session_id).order("created_at", desc=False).range(offset, offset + limit - 1)
+        # (MessageResponse carries no sender/recipient rows, so none are embedded)
+        query = supabase_admin.table("messages").select(columns("message_list")).eq("chat_session_id", chat_session_id).order("created_at", desc=False).range(offset, offset + limit - 1)
         
         response = query.execute()
         
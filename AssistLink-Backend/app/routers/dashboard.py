@@ -1,65 +1,212 @@
-from fastapi import APIRouter, HTTPException, status, Depends, Query
+import asyncio
+from fastapi import APIRouter, HTTPException, status, Depends, Query, Header, Response
 from datetime import datetime, timedelta, timezone
+from itertools import islice
 from typing import List, Optional
 from app.schemas import DashboardStats, BookingResponse
-from app.database import supabase, supabase_admin
+from app.database import supabase_admin
 from app.dependencies import get_current_user
+from app.services.dashboard_cache import get_or_load
+from app.services.etag import etag_matches, not_modified, weak_etag
+from app.services.projections import RECURRENCE_COLUMNS, parse_fields, select_list, trim_rows
+from app.services.recurrence import iter_booking_occurrences, load_exceptions, next_occurrence, parse_datetime
 
 router = APIRouter()
 
+SUMMARY_SECTIONS = ("stats", "upcoming", "bookings", "video_calls")
+
+# Embeds accepted by ?fields= on booking and video call lists; each role only gets the other party
+BOOKING_EMBEDS = {
+    "caregiver": ("caregiver_id", "user_card"),
+    "care_recipient": ("care_recipient_id", "user_card"),
+    "video_call_request": ("video_call_request_id", "video_call_card"),
+    "chat_session": ("chat_session_id", "chat_session_card"),
+}
+VIDEO_CALL_EMBEDS = {
+    "caregiver": ("caregiver_id", "user_card"),
+    "care_recipient": ("care_recipient_id", "user_card"),
+}
+
+
+def _other_party(role: Optional[str]) -> dict:
+    if role == "care_recipient":
+        return {"caregiver": BOOKING_EMBEDS["caregiver"]}
+    return {"care_recipient": BOOKING_EMBEDS["care_recipient"]}
+
+
+def _get_role(user_id: str) -> Optional[str]:
+    def load() -> Optional[str]:
+        user_response = supabase_admin.table("users").select("role").eq("id", user_id).single().execute()
+        return user_response.data.get("role") if user_response.data else None
+    return get_or_load(user_id, ("role",), load)
+
+
+def _load_stats(user_id: str, role: Optional[str]) -> DashboardStats:
+    # All five counters come from one aggregate query (get_dashboard_stats),
+    # so the cost does not grow with the user's booking history
+    response = supabase_admin.rpc("get_dashboard_stats", {"p_user_id": str(user_id), "p_role": role}).execute()
+    counters = response.data[0] if response.data else {}
+    return DashboardStats(
+        upcoming_bookings=counters.get("upcoming_bookings") or 0,
+        active_bookings=counters.get("active_bookings") or 0,
+        completed_bookings=counters.get("completed_bookings") or 0,
+        pending_video_calls=counters.get("pending_video_calls") or 0,
+        active_chat_sessions=counters.get("active_chat_sessions") or 0
+    )
+
+
+# Extra embeds carrying the updated_at of every row a /bookings entry shows, for the ETag
+BOOKING_VERSION_COLUMNS = ("id", "updated_at")
+BOOKING_VERSION_KEYS = ("version_party", "version_video_call", "version_chat_session")
+
+
+def _booking_version_select(role: Optional[str]) -> str:
+    ((_, (party_key, _)),) = _other_party(role).items()
+    return (
+        f"version_party:{party_key}(updated_at), "
+        "version_video_call:video_call_request_id(updated_at), "
+        "version_chat_session:chat_session_id(updated_at)"
+    )
+
+
+def _bookings_etag(user_id: str, role: Optional[str], rows: List[dict], *params) -> str:
+    """
+    Tag for a /bookings page from its rows: each booking's id and updated_at
+    and the updated_at of the other party, video call and chat session it
+    embeds (so a renamed counterpart changes the tag). The version embeds are
+    removed from the rows.
+    """
+    versions = []
+    for row in rows:
+        embedded = [(row.pop(key, None) or {}).get("updated_at") for key in BOOKING_VERSION_KEYS]
+        versions.append((row.get("id"), row.get("updated_at"), *embedded))
+    return weak_etag(user_id, role, *params, versions)
+
+
+def _bookings_query(
+    user_id: str,
+    role: Optional[str],
+    select: str,
+    status_filter: Optional[str] = None,
+    is_recurring: Optional[bool] = None,
+    limit: int = 20,
+    offset: int = 0
+):
+    if role == "care_recipient":
+        query = supabase_admin.table("bookings").select(select).eq("care_recipient_id", user_id)
+    else:
+        query = supabase_admin.table("bookings").select(select).eq("caregiver_id", user_id)
+    
+    if status_filter:
+        # Allow multiple statuses separated by comma
+        statuses = status_filter.split(',')
+        if len(statuses) > 1:
+            query = query.in_("status", statuses)
+        else:
+            query = query.eq("status", status_filter)
+    
+    if is_recurring is not None:
+        query = query.eq("is_recurring", is_recurring)
+    
+    return query.order("scheduled_date", desc=False).range(offset, offset + limit - 1)
+
+
+def _load_bookings(
+    user_id: str,
+    role: Optional[str],
+    status_filter: Optional[str] = None,
+    is_recurring: Optional[bool] = None,
+    limit: int = 20,
+    offset: int = 0,
+    fields: Optional[List[str]] = None,
+    with_versions: bool = False
+) -> List[dict]:
+    """With with_versions, rows also carry the columns and embeds _bookings_etag() reads."""
+    embeds = dict(_other_party(role), video_call_request=BOOKING_EMBEDS["video_call_request"], chat_session=BOOKING_EMBEDS["chat_session"])
+    if with_versions:
+        select = select_list("booking_list", embeds, fields, required=BOOKING_VERSION_COLUMNS) + ", " + _booking_version_select(role)
+    else:
+        select = select_list("booking_list", embeds, fields)
+    return _bookings_query(user_id, role, select, status_filter, is_recurring, limit, offset).execute().data or []
+
+
+def _load_upcoming(user_id: str, role: Optional[str], limit: int = 10, fields: Optional[List[str]] = None) -> List[dict]:
+    now = datetime.now(timezone.utc)
+    next_week = now + timedelta(days=7)
+    
+    select = select_list("booking_list", _other_party(role), fields, required=RECURRENCE_COLUMNS)
+    if role == "care_recipient":
+        query = supabase_admin.table("bookings").select(select).eq("care_recipient_id", user_id)
+    else:
+        query = supabase_admin.table("bookings").select(select).eq("caregiver_id", user_id)
+    
+    # One-off bookings in the window plus recurring series that have started by its end
+    query = query.lte("scheduled_date", next_week.isoformat()).or_(f"is_recurring.eq.true,scheduled_date.gte.{now.isoformat()}").in_("status", ["pending", "accepted", "in_progress"]).order("scheduled_date", desc=False)
+    
+    response = query.execute()
+    
+    occurrences = (
+        occurrence for occurrence in iter_booking_occurrences(response.data or [], now, next_week)
+        if parse_datetime(occurrence["scheduled_date"]) >= now
+    )
+    return trim_rows(list(islice(occurrences, limit)), fields, RECURRENCE_COLUMNS)
+
+
+def _load_recurring(user_id: str, role: Optional[str], fields: Optional[List[str]] = None) -> List[dict]:
+    now = datetime.now(timezone.utc)
+    
+    select = select_list("booking_list", _other_party(role), fields, required=RECURRENCE_COLUMNS)
+    if role == "care_recipient":
+        query = supabase_admin.table("bookings").select(select).eq("care_recipient_id", user_id).eq("is_recurring", True)
+    else:
+        query = supabase_admin.table("bookings").select(select).eq("caregiver_id", user_id).eq("is_recurring", True)
+    
+    query = query.order("scheduled_date", desc=False)
+    
+    response = query.execute()
+    
+    bookings = response.data or []
+    if bookings:
+        load_exceptions([booking["id"] for booking in bookings])  # one query for all series
+    for booking in bookings:
+        upcoming = next_occurrence(booking, now)
+        booking["next_occurrence"] = {
+            "scheduled_date": upcoming["scheduled_date"],
+            "duration_hours": upcoming["duration_hours"],
+            "occurrence_start": upcoming["occurrence_start"]
+        } if upcoming else None
+    
+    return trim_rows(bookings, fields, RECURRENCE_COLUMNS)
+
+
+def _load_video_calls(
+    user_id: str,
+    role: Optional[str],
+    status_filter: Optional[str] = None,
+    limit: int = 50,
+    offset: int = 0,
+    fields: Optional[List[str]] = None
+) -> List[dict]:
+    # Include other party's info
+    select = select_list("video_call_list", _other_party(role), fields)
+    if role == "care_recipient":
+        query = supabase_admin.table("video_call_requests").select(select).eq("care_recipient_id", user_id)
+    else:
+        query = supabase_admin.table("video_call_requests").select(select).eq("caregiver_id", user_id)
+    
+    if status_filter:
+        query = query.eq("status", status_filter)
+    
+    query = query.order("scheduled_time", desc=False).range(offset, offset + limit - 1)
+    return query.execute().data or []
+
 
 @router.get("/stats", response_model=DashboardStats)
 async def get_dashboard_stats(current_user: dict = Depends(get_current_user)):
     """Get dashboard statistics for current user"""
     try:
         user_id = current_user["id"]
-        
-        # Get user role
-        user_response = supabase.table("users").select("role").eq("id", user_id).single().execute()
-        role = user_response.data.get("role") if user_response.data else None
-        
-        # Get bookings based on role (no need for joins here, keep using regular client)
-        if role == "care_recipient":
-            bookings_query = supabase.table("bookings").select("*").eq("care_recipient_id", user_id)
-        else:
-            bookings_query = supabase.table("bookings").select("*").eq("caregiver_id", user_id)
-        
-        all_bookings = bookings_query.execute().data or []
-        
-        # Count bookings by status
-        now = datetime.now(timezone.utc)
-        upcoming_bookings = len([
-            b for b in all_bookings 
-            if b.get("status") in ["pending", "accepted"] 
-            and b.get("scheduled_date")
-            and datetime.fromisoformat(b["scheduled_date"].replace("Z", "+00:00")) > now
-        ])
-        active_bookings = len([b for b in all_bookings if b.get("status") == "in_progress"])
-        completed_bookings = len([b for b in all_bookings if b.get("status") == "completed"])
-        
-        # Get pending video calls
-        if role == "care_recipient":
-            video_calls_query = supabase.table("video_call_requests").select("*").eq("care_recipient_id", user_id).eq("status", "pending")
-        else:
-            video_calls_query = supabase.table("video_call_requests").select("*").eq("caregiver_id", user_id).eq("status", "pending")
-        
-        pending_video_calls = len(video_calls_query.execute().data or [])
-        
-        # Get active chat sessions
-        if role == "care_recipient":
-            chat_query = supabase.table("chat_sessions").select("*").eq("care_recipient_id", user_id).eq("is_enabled", True)
-        else:
-            chat_query = supabase.table("chat_sessions").select("*").eq("caregiver_id", user_id).eq("is_enabled", True)
-        
-        active_chat_sessions = len(chat_query.execute().data or [])
-        
-        return DashboardStats(
-            upcoming_bookings=upcoming_bookings,
-            active_bookings=active_bookings,
-            completed_bookings=completed_bookings,
-            pending_video_calls=pending_video_calls,
-            active_chat_sessions=active_chat_sessions
-        )
+        return get_or_load(user_id, ("stats",), lambda: _load_stats(user_id, None))
     
     except Exception as e:
         raise HTTPException(
@@ -70,42 +217,40 @@ async def get_dashboard_stats(current_user: dict = Depends(get_current_user)):
 
 @router.get("/bookings", response_model=List[dict])
 async def get_dashboard_bookings(
+    response: Response,
     status_filter: Optional[str] = Query(None, alias="status"),
     is_recurring: Optional[bool] = Query(None),
     limit: int = Query(20, ge=1, le=100),
     offset: int = Query(0, ge=0),
+    fields: Optional[str] = Query(None, description="Comma-separated subset of columns to return"),
+    if_none_match: Optional[str] = Header(None),
     current_user: dict = Depends(get_current_user)
 ):
-    """Get bookings for dashboard"""
+    """
+    Get bookings for dashboard.
+    
+    Responses carry a weak ETag; send it back in If-None-Match to get an
+    empty 304 when nothing changed.
+    """
     try:
         user_id = current_user["id"]
-        
-        # Get user role
-        user_response = supabase_admin.table("users").select("role").eq("id", user_id).single().execute()
-        role = user_response.data.get("role") if user_response.data else None
-        
-        # Build query
-        if role == "care_recipient":
-            query = supabase_admin.table("bookings").select("*, caregiver:caregiver_id(*), video_call_request:video_call_request_id(*), chat_session:chat_session_id(*)").eq("care_recipient_id", user_id)
-        else:
-            query = supabase_admin.table("bookings").select("*, care_recipient:care_recipient_id(*), video_call_request:video_call_request_id(*), chat_session:chat_session_id(*)").eq("caregiver_id", user_id)
-        
-        if status_filter:
-            # Allow multiple statuses separated by comma
-            statuses = status_filter.split(',')
-            if len(statuses) > 1:
-                query = query.in_("status", statuses)
-            else:
-                query = query.eq("status", status_filter)
-        
-        if is_recurring is not None:
-            query = query.eq("is_recurring", is_recurring)
-        
-        query = query.order("scheduled_date", desc=False).range(offset, offset + limit - 1)
-        
-        response = query.execute()
-        
-        bookings = response.data or []
+        field_list = parse_fields(fields, "booking_list", BOOKING_EMBEDS)
+        role = _get_role(user_id)
+        
+        params = (status_filter, is_recurring, limit, offset, fields)
+        if if_none_match:
+            # Only the version columns of the same page, to answer 304 cheaply
+            version_rows = _bookings_query(
+                user_id, role, ", ".join(BOOKING_VERSION_COLUMNS) + ", " + _booking_version_select(role),
+                status_filter, is_recurring, limit, offset
+            ).execute().data or []
+            etag = _bookings_etag(user_id, role, version_rows, *params)
+            if etag_matches(if_none_match, etag):
+                return not_modified(etag)
+        
+        bookings = _load_bookings(user_id, role, status_filter, is_recurring, limit, offset, field_list, with_versions=True)
+        response.headers["ETag"] = _bookings_etag(user_id, role, bookings, *params)
+        bookings = trim_rows(bookings, field_list, BOOKING_VERSION_COLUMNS)
         print(f"[INFO] Dashboard bookings query - User ID: {user_id}, Role: {role}", flush=True)
         print(f"[INFO] Total bookings returned: {len(bookings)}", flush=True)
         for idx, booking in enumerate(bookings):
@@ -113,6 +258,8 @@ async def get_dashboard_bookings(
         
         return bookings
     
+    except HTTPException:
+        raise
     except Exception as e:
         raise HTTPException(
             status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
@@ -123,30 +270,73 @@ async def get_dashboard_bookings(
 @router.get("/upcoming", response_model=List[dict])
 async def get_upcoming_bookings(
     limit: int = Query(10, ge=1, le=50),
+    fields: Optional[str] = Query(None, description="Comma-separated subset of columns to return"),
+    current_user: dict = Depends(get_current_user)
+):
+    """Get upcoming bookings (next 7 days), with recurring bookings expanded into occurrences"""
+    try:
+        user_id = current_user["id"]
+        field_list = parse_fields(fields, "booking_list", BOOKING_EMBEDS)
+        return get_or_load(
+            user_id,
+            ("upcoming", limit, fields),
+            lambda: _load_upcoming(user_id, _get_role(user_id), limit, field_list)
+        )
+    
+    except HTTPException:
+        raise
+    except Exception as e:
+        raise HTTPException(
+            status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
+            detail=str(e)
+        )
+
+
+@router.get("/calendar", response_model=List[dict])
+async def get_calendar_bookings(
+    from_date: datetime = Query(..., alias="from"),
+    to_date: datetime = Query(..., alias="to"),
+    status_filter: Optional[str] = Query(None, alias="status"),
+    fields: Optional[str] = Query(None, description="Comma-separated subset of columns to return"),
     current_user: dict = Depends(get_current_user)
 ):
-    """Get upcoming bookings (next 7 days)"""
+    """
+    Get every booking occurrence overlapping [from, to), recurring bookings
+    expanded server-side. The window is capped at RECURRING_MAX_WINDOW_DAYS.
+    """
     try:
         user_id = current_user["id"]
-        now = datetime.now(timezone.utc)
-        next_week = now + timedelta(days=7)
+        window_start = parse_datetime(from_date)
+        window_end = parse_datetime(to_date)
+        if window_end <= window_start:
+            raise HTTPException(
+                status_code=status.HTTP_400_BAD_REQUEST,
+                detail="'to' must be after 'from'"
+            )
         
-        # Get user role
-        user_response = supabase_admin.table("users").select("role").eq("id", user_id).single().execute()
-        role = user_response.data.get("role") if user_response.data else None
+        field_list = parse_fields(fields, "booking_list", BOOKING_EMBEDS)
+        role = _get_role(user_id)
         
         # Build query
+        select = select_list("booking_list", _other_party(role), field_list, required=RECURRENCE_COLUMNS)
         if role == "care_recipient":
-            query = supabase_admin.table("bookings").select("*, caregiver:caregiver_id(*)").eq("care_recipient_id", user_id)
+            query = supabase_admin.table("bookings").select(select).eq("care_recipient_id", user_id)
         else:
-            query = supabase_admin.table("bookings").select("*, care_recipient:care_recipient_id(*)").eq("caregiver_id", user_id)
+            query = supabase_admin.table("bookings").select(select).eq("caregiver_id", user_id)
         
-        query = query.gte("scheduled_date", now.isoformat()).lte("scheduled_date", next_week.isoformat()).in_("status", ["pending", "accepted", "in_progress"]).order("scheduled_date", desc=False).limit(limit)
+        # A one-off booking lasts at most 24h, so anything starting earlier cannot overlap
+        earliest_start = window_start - timedelta(hours=24)
+        query = query.lt("scheduled_date", window_end.isoformat()).or_(f"is_recurring.eq.true,scheduled_date.gte.{earliest_start.isoformat()}")
+        
+        if status_filter:
+            query = query.in_("status", status_filter.split(','))
         
-        response = query.execute()
+        response = query.order("scheduled_date", desc=False).execute()
         
-        return response.data or []
+        return trim_rows(list(iter_booking_occurrences(response.data or [], window_start, window_end)), field_list, RECURRENCE_COLUMNS)
     
+    except HTTPException:
+        raise
     except Exception as e:
         raise HTTPException(
             status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
@@ -156,28 +346,17 @@ async def get_upcoming_bookings(
 
 @router.get("/recurring", response_model=List[dict])
 async def get_recurring_bookings(
+    fields: Optional[str] = Query(None, description="Comma-separated subset of columns to return"),
     current_user: dict = Depends(get_current_user)
 ):
-    """Get all recurring bookings"""
+    """Get all recurring bookings, each with its next occurrence"""
     try:
         user_id = current_user["id"]
-        
-        # Get user role
-        user_response = supabase_admin.table("users").select("role").eq("id", user_id).single().execute()
-        role = user_response.data.get("role") if user_response.data else None
-        
-        # Build query
-        if role == "care_recipient":
-            query = supabase_admin.table("bookings").select("*, caregiver:caregiver_id(*)").eq("care_recipient_id", user_id).eq("is_recurring", True)
-        else:
-            query = supabase_admin.table("bookings").select("*, care_recipient:care_recipient_id(*)").eq("caregiver_id", user_id).eq("is_recurring", True)
-        
-        query = query.order("scheduled_date", desc=False)
-        
-        response = query.execute()
-        
-        return response.data or []
+        field_list = parse_fields(fields, "booking_list", BOOKING_EMBEDS)
+        return get_or_load(user_id, ("recurring", fields), lambda: _load_recurring(user_id, _get_role(user_id), field_list))
     
+    except HTTPException:
+        raise
     except Exception as e:
         raise HTTPException(
             status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
@@ -190,34 +369,75 @@ async def get_dashboard_video_calls(
     status_filter: Optional[str] = Query(None, alias="status"),
     limit: int = Query(50, ge=1, le=100),
     offset: int = Query(0, ge=0),
+    fields: Optional[str] = Query(None, description="Comma-separated subset of columns to return"),
     current_user: dict = Depends(get_current_user)
 ):
     """Get video call requests for dashboard"""
     try:
         user_id = current_user["id"]
-        
-        # Get user role
-        user_response = supabase_admin.table("users").select("role").eq("id", user_id).single().execute()
-        role = user_response.data.get("role") if user_response.data else None
-        
-        # Build query - include other party's info
-        if role == "care_recipient":
-            query = supabase_admin.table("video_call_requests").select("*, caregiver:caregiver_id(*)").eq("care_recipient_id", user_id)
-        else:
-            query = supabase_admin.table("video_call_requests").select("*, care_recipient:care_recipient_id(*)").eq("caregiver_id", user_id)
-        
-        if status_filter:
-            query = query.eq("status", status_filter)
-        
-        query = query.order("scheduled_time", desc=False).range(offset, offset + limit - 1)
-        
-        response = query.execute()
-        
-        return response.data or []
+        field_list = parse_fields(fields, "video_call_list", VIDEO_CALL_EMBEDS)
+        return get_or_load(
+            user_id,
+            ("video_calls", status_filter, limit, offset, fields),
+            lambda: _load_video_calls(user_id, _get_role(user_id), status_filter, limit, offset, field_list)
+        )
     
+    except HTTPException:
+        raise
     except Exception as e:
         raise HTTPException(
             status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
             detail=str(e)
         )
 
+
+@router.get("/summary", response_model=dict)
+async def get_dashboard_summary(
+    sections: Optional[str] = Query(None, description="Comma-separated subset of: stats, upcoming, bookings, video_calls"),
+    status_filter: Optional[str] = Query(None, alias="status", description="Status filter for the bookings section"),
+    upcoming_limit: int = Query(10, ge=1, le=50),
+    bookings_limit: int = Query(20, ge=1, le=100),
+    video_calls_limit: int = Query(50, ge=1, le=100),
+    current_user: dict = Depends(get_current_user)
+):
+    """
+    Everything the dashboard screen needs in one request.
+    
+    The user's role is looked up once and the requested sections are loaded
+    concurrently; omit `sections` to get all of them. Each section has the
+    same shape as the matching /stats, /upcoming, /bookings or /video-calls
+    response.
+    """
+    try:
+        user_id = current_user["id"]
+        requested = [section.strip() for section in sections.split(',') if section.strip()] if sections else list(SUMMARY_SECTIONS)
+        unknown = [section for section in requested if section not in SUMMARY_SECTIONS]
+        if unknown:
+            raise HTTPException(
+                status_code=status.HTTP_400_BAD_REQUEST,
+                detail=f"Unknown sections: {', '.join(unknown)}. Valid sections: {', '.join(SUMMARY_SECTIONS)}"
+            )
+        requested = list(dict.fromkeys(requested))
+        
+        role = await asyncio.to_thread(_get_role, user_id)
+        
+        loaders = {
+            "stats": lambda: get_or_load(user_id, ("stats",), lambda: _load_stats(user_id, role)),
+            "upcoming": lambda: get_or_load(user_id, ("upcoming", upcoming_limit, None), lambda: _load_upcoming(user_id, role, upcoming_limit)),
+            "bookings": lambda: _load_bookings(user_id, role, status_filter, None, bookings_limit, 0),
+            "video_calls": lambda: get_or_load(user_id, ("video_calls", None, video_calls_limit, 0, None), lambda: _load_video_calls(user_id, role, None, video_calls_limit, 0)),
+        }
+        # The Supabase client is blocking, so each section runs in its own worker thread
+        results = await asyncio.gather(*(asyncio.to_thread(loaders[section]) for section in requested))
+        
+        summary = {"role": role}
+        summary.update(zip(requested, results))
+        return summary
+    
+    except HTTPException:
+        raise
+    except Exception as e:
+        raise HTTPException(
+            status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
+            detail=str(e)
+        )
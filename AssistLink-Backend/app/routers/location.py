@@ -3,6 +3,7 @@ from datetime import datetime
 from app.schemas import LocationUpdate, LocationResponse
 from app.database import supabase
 from app.dependencies import get_current_user
+from app.services.location_buffer import get_location, record_location, remember_location
 
 router = APIRouter()
 
@@ -12,7 +13,13 @@ async def update_location(
     location_data: LocationUpdate,
     current_user: dict = Depends(get_current_user)
 ):
-    """Update current user's location"""
+    """
+    Update current user's location.
+    
+    The position is kept in memory and written to users.current_location by
+    the location flush job (see app/services/location_buffer.py), so frequent
+    updates cost no database round-trip and only the latest one is stored.
+    """
     try:
         location_dict = {
             "latitude": location_data.latitude,
@@ -21,21 +28,10 @@ async def update_location(
             "timestamp": datetime.utcnow().isoformat()
         }
         
-        # Update user's current location
-        response = supabase.table("users").update({
-            "current_location": location_dict
-        }).eq("id", current_user["id"]).execute()
-        
-        if not response.data:
-            raise HTTPException(
-                status_code=status.HTTP_404_NOT_FOUND,
-                detail="User not found"
-            )
+        record_location(current_user["id"], location_dict)
         
         return location_dict
     
-    except HTTPException:
-        raise
     except Exception as e:
         raise HTTPException(
             status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
@@ -45,8 +41,12 @@ async def update_location(
 
 @router.get("/me", response_model=LocationResponse)
 async def get_my_location(current_user: dict = Depends(get_current_user)):
-    """Get current user's location"""
+    """Get current user's location (from memory when known, otherwise the stored row)"""
     try:
+        location = get_location(current_user["id"])
+        if location:
+            return location
+        
         response = supabase.table("users").select("current_location").eq("id", current_user["id"]).single().execute()
         
         if not response.data or not response.data.get("current_location"):
@@ -55,6 +55,7 @@ async def get_my_location(current_user: dict = Depends(get_current_user)):
                 detail="Location not found"
             )
         
+        remember_location(current_user["id"], response.data["current_location"])
         return response.data["current_location"]
     
     except HTTPException:
@@ -1,21 +1,50 @@
-from fastapi import APIRouter, HTTPException, status, Depends, Query
+from fastapi import APIRouter, HTTPException, status, Depends, Query, Request, Header, Response
+from fastapi.responses import StreamingResponse
 from typing import List, Optional
-from app.schemas import NotificationResponse, DeviceTokenCreate
+from app.schemas import (
+    NotificationResponse, NotificationBulkRequest, DeviceTokenCreate,
+    NotificationPreferencesUpdate, NotificationPreferencesResponse
+)
 from app.database import supabase, supabase_admin
 from app.dependencies import get_current_user
+from app.config import settings
+from app.services.notification_stream import (
+    notification_broker,
+    StreamLimitExceeded,
+    format_sse,
+    fetch_unread_count,
+    publish_unread_count
+)
+from app.services.notification_preferences import get_preferences, invalidate_preferences
+from app.services.etag import etag_matches, not_modified, weak_etag
 from datetime import datetime, timezone
+import asyncio
+import json
 
 router = APIRouter()
 
+NOTIFICATION_TYPES = {"video_call", "message", "booking", "chat_session", "profile", "system"}
+
+
+def _notifications_etag(user_id: str, rows: List[dict], *params) -> str:
+    return weak_etag(user_id, *params, [(row.get("id"), row.get("is_read")) for row in rows])
+
 
 @router.get("", response_model=List[NotificationResponse])
 async def get_notifications(
+    response: Response,
     limit: int = Query(50, ge=1, le=100),
     offset: int = Query(0, ge=0),
     unread_only: bool = Query(False),
+    if_none_match: Optional[str] = Header(None),
     current_user: dict = Depends(get_current_user)
 ):
-    """Get notifications for current user"""
+    """
+    Get notifications for current user.
+    
+    Responses carry a weak ETag; send it back in If-None-Match to get an
+    empty 304 when nothing changed.
+    """
     try:
         user_id = current_user.get("id") if isinstance(current_user, dict) else str(current_user.get("id", ""))
         
@@ -25,17 +54,23 @@ async def get_notifications(
                 detail="User ID not found"
             )
         
-        # Use supabase_admin to bypass RLS and ensure notifications are accessible
-        query = supabase_admin.table("notifications").select("*").eq("user_id", user_id)
+        def page_query(select: str):
+            query = supabase_admin.table("notifications").select(select).eq("user_id", user_id)
+            if unread_only:
+                query = query.eq("is_read", False)
+            return query.order("created_at", desc=True).range(offset, offset + limit - 1)
         
-        if unread_only:
-            query = query.eq("is_read", False)
+        if if_none_match:
+            # Notifications are never edited except for being read, so the ids
+            # and read flags of the page identify it
+            etag = _notifications_etag(user_id, page_query("id, is_read").execute().data or [], limit, offset, unread_only)
+            if etag_matches(if_none_match, etag):
+                return not_modified(etag)
         
-        query = query.order("created_at", desc=True).range(offset, offset + limit - 1)
-        
-        response = query.execute()
-        
-        return response.data or []
+        # Use supabase_admin to bypass RLS and ensure notifications are accessible
+        notifications = page_query("*").execute().data or []
+        response.headers["ETag"] = _notifications_etag(user_id, notifications, limit, offset, unread_only)
+        return notifications
     
     except HTTPException:
         raise
@@ -73,6 +108,252 @@ async def get_unread_count(current_user: dict = Depends(get_current_user)):
         )
 
 
+@router.get("/stream")
+async def stream_notifications(
+    request: Request,
+    last_event_id: Optional[str] = Header(None, alias="Last-Event-ID"),
+    current_user: dict = Depends(get_current_user)
+):
+    """
+    Server-Sent Events stream of new notifications and unread-count changes.
+
+    Emits `notification` events with the created row and `unread_count` events
+    with `{"unread_count": n}`. A comment heartbeat is sent while idle. Clients
+    reconnecting with `Last-Event-ID` get the events they missed replayed; if
+    the gap is too old, a fresh `unread_count` snapshot is sent instead.
+    """
+    user_id = current_user.get("id") if isinstance(current_user, dict) else str(current_user.get("id", ""))
+    
+    if not user_id:
+        raise HTTPException(
+            status_code=status.HTTP_401_UNAUTHORIZED,
+            detail="User ID not found"
+        )
+    
+    try:
+        queue = notification_broker.subscribe(user_id)
+    except StreamLimitExceeded as e:
+        raise HTTPException(
+            status_code=status.HTTP_429_TOO_MANY_REQUESTS,
+            detail=str(e)
+        )
+    
+    replay = None
+    if last_event_id and last_event_id.isdigit():
+        replay = notification_broker.replay_since(user_id, int(last_event_id))
+    
+    async def event_generator():
+        try:
+            # Tell EventSource clients how long to wait before reconnecting
+            yield f"retry: {settings.NOTIFICATION_STREAM_HEARTBEAT_SECONDS * 1000}\n\n"
+            if replay is not None:
+                for event_id, event, data in replay:
+                    yield format_sse(event_id, event, data)
+            else:
+                try:
+                    unread_count = fetch_unread_count(user_id)
+                    yield format_sse(None, "unread_count", json.dumps({"unread_count": unread_count}))
+                except Exception as e:
+                    print(f"[WARN] Could not load unread count for stream {user_id}: {e}", flush=True)
+            
+            while True:
+                if await request.is_disconnected():
+                    break
+                try:
+                    event_id, event, data = await asyncio.wait_for(
+                        queue.get(),
+                        timeout=settings.NOTIFICATION_STREAM_HEARTBEAT_SECONDS
+                    )
+                except asyncio.TimeoutError:
+                    yield ": heartbeat\n\n"
+                    continue
+                yield format_sse(event_id, event, data)
+        finally:
+            notification_broker.unsubscribe(user_id, queue)
+    
+    return StreamingResponse(
+        event_generator(),
+        media_type="text/event-stream",
+        headers={
+            "Cache-Control": "no-cache",
+            "Connection": "keep-alive",
+            "X-Accel-Buffering": "no"
+        }
+    )
+
+
+@router.get("/preferences", response_model=NotificationPreferencesResponse)
+async def get_notification_preferences(current_user: dict = Depends(get_current_user)):
+    """Get push notification preferences and quiet hours for current user"""
+    try:
+        user_id = current_user.get("id") if isinstance(current_user, dict) else str(current_user.get("id", ""))
+        
+        if not user_id:
+            raise HTTPException(
+                status_code=status.HTTP_401_UNAUTHORIZED,
+                detail="User ID not found"
+            )
+        
+        return get_preferences(user_id)
+    
+    except HTTPException:
+        raise
+    except Exception as e:
+        raise HTTPException(
+            status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
+            detail=f"Error retrieving notification preferences: {str(e)}"
+        )
+
+
+@router.put("/preferences", response_model=NotificationPreferencesResponse)
+async def update_notification_preferences(
+    preferences_data: NotificationPreferencesUpdate,
+    current_user: dict = Depends(get_current_user)
+):
+    """
+    Update push notification preferences.
+    Muted types and quiet hours only suppress push; in-app notifications are still created.
+    Send both quiet_hours_start and quiet_hours_end as null to turn quiet hours off.
+    """
+    try:
+        user_id = current_user.get("id") if isinstance(current_user, dict) else str(current_user.get("id", ""))
+        
+        if not user_id:
+            raise HTTPException(
+                status_code=status.HTTP_401_UNAUTHORIZED,
+                detail="User ID not found"
+            )
+        
+        update_data = preferences_data.model_dump(exclude_unset=True)
+        
+        if not update_data:
+            raise HTTPException(
+                status_code=status.HTTP_400_BAD_REQUEST,
+                detail="No fields to update"
+            )
+        
+        unknown_types = set(update_data.get("push_disabled_types") or []) - NOTIFICATION_TYPES
+        if unknown_types:
+            raise HTTPException(
+                status_code=status.HTTP_400_BAD_REQUEST,
+                detail=f"Unknown notification types: {', '.join(sorted(unknown_types))}"
+            )
+        
+        if update_data.get("timezone"):
+            try:
+                from zoneinfo import ZoneInfo
+                ZoneInfo(update_data["timezone"])
+            except Exception:
+                raise HTTPException(
+                    status_code=status.HTTP_400_BAD_REQUEST,
+                    detail=f"Unknown timezone: {update_data['timezone']}"
+                )
+        elif "timezone" in update_data:
+            update_data.pop("timezone")
+        
+        if "push_disabled_types" in update_data and update_data["push_disabled_types"] is None:
+            update_data["push_disabled_types"] = []
+        
+        update_data["user_id"] = user_id
+        response = supabase_admin.table("notification_preferences").upsert(
+            update_data,
+            on_conflict="user_id"
+        ).execute()
+        
+        if not response.data:
+            raise HTTPException(
+                status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
+                detail="Failed to update notification preferences"
+            )
+        
+        invalidate_preferences(user_id)
+        return get_preferences(user_id)
+    
+    except HTTPException:
+        raise
+    except Exception as e:
+        raise HTTPException(
+            status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
+            detail=f"Error updating notification preferences: {str(e)}"
+        )
+
+
+@router.post("/read-bulk")
+async def mark_notifications_as_read_bulk(
+    bulk_data: NotificationBulkRequest,
+    current_user: dict = Depends(get_current_user)
+):
+    """Mark a list of notifications as read in a single statement"""
+    try:
+        user_id = current_user.get("id") if isinstance(current_user, dict) else str(current_user.get("id", ""))
+        
+        if not user_id:
+            raise HTTPException(
+                status_code=status.HTTP_401_UNAUTHORIZED,
+                detail="User ID not found"
+            )
+        
+        notification_ids = [str(notification_id) for notification_id in bulk_data.notification_ids]
+        
+        # Ownership is enforced by the user_id filter, so ids belonging to other users are simply not matched
+        response = supabase_admin.table("notifications").update({
+            "is_read": True,
+            "read_at": datetime.now(timezone.utc).isoformat()
+        }).eq("user_id", user_id).in_("id", notification_ids).eq("is_read", False).execute()
+        
+        publish_unread_count(user_id)
+        
+        return {
+            "message": "Notifications marked as read",
+            "count": len(response.data or []),
+            "notification_ids": [row["id"] for row in response.data or []]
+        }
+    
+    except HTTPException:
+        raise
+    except Exception as e:
+        raise HTTPException(
+            status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
+            detail=f"Error updating notifications: {str(e)}"
+        )
+
+
+@router.post("/delete-bulk")
+async def delete_notifications_bulk(
+    bulk_data: NotificationBulkRequest,
+    current_user: dict = Depends(get_current_user)
+):
+    """Delete a list of notifications in a single statement"""
+    try:
+        user_id = current_user.get("id") if isinstance(current_user, dict) else str(current_user.get("id", ""))
+        
+        if not user_id:
+            raise HTTPException(
+                status_code=status.HTTP_401_UNAUTHORIZED,
+                detail="User ID not found"
+            )
+        
+        notification_ids = [str(notification_id) for notification_id in bulk_data.notification_ids]
+        
+        response = supabase_admin.table("notifications").delete().eq("user_id", user_id).in_("id", notification_ids).execute()
+        
+        publish_unread_count(user_id)
+        
+        return {
+            "message": "Notifications deleted",
+            "count": len(response.data or []),
+            "notification_ids": [row["id"] for row in response.data or []]
+        }
+    
+    except HTTPException:
+        raise
+    except Exception as e:
+        raise HTTPException(
+            status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
+            detail=f"Error deleting notifications: {str(e)}"
+        )
+
+
 @router.post("/{notification_id}/read")
 async def mark_notification_as_read(
     notification_id: str,
@@ -109,6 +390,8 @@ async def mark_notification_as_read(
                 detail="Failed to update notification"
             )
         
+        publish_unread_count(user_id)
+        
         return {"message": "Notification marked as read", "notification": response.data[0]}
     
     except HTTPException:
@@ -138,6 +421,8 @@ async def mark_all_as_read(current_user: dict = Depends(get_current_user)):
             "read_at": datetime.now(timezone.utc).isoformat()
         }).eq("user_id", user_id).eq("is_read", False).execute()
         
+        publish_unread_count(user_id, 0)
+        
         return {"message": "All notifications marked as read", "count": len(response.data or [])}
     
     except HTTPException:
@@ -176,6 +461,8 @@ async def delete_notification(
         # Delete notification
         supabase.table("notifications").delete().eq("id", notification_id).execute()
         
+        publish_unread_count(user_id)
+        
         return {"message": "Notification deleted"}
     
     except HTTPException:
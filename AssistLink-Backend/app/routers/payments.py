@@ -2,12 +2,11 @@
 Razorpay Payment Integration Router
 Handles payment order creation, verification, and webhook processing
 """
-from fastapi import APIRouter, HTTPException, status, Depends, Header
+from fastapi import APIRouter, HTTPException, status, Depends, Header, BackgroundTasks, Request, Query
 from datetime import datetime, timezone
 from typing import Optional, Dict, Any
 from pydantic import BaseModel, Field
-import razorpay
-import hmac
+import asyncio
 import hashlib
 import json
 
@@ -15,48 +14,15 @@ from app.database import supabase_admin
 from app.dependencies import get_current_user, verify_care_recipient
 from app.config import settings
 from app.services.notifications import notify_booking_status_change
+from app.services.booking_payments import mark_booking_paid, schedule_booking_paid_notifications
+from app.services.idempotency import idempotent
+from app.services.payment_gateway import PaymentGatewayError, get_payment_gateway
+from app.services.dashboard_cache import invalidate_users
+from app.services.recurrence import parse_datetime
+from app.services.payment_webhooks import store_event, verify_webhook_signature, wake_worker
 
 router = APIRouter()
 
-# Initialize Razorpay client
-_razorpay_client = None
-
-def get_razorpay_client():
-    """Get or initialize Razorpay client"""
-    global _razorpay_client
-    if _razorpay_client is None:
-        import sys
-        sys.stderr.write(f"[DEBUG] Checking Razorpay credentials...\n")
-        sys.stderr.write(f"[DEBUG] RAZORPAY_KEY_ID exists: {bool(settings.RAZORPAY_KEY_ID)}\n")
-        sys.stderr.write(f"[DEBUG] RAZORPAY_KEY_SECRET exists: {bool(settings.RAZORPAY_KEY_SECRET)}\n")
-        if settings.RAZORPAY_KEY_ID:
-            sys.stderr.write(f"[DEBUG] RAZORPAY_KEY_ID starts with: {settings.RAZORPAY_KEY_ID[:10]}...\n")
-        
-        if settings.RAZORPAY_KEY_ID and settings.RAZORPAY_KEY_SECRET:
-            try:
-                sys.stderr.write(f"[DEBUG] Attempting to create Razorpay client...\n")
-                _razorpay_client = razorpay.Client(auth=(settings.RAZORPAY_KEY_ID, settings.RAZORPAY_KEY_SECRET))
-                sys.stderr.write("[INFO] Razorpay client initialized successfully\n")
-            except Exception as e:
-                sys.stderr.write(f"[ERROR] Failed to initialize Razorpay client: {e}\n")
-                import traceback
-                traceback.print_exc(file=sys.stderr)
-                sys.stderr.write("[WARN] Payment features will be disabled.\n")
-        else:
-            sys.stderr.write("[WARN] Razorpay credentials not found. Payment features will be disabled.\n")
-            sys.stderr.write(f"[WARN] KEY_ID: {settings.RAZORPAY_KEY_ID}, KEY_SECRET: {'SET' if settings.RAZORPAY_KEY_SECRET else 'NOT SET'}\n")
-            sys.stderr.write("[WARN] Add RAZORPAY_KEY_ID and RAZORPAY_KEY_SECRET to .env file to enable payments.\n")
-        sys.stderr.flush()
-    else:
-        import sys
-        sys.stderr.write(f"[DEBUG] Using existing Razorpay client\n")
-        sys.stderr.flush()
-    return _razorpay_client
-
-# Initialize Razorpay client lazily (don't initialize on module load to avoid startup errors)
-# get_razorpay_client()  # Commented out - will initialize on first use
-
-
 @router.get("/status")
 async def payment_service_status():
     """Check if payment service is configured and available"""
@@ -64,9 +30,10 @@ async def payment_service_status():
     sys.stderr.write(f"[STATUS] ===== PAYMENT STATUS ENDPOINT CALLED =====\n")
     sys.stderr.write(f"[STATUS] This log should appear in backend terminal\n")
     sys.stderr.flush()
-    client = get_razorpay_client()
+    gateway = get_payment_gateway()
     status_data = {
-        "configured": client is not None,
+        "configured": gateway.is_configured,
+        "gateway": gateway.name,
         "key_id_set": bool(settings.RAZORPAY_KEY_ID),
         "key_secret_set": bool(settings.RAZORPAY_KEY_SECRET),
         "key_id_preview": settings.RAZORPAY_KEY_ID[:10] + "..." if settings.RAZORPAY_KEY_ID else None
@@ -116,14 +83,146 @@ class PaymentVerificationResponse(BaseModel):
     chat_session_id: Optional[str] = None
 
 
+ORDER_REUSABLE_STATUSES = ("pending", "initiated", "processing", "failed")
+
+
+def _reusable_order_id(booking: Dict[str, Any], amount: float, currency: str) -> Optional[str]:
+    """
+    The booking's stored Razorpay order if it can be handed out again: same
+    amount and currency, not yet paid, and created less than
+    PAYMENT_ORDER_REUSE_SECONDS ago (older orders may have expired at checkout).
+    """
+    order_id = booking.get("razorpay_order_id")
+    if not order_id or booking.get("payment_status") not in ORDER_REUSABLE_STATUSES:
+        return None
+    if booking.get("amount") is None or round(float(booking["amount"]), 2) != round(amount, 2):
+        return None
+    if (booking.get("currency") or "INR") != currency:
+        return None
+    initiated_at = booking.get("payment_initiated_at")
+    if not initiated_at:
+        return None
+    age = datetime.now(timezone.utc) - parse_datetime(initiated_at)
+    return order_id if age.total_seconds() < settings.PAYMENT_ORDER_REUSE_SECONDS else None
+
+
+async def _create_gateway_order(request: CreatePaymentOrderRequest, current_user: dict) -> CreatePaymentOrderResponse:
+    """
+    Hand out a Razorpay order for the booking, reusing the stored one when
+    possible so reopening the payment screen costs one select and no gateway
+    call. A new order is stored with a conditional update; when a concurrent
+    request stored one first, that order is returned instead.
+    """
+    import sys
+    gateway = get_payment_gateway()
+    if not gateway.is_configured:
+        raise HTTPException(
+            status_code=status.HTTP_503_SERVICE_UNAVAILABLE,
+            detail="Payment service is not configured"
+        )
+    currency = request.currency or "INR"
+    
+    def load_booking() -> Dict[str, Any]:
+        response = supabase_admin.table("bookings").select(
+            "id, care_recipient_id, caregiver_id, amount, currency, payment_status, razorpay_order_id, payment_initiated_at, chat_session_id"
+        ).eq("id", request.booking_id).limit(1).execute()
+        if not response.data:
+            raise HTTPException(
+                status_code=status.HTTP_404_NOT_FOUND,
+                detail="Booking not found"
+            )
+        return response.data[0]
+    
+    booking = await asyncio.to_thread(load_booking)
+    if booking["care_recipient_id"] != current_user["id"]:
+        raise HTTPException(
+            status_code=status.HTTP_403_FORBIDDEN,
+            detail="Only care recipient can create payment order"
+        )
+    
+    def order_response(order_id: str, amount: float, order_currency: str) -> CreatePaymentOrderResponse:
+        return CreatePaymentOrderResponse(
+            order_id=order_id,
+            amount=amount,
+            currency=order_currency,
+            key_id=gateway.key_id or "",
+            booking_id=request.booking_id,
+            chat_session_id=booking.get("chat_session_id") if booking.get("payment_status") == "completed" else None
+        )
+    
+    if booking.get("payment_status") == "completed":
+        sys.stderr.write(f"[INFO] Booking {request.booking_id} already paid, returning its order\n")
+        sys.stderr.flush()
+        return order_response(booking.get("razorpay_order_id") or "", float(booking.get("amount") or request.amount), booking.get("currency") or currency)
+    
+    reusable = _reusable_order_id(booking, request.amount, currency)
+    if reusable:
+        sys.stderr.write(f"[INFO] Reusing Razorpay order {reusable} for booking {request.booking_id}\n")
+        sys.stderr.flush()
+        return order_response(reusable, request.amount, currency)
+    
+    try:
+        order = await gateway.create_order(
+            int(round(request.amount * 100)),
+            currency=currency,
+            receipt=str(request.booking_id),
+            notes={"booking_id": str(request.booking_id)}
+        )
+    except PaymentGatewayError as e:
+        sys.stderr.write(f"[ERROR] Razorpay order creation failed for booking {request.booking_id}: {e}\n")
+        sys.stderr.flush()
+        raise HTTPException(
+            status_code=status.HTTP_502_BAD_GATEWAY,
+            detail=f"Failed to create Razorpay order: {str(e)}"
+        )
+    
+    def store_order() -> Optional[Dict[str, Any]]:
+        query = supabase_admin.table("bookings").update({
+            "razorpay_order_id": order["id"],
+            "amount": request.amount,
+            "currency": currency,
+            "payment_status": "initiated",
+            "payment_initiated_at": datetime.now(timezone.utc).isoformat()
+        }).eq("id", request.booking_id).neq("payment_status", "completed")
+        if booking.get("razorpay_order_id"):
+            query = query.eq("razorpay_order_id", booking["razorpay_order_id"])
+        else:
+            query = query.is_("razorpay_order_id", "null")
+        response = query.execute()
+        return response.data[0] if response.data else None
+    
+    stored = await asyncio.to_thread(store_order)
+    if stored is None:
+        # Another request replaced the order (or the booking got paid) meanwhile
+        booking = await asyncio.to_thread(load_booking)
+        winner = booking.get("razorpay_order_id")
+        if booking.get("payment_status") == "completed" or _reusable_order_id(booking, request.amount, currency):
+            return order_response(winner or "", float(booking.get("amount") or request.amount), booking.get("currency") or currency)
+        raise HTTPException(
+            status_code=status.HTTP_409_CONFLICT,
+            detail="Payment order changed concurrently, please retry"
+        )
+    
+    invalidate_users(booking.get("care_recipient_id"), booking.get("caregiver_id"))
+    sys.stderr.write(f"[INFO] Created Razorpay order {order['id']} for booking {request.booking_id}\n")
+    sys.stderr.flush()
+    return order_response(order["id"], request.amount, currency)
+
+
 @router.post("/create-order", response_model=CreatePaymentOrderResponse)
+@idempotent
 async def create_payment_order(
     request: CreatePaymentOrderRequest,
+    background_tasks: BackgroundTasks,
     current_user: dict = Depends(verify_care_recipient)
 ):
     """
     TEMPORARY: Bypass Razorpay and directly enable chat.
     This endpoint directly enables chat without going through Razorpay payment.
+    
+    With PAYMENT_BYPASS_ENABLED off, a Razorpay order is created instead (or the
+    booking's stored order is reused, see _create_gateway_order) and the client
+    completes payment through checkout and /verify.
     """
     import sys
     sys.stderr.write(f"[ENDPOINT] ===== CREATE PAYMENT ORDER (BYPASS MODE) =====\n")
@@ -133,124 +232,31 @@ async def create_payment_order(
     sys.stderr.flush()
     
     try:
-        # Get booking to verify access and calculate amount
-        booking_response = supabase_admin.table("bookings").select("*").eq("id", request.booking_id).single().execute()
-        
-        if not booking_response.data:
-            raise HTTPException(
-                status_code=status.HTTP_404_NOT_FOUND,
-                detail="Booking not found"
-            )
+        if not settings.PAYMENT_BYPASS_ENABLED:
+            return await _create_gateway_order(request, current_user)
         
-        booking = booking_response.data
-        
-        # Verify user is the care recipient
-        if booking["care_recipient_id"] != current_user["id"]:
-            raise HTTPException(
-                status_code=status.HTTP_403_FORBIDDEN,
-                detail="Only care recipient can create payment order"
-            )
-        
-        # Check if payment already exists
-        if booking.get("payment_status") == "completed":
-            sys.stderr.write(f"[INFO] Payment already completed, returning existing chat session\n")
-            sys.stderr.flush()
-            chat_session_id = booking.get("chat_session_id")
-            if chat_session_id:
-                return CreatePaymentOrderResponse(
-                    order_id="bypass_" + request.booking_id,
-                    amount=booking.get("amount") or request.amount or 500,
-                    currency=booking.get("currency") or request.currency or "INR",
-                    key_id="bypass",
-                    booking_id=request.booking_id
-                )
-        
-        # Use amount from request or booking
-        amount = request.amount or booking.get("amount") or 500
-        currency = request.currency or booking.get("currency") or "INR"
+        amount = request.amount
+        currency = request.currency or "INR"
         
         sys.stderr.write(f"[INFO] Bypassing Razorpay - directly enabling chat\n")
         sys.stderr.flush()
         
-        # Update booking with payment status = completed (bypass mode)
-        update_response = supabase_admin.table("bookings").update({
-            "amount": amount,
-            "currency": currency,
-            "payment_status": "completed",
-            "status": "accepted",
-            "payment_completed_at": datetime.now(timezone.utc).isoformat(),
-            "accepted_at": datetime.now(timezone.utc).isoformat()
-        }).eq("id", request.booking_id).execute()
-        
-        if not update_response.data:
-            raise HTTPException(
-                status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
-                detail="Failed to update booking"
-            )
-        
-        updated_booking = update_response.data[0]
-        
-        # Enable chat session
-        chat_session_id = None
-        chat_check = supabase_admin.table("chat_sessions").select("*").eq("care_recipient_id", booking["care_recipient_id"]).eq("caregiver_id", booking["caregiver_id"]).execute()
-        
-        if chat_check.data and len(chat_check.data) > 0:
-            chat_session_id = chat_check.data[0]["id"]
-            supabase_admin.table("chat_sessions").update({
-                "is_enabled": True,
-                "care_recipient_accepted": True,
-                "caregiver_accepted": True,
-                "enabled_at": datetime.now(timezone.utc).isoformat()
-            }).eq("id", chat_session_id).execute()
+        # Update booking with payment status = completed (bypass mode), mark the
+        # caregiver unavailable and enable chat in one idempotent database call
+        # (ownership is checked in the same call)
+        result = mark_booking_paid(
+            request.booking_id,
+            care_recipient_id=current_user["id"],
+            amount=amount,
+            currency=currency
+        )
+        chat_session_id = result.get("chat_session_id")
+        if result.get("already_paid"):
+            sys.stderr.write(f"[INFO] Payment already completed, returning existing chat session\n")
+            amount = result["booking"].get("amount") or amount
+            currency = result["booking"].get("currency") or currency
         else:
-            new_chat = supabase_admin.table("chat_sessions").insert({
-                "care_recipient_id": booking["care_recipient_id"],
-                "caregiver_id": booking["caregiver_id"],
-                "is_enabled": True,
-                "care_recipient_accepted": True,
-                "caregiver_accepted": True,
-                "enabled_at": datetime.now(timezone.utc).isoformat()
-            }).execute()
-            if new_chat.data:
-                chat_session_id = new_chat.data[0]["id"]
-        
-        # Update booking with chat_session_id
-        if chat_session_id:
-            supabase_admin.table("bookings").update({
-                "chat_session_id": chat_session_id
-            }).eq("id", request.booking_id).execute()
-        
-        # Mark caregiver as unavailable
-        try:
-            supabase_admin.table("caregiver_profiles").update({
-                "availability_status": "unavailable"
-            }).eq("caregiver_id", booking["caregiver_id"]).execute()
-        except Exception as e:
-            sys.stderr.write(f"[WARN] Could not update caregiver availability: {e}\n")
-            sys.stderr.flush()
-        
-        # Send notifications
-        try:
-            from app.services.notifications import notify_chat_enabled
-            care_recipient_response = supabase_admin.table("users").select("full_name").eq("id", booking["care_recipient_id"]).single().execute()
-            caregiver_response = supabase_admin.table("users").select("full_name").eq("id", booking["caregiver_id"]).single().execute()
-            
-            care_recipient_name = care_recipient_response.data.get("full_name", "Care recipient") if care_recipient_response.data else "Care recipient"
-            caregiver_name = caregiver_response.data.get("full_name", "Caregiver") if caregiver_response.data else "Caregiver"
-            
-            await notify_chat_enabled(
-                user_id=booking["care_recipient_id"],
-                other_party_name=caregiver_name,
-                chat_session_id=chat_session_id
-            )
-            await notify_chat_enabled(
-                user_id=booking["caregiver_id"],
-                other_party_name=care_recipient_name,
-                chat_session_id=chat_session_id
-            )
-        except Exception as notif_error:
-            sys.stderr.write(f"[WARN] Error sending chat enabled notification: {notif_error}\n")
-            sys.stderr.flush()
+            schedule_booking_paid_notifications(background_tasks, result)
         
         sys.stderr.write(f"[INFO] Chat enabled successfully. Chat Session ID: {chat_session_id}\n")
         sys.stderr.flush()
@@ -260,7 +266,8 @@ async def create_payment_order(
             amount=amount,
             currency=currency,
             key_id="bypass",
-            booking_id=request.booking_id
+            booking_id=request.booking_id,
+            chat_session_id=chat_session_id
         )
         
     except HTTPException:
@@ -280,6 +287,7 @@ async def create_payment_order(
 @router.post("/verify", response_model=PaymentVerificationResponse)
 async def verify_payment(
     request: VerifyPaymentRequest,
+    background_tasks: BackgroundTasks,
     current_user: dict = Depends(get_current_user)
 ):
     """
@@ -291,8 +299,8 @@ async def verify_payment(
     sys.stderr.write(f"[INFO] Order ID: {request.razorpay_order_id}, Payment ID: {request.razorpay_payment_id}\n")
     sys.stderr.flush()
     
-    razorpay_client = get_razorpay_client()
-    if not razorpay_client:
+    gateway = get_payment_gateway()
+    if not gateway.is_configured:
         raise HTTPException(
             status_code=status.HTTP_503_SERVICE_UNAVAILABLE,
             detail="Payment service is not configured"
@@ -321,14 +329,7 @@ async def verify_payment(
             )
         
         # Verify Razorpay signature
-        message = f"{request.razorpay_order_id}|{request.razorpay_payment_id}"
-        generated_signature = hmac.new(
-            settings.RAZORPAY_KEY_SECRET.encode(),
-            message.encode(),
-            hashlib.sha256
-        ).hexdigest()
-        
-        if generated_signature != request.razorpay_signature:
+        if not gateway.verify_payment_signature(request.razorpay_order_id, request.razorpay_payment_id, request.razorpay_signature):
             sys.stderr.write(f"[ERROR] Payment signature verification failed for order {request.razorpay_order_id}\n")
             sys.stderr.flush()
             raise HTTPException(
@@ -336,125 +337,35 @@ async def verify_payment(
                 detail="Invalid payment signature"
             )
         
-        # Verify payment with Razorpay API
+        # Verify payment with Razorpay API (async, pooled connection, retried on transient errors)
         try:
-            client = get_razorpay_client()
-            if not client:
-                raise HTTPException(
-                    status_code=status.HTTP_503_SERVICE_UNAVAILABLE,
-                    detail="Payment service is not configured."
-                )
-            payment = client.payment.fetch(request.razorpay_payment_id)
-            sys.stderr.write(f"[INFO] Payment fetched from Razorpay: {payment.get('status')}\n")
-            sys.stderr.flush()
-            
-            if payment.get("status") != "captured" and payment.get("status") != "authorized":
-                raise HTTPException(
-                    status_code=status.HTTP_400_BAD_REQUEST,
-                    detail=f"Payment not successful. Status: {payment.get('status')}"
-                )
-        except Exception as razorpay_error:
+            payment = await gateway.fetch_payment(request.razorpay_payment_id)
+        except PaymentGatewayError as razorpay_error:
             sys.stderr.write(f"[ERROR] Error fetching payment from Razorpay: {razorpay_error}\n")
             sys.stderr.flush()
             raise HTTPException(
                 status_code=status.HTTP_400_BAD_REQUEST,
                 detail=f"Failed to verify payment with Razorpay: {str(razorpay_error)}"
             )
+        sys.stderr.write(f"[INFO] Payment fetched from Razorpay: {payment.get('status')}\n")
+        sys.stderr.flush()
         
-        # Update booking with payment information
-        update_data = {
-            "payment_status": "completed",
-            "razorpay_payment_id": request.razorpay_payment_id,
-            "razorpay_signature": request.razorpay_signature,
-            "payment_completed_at": datetime.now(timezone.utc).isoformat(),
-            "status": "accepted",  # Update booking status to accepted
-            "accepted_at": datetime.now(timezone.utc).isoformat()
-        }
-        
-        booking_update_response = supabase_admin.table("bookings").update(update_data).eq("id", booking["id"]).execute()
-        
-        if not booking_update_response.data:
+        if payment.get("status") != "captured" and payment.get("status") != "authorized":
             raise HTTPException(
-                status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
-                detail="Failed to update booking"
+                status_code=status.HTTP_400_BAD_REQUEST,
+                detail=f"Payment not successful. Status: {payment.get('status')}"
             )
         
-        updated_booking = booking_update_response.data[0]
-        
-        # Initialize chat_session_id variable
-        chat_session_id = None
-        
-        # Enable chat session and mark caregiver as unavailable
-        if updated_booking.get("caregiver_id"):
-            caregiver_id_str = str(updated_booking["caregiver_id"])
-            
-            # Mark caregiver as unavailable
-            try:
-                profile_check = supabase_admin.table("caregiver_profile").select("id").eq("user_id", caregiver_id_str).execute()
-                if profile_check.data and len(profile_check.data) > 0:
-                    supabase_admin.table("caregiver_profile").update({
-                        "availability_status": "unavailable"
-                    }).eq("user_id", caregiver_id_str).execute()
-                else:
-                    supabase_admin.table("caregiver_profile").insert({
-                        "user_id": caregiver_id_str,
-                        "availability_status": "unavailable"
-                    }).execute()
-            except Exception as avail_error:
-                sys.stderr.write(f"[WARN] Error updating caregiver availability: {avail_error}\n")
-                sys.stderr.flush()
-            
-            # Enable chat session
-            chat_check = supabase_admin.table("chat_sessions").select("*").eq("care_recipient_id", booking["care_recipient_id"]).eq("caregiver_id", updated_booking["caregiver_id"]).execute()
-            
-            if chat_check.data and len(chat_check.data) > 0:
-                chat_session_id = chat_check.data[0]["id"]
-                supabase_admin.table("chat_sessions").update({
-                    "is_enabled": True,
-                    "care_recipient_accepted": True,
-                    "caregiver_accepted": True,
-                    "enabled_at": datetime.now(timezone.utc).isoformat()
-                }).eq("id", chat_session_id).execute()
-            else:
-                new_chat = supabase_admin.table("chat_sessions").insert({
-                    "care_recipient_id": booking["care_recipient_id"],
-                    "caregiver_id": updated_booking["caregiver_id"],
-                    "is_enabled": True,
-                    "care_recipient_accepted": True,
-                    "caregiver_accepted": True,
-                    "enabled_at": datetime.now(timezone.utc).isoformat()
-                }).execute()
-                if new_chat.data:
-                    chat_session_id = new_chat.data[0]["id"]
-            
-            # Update booking with chat_session_id
-            if chat_session_id and not updated_booking.get("chat_session_id"):
-                supabase_admin.table("bookings").update({
-                    "chat_session_id": chat_session_id
-                }).eq("id", booking["id"]).execute()
-            
-            # Send notifications
-            try:
-                from app.services.notifications import notify_chat_enabled
-                care_recipient_response = supabase_admin.table("users").select("full_name").eq("id", booking["care_recipient_id"]).single().execute()
-                caregiver_response = supabase_admin.table("users").select("full_name").eq("id", updated_booking["caregiver_id"]).single().execute()
-                
-                care_recipient_name = care_recipient_response.data.get("full_name", "Care recipient") if care_recipient_response.data else "Care recipient"
-                caregiver_name = caregiver_response.data.get("full_name", "Caregiver") if caregiver_response.data else "Caregiver"
-                
-                await notify_chat_enabled(
-                    user_id=booking["care_recipient_id"],
-                    other_party_name=caregiver_name,
-                    chat_session_id=chat_session_id
-                )
-                await notify_chat_enabled(
-                    user_id=updated_booking["caregiver_id"],
-                    other_party_name=care_recipient_name,
-                    chat_session_id=chat_session_id
-                )
-            except Exception as notif_error:
-                sys.stderr.write(f"[WARN] Error sending notifications: {notif_error}\n")
-                sys.stderr.flush()
+        # Update booking with payment information, mark the caregiver unavailable
+        # and enable chat in one idempotent database call; notify afterwards
+        result = mark_booking_paid(
+            booking["id"],
+            razorpay_payment_id=request.razorpay_payment_id,
+            razorpay_signature=request.razorpay_signature,
+            ledger_source="verify"
+        )
+        chat_session_id = result.get("chat_session_id")
+        schedule_booking_paid_notifications(background_tasks, result)
         
         sys.stderr.write(f"[INFO] Payment verified successfully for booking {booking['id']}\n")
         sys.stderr.flush()
@@ -479,79 +390,108 @@ async def verify_payment(
         )
 
 
+@router.get("/balance")
+async def get_payment_balance(current_user: dict = Depends(get_current_user)):
+    """
+    The current user's payment totals from payment_balances, one row per role
+    and currency: earnings for caregivers, spend for care recipients. The rows
+    are maintained as ledger entries are appended, so this is a single read.
+    """
+    try:
+        response = await asyncio.to_thread(
+            lambda: supabase_admin.table("payment_balances").select(
+                "role, currency, total_paid, total_refunded, balance, entry_count, last_entry_at"
+            ).eq("user_id", current_user["id"]).execute()
+        )
+        return {"balances": response.data or []}
+    except Exception as e:
+        raise HTTPException(
+            status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
+            detail=str(e)
+        )
+
+
+@router.get("/ledger")
+async def get_payment_ledger(
+    limit: int = Query(50, ge=1, le=100),
+    offset: int = Query(0, ge=0),
+    current_user: dict = Depends(get_current_user)
+):
+    """Ledger entries the current user is a party to, newest first"""
+    user_id = current_user["id"]
+    try:
+        response = await asyncio.to_thread(
+            lambda: supabase_admin.table("payment_ledger").select(
+                "id, entry_type, booking_id, care_recipient_id, caregiver_id, amount, currency, razorpay_order_id, source, created_at"
+            ).or_(f"care_recipient_id.eq.{user_id},caregiver_id.eq.{user_id}").order(
+                "created_at", desc=True
+            ).range(offset, offset + limit - 1).execute()
+        )
+        return {"entries": response.data or [], "limit": limit, "offset": offset}
+    except Exception as e:
+        raise HTTPException(
+            status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
+            detail=str(e)
+        )
+
+
 @router.post("/webhook")
 async def razorpay_webhook(
-    request: Dict[str, Any],
-    x_razorpay_signature: Optional[str] = Header(None, alias="X-Razorpay-Signature")
+    request: Request,
+    x_razorpay_signature: Optional[str] = Header(None, alias="X-Razorpay-Signature"),
+    x_razorpay_event_id: Optional[str] = Header(None, alias="X-Razorpay-Event-Id")
 ):
     """
     Razorpay webhook endpoint for payment status updates.
     This endpoint is called by Razorpay when payment events occur.
+    
+    The event is only verified and stored here; the payment webhook worker
+    applies it to the booking. Redeliveries of a stored event are acknowledged
+    without being stored again.
     """
-    razorpay_client = get_razorpay_client()
-    if not razorpay_client:
+    import sys
+    body = await request.body()
+    
+    if not x_razorpay_signature:
         raise HTTPException(
-            status_code=status.HTTP_503_SERVICE_UNAVAILABLE,
-            detail="Payment service is not configured"
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail="Missing Razorpay signature"
+        )
+    if not verify_webhook_signature(body, x_razorpay_signature):
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail="Invalid Razorpay signature"
         )
     
     try:
-        # Verify webhook signature
-        webhook_secret = settings.RAZORPAY_KEY_SECRET
-        received_signature = x_razorpay_signature
-        
-        if not received_signature:
-            raise HTTPException(
-                status_code=status.HTTP_400_BAD_REQUEST,
-                detail="Missing Razorpay signature"
-            )
-        
-        # Razorpay webhook signature verification
-        # Note: This is a simplified version. In production, use Razorpay's webhook verification library
-        import sys
-        sys.stderr.write(f"[INFO] Received Razorpay webhook: {request.get('event')}\n")
-        sys.stderr.flush()
-        
-        event = request.get("event")
-        payload = request.get("payload", {}).get("payment", {}).get("entity", {})
-        
-        if event == "payment.captured":
-            payment_id = payload.get("id")
-            order_id = payload.get("order_id")
-            
-            sys.stderr.write(f"[INFO] Payment captured: {payment_id} for order: {order_id}\n")
-            sys.stderr.flush()
-            
-            # Update booking if payment is captured
-            if order_id:
-                booking_response = supabase_admin.table("bookings").select("*").eq("razorpay_order_id", order_id).execute()
-                
-                if booking_response.data and len(booking_response.data) > 0:
-                    booking = booking_response.data[0]
-                    
-                    # Only update if payment status is not already completed
-                    if booking.get("payment_status") != "completed":
-                        supabase_admin.table("bookings").update({
-                            "payment_status": "completed",
-                            "razorpay_payment_id": payment_id,
-                            "payment_completed_at": datetime.now(timezone.utc).isoformat(),
-                            "status": "accepted",
-                            "accepted_at": datetime.now(timezone.utc).isoformat()
-                        }).eq("id", booking["id"]).execute()
-                        
-                        sys.stderr.write(f"[INFO] Booking {booking['id']} updated via webhook\n")
-                        sys.stderr.flush()
-        
-        return {"status": "success"}
+        event = json.loads(body)
+    except ValueError:
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail="Invalid webhook payload"
+        )
+    if not isinstance(event, dict):
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail="Invalid webhook payload"
+        )
+    
+    event_id = x_razorpay_event_id or event.get("id") or hashlib.sha256(body).hexdigest()
     
+    try:
+        stored = await store_event(event_id, event)
     except Exception as e:
-        import traceback
-        import sys
-        sys.stderr.write(f"[ERROR] Error processing webhook: {e}\n")
-        traceback.print_exc(file=sys.stderr)
+        # Not stored, so not acknowledged: Razorpay retries the delivery
+        sys.stderr.write(f"[ERROR] Could not store webhook event {event_id}: {e!r}\n")
         sys.stderr.flush()
         raise HTTPException(
-            status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
-            detail=f"Webhook processing failed: {str(e)}"
+            status_code=status.HTTP_503_SERVICE_UNAVAILABLE,
+            detail="Webhook could not be stored, retry later"
         )
-
+    
+    if stored:
+        sys.stderr.write(f"[INFO] Stored Razorpay webhook {event_id}: {event.get('event')}\n")
+        sys.stderr.flush()
+        wake_worker()
+    
+    return {"status": "success"}
@@ -1,15 +1,21 @@
-from fastapi import APIRouter, HTTPException, status, Depends
+from fastapi import APIRouter, HTTPException, status, Depends, Header, Response
 from datetime import datetime
+from typing import Optional
 from app.schemas import UserUpdate, UserResponse
 from app.database import supabase, supabase_admin
 from app.dependencies import get_current_user, get_user_id
+from app.services.etag import etag_matches, not_modified, weak_etag
 
 router = APIRouter()
 
 
 @router.get("/profile", response_model=UserResponse)
-async def get_profile(current_user: dict = Depends(get_current_user)):
-    """Get current user profile"""
+async def get_profile(
+    response: Response,
+    if_none_match: Optional[str] = Header(None),
+    current_user: dict = Depends(get_current_user)
+):
+    """Get current user profile (weak ETag / If-None-Match supported)"""
     try:
         user_id = get_user_id(current_user)
         if not user_id:
@@ -21,16 +27,24 @@ async def get_profile(current_user: dict = Depends(get_current_user)):
         # Convert to string to ensure proper matching
         user_id_str = str(user_id)
         
+        etag = None
+        if if_none_match:
+            version_response = supabase_admin.table("users").select("updated_at").eq("id", user_id_str).limit(1).execute()
+            if version_response.data:
+                etag = weak_etag(user_id_str, version_response.data[0].get("updated_at"))
+                if etag_matches(if_none_match, etag):
+                    return not_modified(etag)
+        
         # Try with regular supabase first, fallback to admin if needed
         try:
-            response = supabase.table("users").select("*").eq("id", user_id_str).single().execute()
+            user_response = supabase.table("users").select("*").eq("id", user_id_str).single().execute()
         except Exception as query_error:
             error_msg = str(query_error).lower()
             # If it's a "not found" error, try with admin client
             if "not found" in error_msg or "0 rows" in error_msg or "pgrst116" in error_msg:
                 # Try with admin client to bypass RLS
                 try:
-                    response = supabase_admin.table("users").select("*").eq("id", user_id_str).single().execute()
+                    user_response = supabase_admin.table("users").select("*").eq("id", user_id_str).single().execute()
                 except Exception as admin_error:
                     raise HTTPException(
                         status_code=status.HTTP_404_NOT_FOUND,
@@ -39,17 +53,20 @@ async def get_profile(current_user: dict = Depends(get_current_user)):
             else:
                 raise
         
-        if not response.data:
+        if not user_response.data:
             raise HTTPException(
                 status_code=status.HTTP_404_NOT_FOUND,
                 detail="User profile not found"
             )
         
         # Ensure emergency_contact is set to None if not present (for backward compatibility)
-        user_data = response.data[0] if isinstance(response.data, list) else response.data
+        user_data = user_response.data[0] if isinstance(user_response.data, list) else user_response.data
         if 'emergency_contact' not in user_data:
             user_data['emergency_contact'] = None
         
+        # The row was just read, so its own updated_at gives the tag
+        response.headers["ETag"] = etag or weak_etag(user_id_str, user_data.get("updated_at"))
+        
         # Convert the response to UserResponse model to ensure proper serialization
         return UserResponse(**user_data)
     except HTTPException:
@@ -147,6 +147,22 @@ class BookingUpdate(BaseModel):
     status: Optional[str] = None
 
 
+class BookingBulkCreate(BaseModel):
+    bookings: List[BookingCreate] = Field(..., min_length=1, max_length=100)
+
+
+class BookingBulkStatusUpdate(BaseModel):
+    booking_ids: List[UUID] = Field(..., min_length=1, max_length=100)
+    status: str = Field(..., pattern="^(pending|accepted|declined|cancelled|in_progress|completed)$")
+
+
+class OccurrenceExceptionUpdate(BaseModel):
+    occurrence_start: datetime  # Start of the occurrence according to the recurring pattern
+    is_cancelled: bool = False
+    scheduled_date: Optional[datetime] = None
+    duration_hours: Optional[float] = Field(default=None, ge=0.5, le=24.0)
+
+
 class BookingResponse(BaseModel):
     id: UUID
     care_recipient_id: UUID
@@ -230,6 +246,24 @@ class NotificationResponse(BaseModel):
         from_attributes = True
 
 
+class NotificationBulkRequest(BaseModel):
+    notification_ids: List[UUID] = Field(..., min_length=1, max_length=500)
+
+
+class NotificationPreferencesUpdate(BaseModel):
+    push_disabled_types: Optional[List[str]] = None
+    quiet_hours_start: Optional[str] = Field(default=None, pattern="^([01][0-9]|2[0-3]):[0-5][0-9]$")
+    quiet_hours_end: Optional[str] = Field(default=None, pattern="^([01][0-9]|2[0-3]):[0-5][0-9]$")
+    timezone: Optional[str] = None
+
+
+class NotificationPreferencesResponse(BaseModel):
+    push_disabled_types: List[str]
+    quiet_hours_start: Optional[str] = None
+    quiet_hours_end: Optional[str] = None
+    timezone: str
+
+
 class DeviceTokenCreate(BaseModel):
     device_token: str
     platform: str = Field(..., pattern="^(ios|android|web)$")
@@ -0,0 +1,72 @@
+"""
+Caregiver double-booking detection.
+
+Bookings carry a `time_range` column covered by a GiST exclusion constraint
+(database/migrations/add_booking_time_range.sql), so overlapping active
+bookings for the same caregiver are rejected by the database itself and an
+overlap lookup is a single index probe.
+"""
+from datetime import datetime, timedelta, timezone
+from typing import Any, Dict, List, Optional
+
+from fastapi import HTTPException, status
+
+from app.database import supabase_admin
+
+# Bookings in these states hold the caregiver's time
+ACTIVE_BOOKING_STATUSES = ["pending", "accepted", "in_progress"]
+
+OVERLAP_CONSTRAINT = "bookings_no_caregiver_overlap"
+
+
+def booking_window(scheduled_date: datetime, duration_hours: Optional[float]) -> tuple:
+    """(start, end) of a booking; naive datetimes are taken as UTC."""
+    if scheduled_date.tzinfo is None:
+        scheduled_date = scheduled_date.replace(tzinfo=timezone.utc)
+    hours = float(duration_hours) if duration_hours is not None else 2.0
+    return scheduled_date, scheduled_date + timedelta(hours=hours)
+
+
+def find_conflicts(
+    caregiver_id: str,
+    start: datetime,
+    end: datetime,
+    exclude_booking_id: Optional[str] = None,
+    limit: int = 5
+) -> List[Dict[str, Any]]:
+    """Active bookings of the caregiver that overlap [start, end)."""
+    query = supabase_admin.table("bookings").select(
+        "id, scheduled_date, duration_hours, status"
+    ).eq("caregiver_id", str(caregiver_id)).in_(
+        "status", ACTIVE_BOOKING_STATUSES
+    ).ov("time_range", f"[{start.isoformat()},{end.isoformat()})")
+    if exclude_booking_id:
+        query = query.neq("id", str(exclude_booking_id))
+    response = query.order("scheduled_date").limit(limit).execute()
+    return response.data or []
+
+
+def is_overlap_error(error: Exception) -> bool:
+    """True if a database error came from the caregiver overlap constraint."""
+    error_msg = str(error)
+    return OVERLAP_CONSTRAINT in error_msg or "23P01" in error_msg
+
+
+def overlap_http_exception(
+    caregiver_id: str,
+    start: datetime,
+    end: datetime,
+    exclude_booking_id: Optional[str] = None
+) -> HTTPException:
+    """409 response naming the booking times that block the requested slot."""
+    detail = "Caregiver already has a booking during this time"
+    try:
+        conflicts = find_conflicts(caregiver_id, start, end, exclude_booking_id)
+    except Exception:
+        conflicts = []
+    if conflicts:
+        taken = ", ".join(
+            f"{c['scheduled_date']} ({c.get('duration_hours')}h)" for c in conflicts
+        )
+        detail = f"{detail}: {taken}"
+    return HTTPException(status_code=status.HTTP_409_CONFLICT, detail=detail)
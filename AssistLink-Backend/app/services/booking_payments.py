@@ -0,0 +1,133 @@
+"""
+Shared "booking paid" operation used by every payment path.
+
+The database side (booking update, caregiver availability, chat session) runs
+in the `mark_booking_paid` function from
+database/migrations/add_mark_booking_paid_function.sql in a single round-trip.
+Chat-enabled notifications are sent afterwards, in the background.
+"""
+from typing import Any, Dict, Optional
+
+from fastapi import BackgroundTasks, HTTPException, status
+
+from app.database import supabase_admin
+from app.services.booking_transitions import transition_scheduler
+from app.services.dashboard_cache import invalidate_users
+from app.services.notifications import notify_chat_enabled
+
+
+def mark_booking_paid(
+    booking_id: str,
+    care_recipient_id: Optional[str] = None,
+    razorpay_payment_id: Optional[str] = None,
+    razorpay_signature: Optional[str] = None,
+    amount: Optional[float] = None,
+    currency: Optional[str] = None,
+    ledger_source: Optional[str] = None
+) -> Dict[str, Any]:
+    """
+    Mark a booking as paid and apply its side effects atomically.
+
+    Idempotent: a booking that is already paid comes back unchanged with
+    `already_paid` set. Pass `care_recipient_id` to have ownership checked in
+    the same round-trip. With `ledger_source` ('verify', 'webhook', ...) the
+    payment is also appended to payment_ledger in the same transaction (see
+    database/migrations/add_payment_ledger.sql); the bypass flow passes none.
+
+    Returns dict with booking, already_paid, chat_session_id,
+    care_recipient_name and caregiver_name.
+    """
+    params = {
+        "p_booking_id": str(booking_id),
+        "p_care_recipient_id": str(care_recipient_id) if care_recipient_id else None,
+        "p_razorpay_payment_id": razorpay_payment_id,
+        "p_razorpay_signature": razorpay_signature,
+        "p_amount": amount,
+        "p_currency": currency
+    }
+    if ledger_source:
+        params["p_ledger_source"] = ledger_source
+    try:
+        response = supabase_admin.rpc("mark_booking_paid", params).execute()
+    except Exception as e:
+        error_msg = str(e)
+        if "booking_not_found" in error_msg or "invalid input syntax for type uuid" in error_msg:
+            raise HTTPException(
+                status_code=status.HTTP_404_NOT_FOUND,
+                detail="Booking not found"
+            )
+        if "access_denied" in error_msg:
+            raise HTTPException(
+                status_code=status.HTTP_403_FORBIDDEN,
+                detail="Only care recipient can complete payment"
+            )
+        raise
+
+    if not response.data or not response.data.get("booking"):
+        raise HTTPException(
+            status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
+            detail="Failed to update booking"
+        )
+    if not response.data.get("already_paid"):
+        booking = response.data["booking"]
+        transition_scheduler.schedule_booking(booking)
+        invalidate_users(booking.get("care_recipient_id"), booking.get("caregiver_id"))
+    return response.data
+
+
+async def notify_booking_paid(result: Dict[str, Any]) -> None:
+    """Tell both parties that chat is enabled for a newly paid booking."""
+    import sys
+    booking = result["booking"]
+    chat_session_id = result.get("chat_session_id")
+    if result.get("already_paid") or not booking.get("caregiver_id") or not chat_session_id:
+        return
+    try:
+        await notify_chat_enabled(
+            user_id=booking["care_recipient_id"],
+            other_party_name=result.get("caregiver_name") or "Caregiver",
+            chat_session_id=chat_session_id
+        )
+        await notify_chat_enabled(
+            user_id=booking["caregiver_id"],
+            other_party_name=result.get("care_recipient_name") or "Care recipient",
+            chat_session_id=chat_session_id
+        )
+    except Exception as notif_error:
+        sys.stderr.write(f"[WARN] Error sending chat enabled notification: {notif_error}\n")
+        sys.stderr.flush()
+
+
+def schedule_booking_paid_notifications(background_tasks: BackgroundTasks, result: Dict[str, Any]) -> None:
+    """Queue the paid-booking notifications to run after the response is sent."""
+    if not result.get("already_paid"):
+        background_tasks.add_task(notify_booking_paid, result)
+
+
+def record_booking_refund(booking_id: str, razorpay_refund_id: str, amount: float, source: str) -> Dict[str, Any]:
+    """
+    Append a refund to the payment ledger through the `record_booking_refund`
+    function (database/migrations/add_payment_ledger.sql). Idempotent per
+    refund id; the booking becomes 'refunded' once refunds cover its amount.
+
+    Returns dict with booking and recorded (False for a refund already recorded).
+    """
+    try:
+        response = supabase_admin.rpc("record_booking_refund", {
+            "p_booking_id": str(booking_id),
+            "p_razorpay_refund_id": razorpay_refund_id,
+            "p_amount": amount,
+            "p_source": source
+        }).execute()
+    except Exception as e:
+        if "booking_not_found" in str(e):
+            raise HTTPException(
+                status_code=status.HTTP_404_NOT_FOUND,
+                detail="Booking not found"
+            )
+        raise
+    result = response.data or {}
+    if result.get("recorded"):
+        booking = result.get("booking") or {}
+        invalidate_users(booking.get("care_recipient_id"), booking.get("caregiver_id"))
+    return result
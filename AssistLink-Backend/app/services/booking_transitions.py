@@ -0,0 +1,199 @@
+"""
+Automatic booking and video call state transitions.
+
+Pending transitions live in an in-memory HierarchicalTimingWheel, so thousands
+of timers cost O(1) per tick instead of a periodic scan of the bookings table.
+Each timer is also persisted in `scheduled_transitions`
+(database/migrations/add_scheduled_transitions.sql) and reloaded on startup.
+
+    booking_start   accepted -> in_progress at scheduled_date
+    booking_end     accepted/in_progress -> completed at scheduled_date + duration_hours
+    video_call_end  accepted -> completed at scheduled_time + VIDEO_CALL_DURATION_SECONDS
+
+Transitions are conditional updates (they only apply from the expected
+status), so a timer that fires after a manual change, or on several app
+instances, is harmless. The wheel is not thread-safe and timers are also
+scheduled from worker threads (payment webhooks, reconciliation), so every
+wheel access goes through the scheduler's lock. Recurring bookings are not scheduled: their template
+row stays accepted for the life of the series. Neither are video_call_session
+bookings: their scheduled_date is the (usually past) call time with no
+duration, so they would complete right after payment, together with the chat
+they paid for.
+"""
+import asyncio
+import sys
+import threading
+import time
+from datetime import datetime, timedelta, timezone
+from typing import Any, Dict, List, Optional, Tuple
+
+from app.config import settings
+from app.database import supabase_admin
+from app.services.dashboard_cache import invalidate_users
+from app.services.freebusy import invalidate_caregiver
+from app.services.recurrence import parse_datetime
+from app.services.timing_wheel import HierarchicalTimingWheel
+
+KINDS = ("booking_start", "booking_end", "video_call_end")
+
+
+class TransitionScheduler:
+    def __init__(self):
+        self._wheel = HierarchicalTimingWheel(
+            tick_seconds=settings.TRANSITION_TICK_SECONDS,
+            wheel_size=settings.TRANSITION_WHEEL_SIZE,
+            levels=settings.TRANSITION_WHEEL_LEVELS,
+            start_time=time.time()
+        )
+        self._loaded = False
+        self._lock = threading.Lock()
+
+    def __len__(self) -> int:
+        with self._lock:
+            return len(self._wheel)
+
+    # Scheduling
+
+    def _schedule(self, timers: List[Tuple[str, str, datetime]]) -> None:
+        """Persist timers with one upsert, then add them to the wheel."""
+        if not timers:
+            return
+        try:
+            supabase_admin.table("scheduled_transitions").upsert([
+                {"kind": kind, "target_id": target_id, "fire_at": fire_at.isoformat()}
+                for kind, target_id, fire_at in timers
+            ], on_conflict="kind,target_id").execute()
+        except Exception as e:
+            sys.stderr.write(f"[WARN] Could not persist transition timers: {e}\n")
+            sys.stderr.flush()
+        with self._lock:
+            for kind, target_id, fire_at in timers:
+                self._wheel.add(f"{kind}:{target_id}", fire_at.timestamp(), (kind, target_id))
+
+    def schedule_booking(self, booking: Dict[str, Any]) -> None:
+        """Schedule start/end transitions for an accepted, non-recurring, non-video-call booking."""
+        self.schedule_bookings([booking])
+
+    def schedule_bookings(self, bookings: List[Dict[str, Any]]) -> None:
+        """schedule_booking for several bookings, persisted with one upsert."""
+        timers = []
+        for booking in bookings:
+            if booking.get("is_recurring") or booking.get("status") not in ("accepted", "in_progress"):
+                continue
+            if booking.get("service_type") == "video_call_session":
+                continue
+            booking_id = str(booking["id"])
+            start = parse_datetime(booking["scheduled_date"])
+            end = start + timedelta(hours=float(booking.get("duration_hours") or 2.0))
+            timers.append(("booking_end", booking_id, end))
+            if booking["status"] == "accepted":
+                timers.append(("booking_start", booking_id, start))
+        self._schedule(timers)
+
+    def schedule_video_call_end(self, video_call: Dict[str, Any]) -> None:
+        """Schedule completion of an accepted video call."""
+        if video_call.get("status") != "accepted" or video_call.get("completed_at"):
+            return
+        fire_at = parse_datetime(video_call["scheduled_time"]) + timedelta(seconds=settings.VIDEO_CALL_DURATION_SECONDS)
+        self._schedule([("video_call_end", str(video_call["id"]), fire_at)])
+
+    def cancel_booking(self, booking_id: str) -> None:
+        """Drop a booking's timers (after it is completed or cancelled by hand)."""
+        self.cancel_bookings([booking_id])
+
+    def cancel_bookings(self, booking_ids: List[str]) -> None:
+        """cancel_booking for several bookings, removed with one delete."""
+        with self._lock:
+            removed = [
+                str(booking_id) for booking_id in booking_ids
+                if any([self._wheel.cancel(f"{kind}:{booking_id}") for kind in ("booking_start", "booking_end")])
+            ]
+        if removed:
+            try:
+                supabase_admin.table("scheduled_transitions").delete().in_("target_id", removed).in_("kind", ["booking_start", "booking_end"]).execute()
+            except Exception as e:
+                sys.stderr.write(f"[WARN] Could not delete transition timers for bookings {removed}: {e}\n")
+                sys.stderr.flush()
+
+    # Loading and firing
+
+    @staticmethod
+    def _fetch_persisted(page_size: int = 1000) -> List[Dict[str, Any]]:
+        rows: List[Dict[str, Any]] = []
+        while True:
+            response = supabase_admin.table("scheduled_transitions").select(
+                "kind, target_id, fire_at"
+            ).order("fire_at").range(len(rows), len(rows) + page_size - 1).execute()
+            page = response.data or []
+            rows.extend(page)
+            if len(page) < page_size:
+                return rows
+
+    def _apply(self, fired: List[Tuple[str, str]]) -> Dict[str, int]:
+        """Apply fired transitions with one conditional update per kind, then forget their rows."""
+        by_kind: Dict[str, List[str]] = {kind: [] for kind in KINDS}
+        for kind, target_id in fired:
+            by_kind[kind].append(target_id)
+        now = datetime.now(timezone.utc).isoformat()
+        applied: Dict[str, int] = {}
+
+        if by_kind["booking_start"]:
+            response = supabase_admin.table("bookings").update({"status": "in_progress"}).in_("id", by_kind["booking_start"]).eq("status", "accepted").execute()
+            applied["booking_start"] = len(response.data or [])
+            for booking in response.data or []:
+                invalidate_users(booking.get("care_recipient_id"), booking.get("caregiver_id"))
+
+        if by_kind["booking_end"]:
+            response = supabase_admin.table("bookings").update({
+                "status": "completed",
+                "completed_at": now
+            }).in_("id", by_kind["booking_end"]).in_("status", ["accepted", "in_progress"]).execute()
+            applied["booking_end"] = len(response.data or [])
+            for booking in response.data or []:
+                invalidate_caregiver(booking.get("caregiver_id"))
+                invalidate_users(booking.get("care_recipient_id"), booking.get("caregiver_id"))
+
+        if by_kind["video_call_end"]:
+            response = supabase_admin.table("video_call_requests").update({
+                "status": "completed",
+                "completed_at": now
+            }).in_("id", by_kind["video_call_end"]).eq("status", "accepted").is_("completed_at", "null").execute()
+            applied["video_call_end"] = len(response.data or [])
+            for video_call in response.data or []:
+                invalidate_users(video_call.get("care_recipient_id"), video_call.get("caregiver_id"))
+
+        for kind, target_ids in by_kind.items():
+            if target_ids:
+                supabase_admin.table("scheduled_transitions").delete().eq("kind", kind).in_("target_id", target_ids).execute()
+        return {kind: count for kind, count in applied.items() if count}
+
+    async def tick(self) -> Optional[dict]:
+        """Advance the wheel to now and apply whatever fired. Called every tick by the job runner."""
+        loop = asyncio.get_running_loop()
+        summary: Dict[str, Any] = {}
+        if not self._loaded:
+            rows = await loop.run_in_executor(None, self._fetch_persisted)
+            with self._lock:
+                for row in rows:
+                    kind, target_id = row["kind"], str(row["target_id"])
+                    self._wheel.add(f"{kind}:{target_id}", parse_datetime(row["fire_at"]).timestamp(), (kind, target_id))
+            self._loaded = True
+            summary["loaded"] = len(rows)
+
+        with self._lock:
+            fired = [payload for _, payload in self._wheel.advance(time.time())]
+        if fired:
+            try:
+                summary.update(await loop.run_in_executor(None, self._apply, fired))
+            except Exception:
+                # Put them back so the next tick retries
+                retry_at = time.time() + settings.TRANSITION_RETRY_SECONDS
+                with self._lock:
+                    for kind, target_id in fired:
+                        if f"{kind}:{target_id}" not in self._wheel:
+                            self._wheel.add(f"{kind}:{target_id}", retry_at, (kind, target_id))
+                raise
+        return summary
+
+
+transition_scheduler = TransitionScheduler()
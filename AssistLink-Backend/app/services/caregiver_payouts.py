@@ -0,0 +1,237 @@
+"""
+Caregiver payout batches.
+
+compute_payout_batch() pays out every booking completed before the end of its
+period that was really paid (it has a 'payment' entry in payment_ledger, so
+bypass-flow bookings are left out) and is not yet in any batch: hourly_rate
+(from caregiver_profile) x duration_hours, in the booking's currency. The only
+lower bound is the start of the first batch ever (PAYOUT_START_DATE), so a
+booking paid after its day's batch ran (webhook worker, reconciliation) goes
+into the next batch without paying out the history before payouts began;
+payout_items keeps any booking from being paid twice. Tables come from
+database/migrations/add_caregiver_payouts.sql.
+
+Bookings are streamed through a server-side (named) cursor over the direct
+PostgreSQL connection (src/config/db.py) and handled PAYOUT_CHUNK_SIZE rows at
+a time: each chunk is priced in one loop, written to payout_items with one
+multi-row insert and folded into per-caregiver totals. Memory is
+bounded by the chunk size plus one total per caregiver, however many bookings
+the period has (see src/benchmark_payouts.py).
+
+The whole batch is written in one transaction under an advisory lock, so a
+batch is either complete or absent, two runs cannot overlap, and running a
+period again returns the existing batch instead of paying twice.
+"""
+import sys
+from datetime import datetime, timedelta, timezone
+from decimal import ROUND_HALF_UP, Decimal
+from typing import Any, Dict, Iterable, List, Optional, Tuple
+
+from psycopg2.extras import Json, execute_values
+
+from app.config import settings
+
+CENT = Decimal("0.01")
+DEFAULT_DURATION_HOURS = Decimal("2.00")  # as for booking_end transitions
+PAYOUT_LOCK_KEY = 7241001  # pg_advisory_xact_lock key shared by all payout runs
+
+# Rows: (booking_id, caregiver_id, currency, hourly_rate, duration_hours)
+ELIGIBLE_BOOKINGS_SQL = """
+    SELECT b.id, b.caregiver_id, COALESCE(b.currency, 'INR'), cp.hourly_rate, b.duration_hours
+    FROM bookings b
+    LEFT JOIN caregiver_profile cp ON cp.user_id = b.caregiver_id
+    WHERE b.status = 'completed'
+      AND b.payment_status = 'completed'
+      AND b.caregiver_id IS NOT NULL
+      AND b.completed_at >= %s AND b.completed_at < %s
+      AND EXISTS (SELECT 1 FROM payment_ledger pl WHERE pl.booking_id = b.id AND pl.entry_type = 'payment')
+      AND NOT EXISTS (SELECT 1 FROM payout_items pi WHERE pi.booking_id = b.id)
+"""
+
+
+class PayoutAccumulator:
+    """Per-caregiver totals over a stream of booking chunks."""
+
+    def __init__(self):
+        # (caregiver_id, currency) -> [amount, booking_count, hours]
+        self.totals: Dict[Tuple[str, str], List[Any]] = {}
+        self.booking_count = 0
+        self.missing_rate = 0
+
+    def add_chunk(self, rows: Iterable[Tuple[Any, ...]]) -> List[Tuple[Any, ...]]:
+        """
+        Price one chunk and add it to the totals. Returns the payout items
+        (booking_id, caregiver_id, hourly_rate, duration_hours, amount, currency);
+        bookings whose caregiver has no hourly_rate are skipped and counted.
+        """
+        items = []
+        totals = self.totals
+        for booking_id, caregiver_id, currency, rate, hours in rows:
+            if rate is None:
+                self.missing_rate += 1
+                continue
+            hours = DEFAULT_DURATION_HOURS if hours is None else Decimal(hours)
+            amount = (Decimal(rate) * hours).quantize(CENT, ROUND_HALF_UP)
+            items.append((booking_id, caregiver_id, rate, hours, amount, currency))
+            total = totals.get((caregiver_id, currency))
+            if total is None:
+                totals[(caregiver_id, currency)] = [amount, 1, hours]
+            else:
+                total[0] += amount
+                total[1] += 1
+                total[2] += hours
+        self.booking_count += len(items)
+        return items
+
+    def currency_totals(self) -> Dict[str, str]:
+        by_currency: Dict[str, Decimal] = {}
+        for (_, currency), (amount, _, _) in self.totals.items():
+            by_currency[currency] = by_currency.get(currency, Decimal("0")) + amount
+        return {currency: str(amount) for currency, amount in sorted(by_currency.items())}
+
+
+def compute_payout_batch(
+    period_start: datetime,
+    period_end: datetime,
+    chunk_size: Optional[int] = None,
+    dry_run: bool = False,
+    conn=None
+) -> Dict[str, Any]:
+    """
+    Compute and store the payout batch for [period_start, period_end). It
+    takes every eligible booking completed before period_end and since the
+    first batch's period_start, including ones from earlier periods that were
+    not paid yet when those batches ran. With
+    dry_run everything is computed and written, then rolled back. Pass `conn`
+    to use a specific connection (it is not returned to the pool).
+    """
+    from src.config.db import get_db_connection, return_db_connection
+
+    chunk_size = chunk_size or settings.PAYOUT_CHUNK_SIZE
+    own_connection = conn is None
+    if own_connection:
+        conn = get_db_connection()
+    try:
+        cur = conn.cursor()
+        cur.execute("SELECT pg_advisory_xact_lock(%s)", (PAYOUT_LOCK_KEY,))
+        cur.execute(
+            "SELECT id, booking_count, caregiver_count, totals FROM payout_batches WHERE period_start = %s AND period_end = %s",
+            (period_start, period_end)
+        )
+        existing = cur.fetchone()
+        if existing:
+            conn.rollback()
+            return {
+                "batch_id": str(existing[0]), "existing": True,
+                "bookings": existing[1], "caregivers": existing[2], "totals": existing[3]
+            }
+
+        cur.execute(
+            "INSERT INTO payout_batches (period_start, period_end) VALUES (%s, %s) RETURNING id",
+            (period_start, period_end)
+        )
+        batch_id = cur.fetchone()[0]
+        # The first batch's start, this one's if it is the first
+        cur.execute("SELECT MIN(period_start) FROM payout_batches")
+        payouts_start = cur.fetchone()[0]
+
+        accumulator = PayoutAccumulator()
+        chunks = 0
+        stream = conn.cursor(name="payout_stream")  # server-side: rows arrive itersize at a time
+        stream.itersize = chunk_size
+        stream.execute(ELIGIBLE_BOOKINGS_SQL, (payouts_start, period_end))
+        while True:
+            rows = stream.fetchmany(chunk_size)
+            if not rows:
+                break
+            items = accumulator.add_chunk(rows)
+            chunks += 1
+            if items:
+                execute_values(
+                    cur,
+                    "INSERT INTO payout_items (booking_id, batch_id, caregiver_id, hourly_rate, duration_hours, amount, currency) VALUES %s",
+                    [(booking_id, batch_id, caregiver_id, rate, hours, amount, currency)
+                     for booking_id, caregiver_id, rate, hours, amount, currency in items],
+                    page_size=chunk_size
+                )
+        stream.close()
+
+        if accumulator.totals:
+            execute_values(
+                cur,
+                "INSERT INTO caregiver_payouts (batch_id, caregiver_id, currency, amount, booking_count, hours) VALUES %s",
+                [(batch_id, caregiver_id, currency, amount, count, hours)
+                 for (caregiver_id, currency), (amount, count, hours) in accumulator.totals.items()],
+                page_size=chunk_size
+            )
+        totals = accumulator.currency_totals()
+        caregiver_count = len({caregiver_id for caregiver_id, _ in accumulator.totals})
+        cur.execute(
+            "UPDATE payout_batches SET booking_count = %s, caregiver_count = %s, totals = %s WHERE id = %s",
+            (accumulator.booking_count, caregiver_count, Json(totals), batch_id)
+        )
+
+        if dry_run:
+            conn.rollback()
+        else:
+            conn.commit()
+        summary = {
+            "batch_id": str(batch_id),
+            "bookings": accumulator.booking_count,
+            "caregivers": caregiver_count,
+            "totals": totals,
+            "chunks": chunks,
+        }
+        if accumulator.missing_rate:
+            summary["skipped_missing_rate"] = accumulator.missing_rate
+        if dry_run:
+            summary["dry_run"] = True
+        return summary
+    except Exception:
+        conn.rollback()
+        raise
+    finally:
+        if own_connection:
+            return_db_connection(conn)
+
+
+def _last_period_end() -> Optional[datetime]:
+    from src.config.db import execute_query
+
+    rows = execute_query("SELECT MAX(period_end) AS period_end FROM payout_batches")
+    return rows[0]["period_end"] if rows else None
+
+
+def run_daily_payouts() -> dict:
+    """
+    Periodic job: one batch per UTC day, catching up every day since the last
+    batch (the app was down, or PAYOUT_ENABLED was switched on later). The
+    first batch is for PAYOUT_START_DATE, or yesterday. Safe to run every
+    interval, a day's batch is only computed once.
+    """
+    today = datetime.now(timezone.utc).replace(hour=0, minute=0, second=0, microsecond=0)
+    last_end = _last_period_end()
+    if last_end:
+        day = last_end
+    elif settings.PAYOUT_START_DATE:
+        day = datetime.combine(settings.PAYOUT_START_DATE, datetime.min.time(), tzinfo=timezone.utc)
+    else:
+        day = today - timedelta(days=1)
+
+    batches = []
+    while day < today:
+        summary = compute_payout_batch(day, day + timedelta(days=1))
+        day += timedelta(days=1)
+        if summary.get("existing"):
+            continue
+        if summary.get("skipped_missing_rate"):
+            sys.stderr.write(f"[WARN] Payout batch {summary['batch_id']} skipped {summary['skipped_missing_rate']} bookings without an hourly_rate\n")
+            sys.stderr.flush()
+        batches.append(summary)
+    if not batches:
+        return {}
+    return {
+        "batches": len(batches),
+        "bookings": sum(batch["bookings"] for batch in batches),
+        "batch_ids": [batch["batch_id"] for batch in batches],
+    }
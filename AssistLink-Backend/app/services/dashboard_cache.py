@@ -0,0 +1,55 @@
+"""
+Per-user cache of dashboard payloads.
+
+Dashboard data only changes when a booking, video call or chat session of the
+user changes, but the app polls it every few seconds. Payloads (stats,
+upcoming, recurring, video calls, and the user's role) are cached per user and
+dropped by invalidate_users() from every write that touches those rows, so
+polls in between are served from memory. DASHBOARD_CACHE_SECONDS bounds how
+long time-relative payloads such as "upcoming" can be reused.
+
+Loaders may run in worker threads (see the /summary endpoint), so the cache is
+guarded by a lock. Each user also has a generation counter: a load that was
+already running when the user was invalidated is returned but not stored.
+"""
+import threading
+import time
+from typing import Any, Callable, Dict, Hashable, Optional, Tuple
+
+from app.config import settings
+
+# user_id -> {key: (expires_at monotonic, value)}
+_cache: Dict[str, Dict[Hashable, Tuple[float, Any]]] = {}
+# user_id -> number of invalidations so far
+_generations: Dict[str, int] = {}
+_lock = threading.Lock()
+
+
+def get_or_load(user_id: str, key: Hashable, loader: Callable[[], Any]) -> Any:
+    """Return the cached payload for (user_id, key), calling loader() on a miss."""
+    user_id = str(user_id)
+    now = time.monotonic()
+    with _lock:
+        entry = _cache.get(user_id, {}).get(key)
+        if entry and entry[0] > now:
+            return entry[1]
+        generation = _generations.get(user_id, 0)
+
+    value = loader()
+
+    with _lock:
+        if _generations.get(user_id, 0) == generation:
+            if user_id not in _cache and len(_cache) >= settings.DASHBOARD_CACHE_MAX_USERS:
+                _cache.clear()
+            _cache.setdefault(user_id, {})[key] = (now + settings.DASHBOARD_CACHE_SECONDS, value)
+    return value
+
+
+def invalidate_users(*user_ids: Optional[str]) -> None:
+    """Drop cached dashboard payloads for every given user (None is ignored)."""
+    with _lock:
+        for user_id in user_ids:
+            if user_id:
+                user_id = str(user_id)
+                _cache.pop(user_id, None)
+                _generations[user_id] = _generations.get(user_id, 0) + 1
@@ -0,0 +1,51 @@
+"""
+Weak ETags for polled GET endpoints.
+
+A tag is derived from the version columns (ids, updated_at) of the rows an
+endpoint returns plus the request parameters, so it can be computed two ways
+with the same result: from the full rows after loading them, or, when the
+client sent If-None-Match, from a cheap select of just the version columns.
+Only in the second case is the extra query made; when it matches, the client
+gets an empty 304 and the full query and serialization are skipped.
+
+    if if_none_match:
+        etag = weak_etag(user_id, limit, offset, versions(version_query.execute().data))
+        if etag_matches(if_none_match, etag):
+            return not_modified(etag)
+    rows = full_query.execute().data
+    response.headers["ETag"] = weak_etag(user_id, limit, offset, versions(rows))
+
+Versions are read from the database rather than kept in memory, so tags stay
+valid across restarts and between app instances.
+"""
+import hashlib
+from typing import Any, Optional
+
+from fastapi import Response, status
+
+
+def weak_etag(*parts: Any) -> str:
+    """W/"..." tag over the given parts (None and non-strings are fine)."""
+    digest = hashlib.sha1("|".join("" if part is None else str(part) for part in parts).encode("utf-8")).hexdigest()
+    return f'W/"{digest[:32]}"'
+
+
+def etag_matches(if_none_match: Optional[str], etag: str) -> bool:
+    """Weak comparison of an If-None-Match header against our tag."""
+    if not if_none_match:
+        return False
+    if if_none_match.strip() == "*":
+        return True
+    opaque = etag[2:] if etag.startswith("W/") else etag
+    for candidate in if_none_match.split(","):
+        candidate = candidate.strip()
+        if candidate.startswith("W/"):
+            candidate = candidate[2:]
+        if candidate == opaque:
+            return True
+    return False
+
+
+def not_modified(etag: str) -> Response:
+    return Response(status_code=status.HTTP_304_NOT_MODIFIED, headers={"ETag": etag})
+
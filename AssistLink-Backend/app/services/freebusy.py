@@ -0,0 +1,151 @@
+"""
+Caregiver free/busy bitmaps.
+
+A caregiver's calendar is reduced to one bit per 15-minute slot (96 slots,
+12 bytes per UTC day), set when the slot is busy: covered by an active booking
+or recurring occurrence, or outside the caregiver's availability_schedule.
+Bits are most-significant first, so slot 0 (00:00-00:15) is the top bit of
+the day's first byte.
+
+Day bitmaps are cached per caregiver and dropped by invalidate_caregiver()
+whenever a booking of that caregiver, or their schedule, changes.
+"""
+import time
+from datetime import date, datetime, time as dt_time, timedelta, timezone
+from typing import Any, Dict, List, Optional, Tuple
+
+from app.config import settings
+from app.database import supabase_admin
+from app.services.booking_conflicts import ACTIVE_BOOKING_STATUSES
+from app.services.recurrence import iter_booking_occurrences, parse_datetime
+
+SLOT_MINUTES = 15
+SLOTS_PER_DAY = 24 * 60 // SLOT_MINUTES
+BYTES_PER_DAY = SLOTS_PER_DAY // 8
+
+WEEKDAYS = ["monday", "tuesday", "wednesday", "thursday", "friday", "saturday", "sunday"]
+
+# caregiver_id -> {day: (expires_at monotonic, bitmap)}
+_cache: Dict[str, Dict[date, Tuple[float, bytes]]] = {}
+
+
+def invalidate_caregiver(caregiver_id: Optional[str]) -> None:
+    """Drop all cached days for a caregiver after their bookings or schedule change."""
+    if caregiver_id:
+        _cache.pop(str(caregiver_id), None)
+
+
+def _set_slots(bitmap: bytearray, first_slot: int, last_slot: int) -> None:
+    """Mark slots [first_slot, last_slot) busy."""
+    for slot in range(max(0, first_slot), min(len(bitmap) * 8, last_slot)):
+        bitmap[slot >> 3] |= 0x80 >> (slot & 7)
+
+
+def _slot_of(moment: datetime, day: date, round_up: bool) -> int:
+    midnight = datetime(day.year, day.month, day.day, tzinfo=timezone.utc)
+    minutes = (moment - midnight).total_seconds() / 60
+    slot = minutes / SLOT_MINUTES
+    return int(-(-slot // 1)) if round_up else int(slot // 1)
+
+
+def _parse_hhmm(value: Any) -> Optional[int]:
+    """Slot index for an "HH:MM" time (24:00 allowed for end of day)."""
+    if value is None:
+        return None
+    text = str(value)
+    if text.startswith("24:00"):
+        return SLOTS_PER_DAY
+    parsed = dt_time.fromisoformat(text)
+    return (parsed.hour * 60 + parsed.minute) // SLOT_MINUTES
+
+
+def _schedule_ranges(schedule: Optional[Dict[str, Any]], day: date) -> Optional[List[Tuple[int, int]]]:
+    """
+    Available slot ranges for a weekday from availability_schedule
+    ({monday: {start, end}, ...}; a list of {start, end} per day also works).
+    None means no schedule is set, so the whole day counts as available.
+    """
+    if not schedule:
+        return None
+    entry = schedule.get(WEEKDAYS[day.weekday()])
+    if not entry:
+        return []
+    entries = entry if isinstance(entry, list) else [entry]
+    ranges = []
+    for item in entries:
+        if not isinstance(item, dict) or item.get("available") is False:
+            continue
+        try:
+            start = _parse_hhmm(item.get("start"))
+            end = _parse_hhmm(item.get("end"))
+        except ValueError:
+            continue
+        if start is not None and end is not None and end > start:
+            ranges.append((start, end))
+    return ranges
+
+
+def _compute_days(caregiver_id: str, first_day: date, last_day: date) -> Dict[date, bytes]:
+    """Build bitmaps for [first_day, last_day] with one bookings and one profile query."""
+    window_start = datetime(first_day.year, first_day.month, first_day.day, tzinfo=timezone.utc)
+    window_end = datetime(last_day.year, last_day.month, last_day.day, tzinfo=timezone.utc) + timedelta(days=1)
+
+    profile_response = supabase_admin.table("caregiver_profile").select("availability_schedule").eq("user_id", caregiver_id).execute()
+    schedule = profile_response.data[0].get("availability_schedule") if profile_response.data else None
+
+    # One-off bookings last at most 24h, so earlier starts cannot reach the window
+    earliest_start = window_start - timedelta(hours=24)
+    bookings_response = supabase_admin.table("bookings").select(
+        "id, scheduled_date, duration_hours, is_recurring, recurring_pattern, status, updated_at, created_at"
+    ).eq("caregiver_id", caregiver_id).in_(
+        "status", ACTIVE_BOOKING_STATUSES
+    ).lt("scheduled_date", window_end.isoformat()).or_(
+        f"is_recurring.eq.true,scheduled_date.gte.{earliest_start.isoformat()}"
+    ).execute()
+
+    bitmaps: Dict[date, bytearray] = {}
+    day = first_day
+    while day <= last_day:
+        bitmap = bytearray(BYTES_PER_DAY)
+        ranges = _schedule_ranges(schedule, day)
+        if ranges is not None:
+            # Everything outside the schedule is busy
+            _set_slots(bitmap, 0, SLOTS_PER_DAY)
+            for start, end in ranges:
+                for slot in range(start, end):
+                    bitmap[slot >> 3] &= ~(0x80 >> (slot & 7)) & 0xFF
+        bitmaps[day] = bitmap
+        day += timedelta(days=1)
+
+    for occurrence in iter_booking_occurrences(bookings_response.data or [], window_start, window_end):
+        start = parse_datetime(occurrence["scheduled_date"])
+        end = min(start + timedelta(hours=float(occurrence["duration_hours"])), window_end)
+        start = max(start, window_start)
+        day = start.date()
+        while day <= last_day and datetime(day.year, day.month, day.day, tzinfo=timezone.utc) < end:
+            _set_slots(bitmaps[day], _slot_of(start, day, round_up=False), _slot_of(end, day, round_up=True))
+            day += timedelta(days=1)
+
+    return {day: bytes(bitmap) for day, bitmap in bitmaps.items()}
+
+
+def get_freebusy(caregiver_id: str, first_day: date, last_day: date) -> bytes:
+    """Concatenated day bitmaps for first_day..last_day (inclusive)."""
+    caregiver_id = str(caregiver_id)
+    now = time.monotonic()
+    days = [first_day + timedelta(days=offset) for offset in range((last_day - first_day).days + 1)]
+
+    cached = _cache.get(caregiver_id, {})
+    missing = [day for day in days if day not in cached or cached[day][0] <= now]
+    if missing:
+        computed = _compute_days(caregiver_id, missing[0], missing[-1])
+        if caregiver_id not in _cache and len(_cache) >= settings.FREEBUSY_CACHE_MAX_CAREGIVERS:
+            _cache.clear()
+        cached = _cache.setdefault(caregiver_id, {})
+        for day in [day for day, (expires_at, _) in cached.items() if expires_at <= now]:
+            del cached[day]
+        expires_at = now + settings.FREEBUSY_CACHE_SECONDS
+        for day, bitmap in computed.items():
+            cached[day] = (expires_at, bitmap)
+
+    return b"".join(cached[day][1] for day in days)
@@ -0,0 +1,121 @@
+"""
+Idempotency-Key support for non-idempotent POST endpoints.
+
+Decorate a route handler with @idempotent (below the @router.post line). When
+the client sends an `Idempotency-Key` header, the first request with that key
+runs normally and its result is kept for IDEMPOTENCY_TTL_SECONDS; a retry with
+the same key (same user, method and path) gets the stored result back with an
+`Idempotent-Replayed: true` header, without running the handler again, so no
+duplicate rows, Razorpay orders or notifications are created.
+
+- A retry that arrives while the first request is still running waits for it.
+- Reusing a key with a different request body is rejected with 422.
+- Failed requests are not stored, so the client can retry them with the same key.
+
+Keys are held in process memory, like the other caches in app/services.
+"""
+import asyncio
+import functools
+import hashlib
+import inspect
+import time
+from collections import OrderedDict
+from typing import Any, Callable, Optional, Tuple
+
+from fastapi import Header, HTTPException, Request, Response, status
+
+from app.config import settings
+
+REPLAY_HEADER = "Idempotent-Replayed"
+
+# (user_id, method, path, key) -> entry
+Scope = Tuple[str, str, str, str]
+
+
+class _Entry:
+    __slots__ = ("fingerprint", "expires_at", "done", "result")
+
+    def __init__(self, fingerprint: str):
+        self.fingerprint = fingerprint
+        self.expires_at = time.monotonic() + settings.IDEMPOTENCY_TTL_SECONDS
+        self.done: asyncio.Future = asyncio.get_running_loop().create_future()
+        self.result: Any = None
+
+
+_entries: "OrderedDict[Scope, _Entry]" = OrderedDict()
+
+
+def _evict_expired() -> None:
+    now = time.monotonic()
+    # Entries are kept in insertion order, so the oldest sit at the front
+    while _entries:
+        scope, entry = next(iter(_entries.items()))
+        if entry.expires_at > now and len(_entries) <= settings.IDEMPOTENCY_MAX_KEYS:
+            break
+        del _entries[scope]
+
+
+def idempotent(func: Callable) -> Callable:
+    """Make an async route handler honour the Idempotency-Key header."""
+    signature = inspect.signature(func)
+    extra_params = [
+        inspect.Parameter(
+            "idempotency_key",
+            inspect.Parameter.KEYWORD_ONLY,
+            default=Header(None, alias="Idempotency-Key", max_length=255),
+            annotation=Optional[str]
+        ),
+        inspect.Parameter("idempotency_request", inspect.Parameter.KEYWORD_ONLY, annotation=Request),
+        inspect.Parameter("idempotency_response", inspect.Parameter.KEYWORD_ONLY, annotation=Response),
+    ]
+
+    @functools.wraps(func)
+    async def wrapper(*args, **kwargs):
+        key = kwargs.pop("idempotency_key", None)
+        request: Request = kwargs.pop("idempotency_request")
+        response: Response = kwargs.pop("idempotency_response")
+        if not key:
+            return await func(*args, **kwargs)
+
+        current_user = kwargs.get("current_user") or {}
+        user_id = str(current_user.get("id", "")) if isinstance(current_user, dict) else ""
+        scope: Scope = (user_id, request.method, request.url.path, key)
+        fingerprint = hashlib.sha256(await request.body()).hexdigest()
+
+        _evict_expired()
+        while True:
+            entry = _entries.get(scope)
+            if entry is None:
+                break
+            if entry.fingerprint != fingerprint:
+                raise HTTPException(
+                    status_code=status.HTTP_422_UNPROCESSABLE_ENTITY,
+                    detail="Idempotency-Key was already used with a different request body"
+                )
+            if not entry.done.done():
+                try:
+                    await asyncio.wait_for(asyncio.shield(entry.done), timeout=settings.IDEMPOTENCY_WAIT_SECONDS)
+                except asyncio.TimeoutError:
+                    raise HTTPException(
+                        status_code=status.HTTP_409_CONFLICT,
+                        detail="A request with this Idempotency-Key is still being processed"
+                    )
+            if _entries.get(scope) is entry:
+                response.headers[REPLAY_HEADER] = "true"
+                return entry.result
+            # That attempt failed and released the key: look again
+
+        entry = _Entry(fingerprint)
+        _entries[scope] = entry
+        try:
+            entry.result = await func(*args, **kwargs)
+        except BaseException:
+            if _entries.get(scope) is entry:
+                del _entries[scope]
+            entry.done.set_result(None)
+            raise
+        entry.done.set_result(None)
+        return entry.result
+
+    wrapper.__signature__ = signature.replace(parameters=list(signature.parameters.values()) + extra_params)
+    return wrapper
@@ -0,0 +1,59 @@
+"""
+Periodic background jobs tied to the application lifecycle.
+
+Jobs are registered from the startup event in `app.main` and cancelled on
+shutdown. Job functions are normally plain synchronous callables (they use the
+blocking Supabase client), so each run is executed in the default thread pool
+to keep the event loop responsive. Coroutine functions are awaited directly,
+for jobs that need the async notification helpers.
+"""
+import asyncio
+import sys
+import traceback
+from typing import Awaitable, Callable, Dict, Optional, Union
+
+# Sync callable (run in the thread pool) or coroutine function; returns an optional summary
+JobFunc = Callable[[], Union[Optional[dict], Awaitable[Optional[dict]]]]
+
+_jobs: Dict[str, asyncio.Task] = {}
+
+
+async def _run_periodically(name: str, interval_seconds: float, func: JobFunc, initial_delay: float):
+    loop = asyncio.get_running_loop()
+    if initial_delay:
+        await asyncio.sleep(initial_delay)
+    while True:
+        try:
+            if asyncio.iscoroutinefunction(func):
+                result = await func()
+            else:
+                result = await loop.run_in_executor(None, func)
+            if result:
+                sys.stderr.write(f"[JOB] {name}: {result}\n")
+                sys.stderr.flush()
+        except asyncio.CancelledError:
+            raise
+        except Exception as e:
+            sys.stderr.write(f"[JOB] {name} failed: {type(e).__name__}: {e}\n")
+            traceback.print_exc(file=sys.stderr)
+            sys.stderr.flush()
+        await asyncio.sleep(interval_seconds)
+
+
+def start_periodic_job(name: str, interval_seconds: float, func: JobFunc, initial_delay: float = 0):
+    """Run `func` every `interval_seconds` until shutdown. Starting a job twice is a no-op."""
+    if name in _jobs and not _jobs[name].done():
+        return
+    _jobs[name] = asyncio.create_task(_run_periodically(name, interval_seconds, func, initial_delay))
+    sys.stderr.write(f"[JOB] Started {name} (every {interval_seconds}s)\n")
+    sys.stderr.flush()
+
+
+async def stop_all_jobs():
+    """Cancel every running job and wait for them to finish."""
+    tasks = list(_jobs.values())
+    _jobs.clear()
+    for task in tasks:
+        task.cancel()
+    if tasks:
+        await asyncio.gather(*tasks, return_exceptions=True)
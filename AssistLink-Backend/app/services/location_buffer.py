@@ -0,0 +1,108 @@
+"""
+In-memory last-known positions with coalesced, batched writes.
+
+A caregiver in transit sends a position every few seconds. record_location()
+only updates memory: the user's last-known position (served by
+GET /api/location/me) and a pending write that later positions overwrite.
+flush_locations() runs every LOCATION_FLUSH_INTERVAL_SECONDS and writes the
+latest pending position of every user through the `flush_user_locations`
+function (database/migrations/add_flush_user_locations_function.sql), one
+round-trip per LOCATION_FLUSH_BATCH_SIZE users.
+
+So `users.current_location` lags by at most one interval. Positions are per
+process and a cached position is only served for one interval after it was
+taken or read, then GET /me reads the stored row again, so a position written
+by another instance (or out of band) shows up within an interval. Positions
+still pending here are always served. Pending positions are flushed once more
+on shutdown.
+"""
+import sys
+import threading
+import time
+from collections import OrderedDict
+from typing import Any, Dict, List, Optional, Tuple
+
+from app.config import settings
+from app.database import supabase_admin
+
+# user_id -> (last-known location, monotonic time it was stored), least recently updated first
+_positions: "OrderedDict[str, Tuple[Dict[str, Any], float]]" = OrderedDict()
+# user_id -> location not yet written
+_pending: Dict[str, Dict[str, Any]] = {}
+_lock = threading.Lock()
+
+
+def _store(user_id: str, location: Dict[str, Any]) -> None:
+    _positions[user_id] = (location, time.monotonic())
+    _positions.move_to_end(user_id)
+    while len(_positions) > settings.LOCATION_CACHE_MAX_USERS:
+        # An evicted position that is still pending is served from _pending
+        _positions.popitem(last=False)
+
+
+def record_location(user_id: str, location: Dict[str, Any]) -> None:
+    """Take a new position; it replaces any position of the user not yet written."""
+    user_id = str(user_id)
+    with _lock:
+        _store(user_id, location)
+        _pending[user_id] = location
+
+
+def remember_location(user_id: str, location: Dict[str, Any]) -> None:
+    """Cache a position read from the database (nothing to write)."""
+    user_id = str(user_id)
+    with _lock:
+        if user_id not in _pending:
+            _store(user_id, location)
+
+
+def get_location(user_id: str) -> Optional[Dict[str, Any]]:
+    """The user's pending or recently cached position; None means read the stored row."""
+    user_id = str(user_id)
+    with _lock:
+        pending = _pending.get(user_id)
+        if pending is not None:
+            return pending
+        entry = _positions.get(user_id)
+        if entry is None:
+            return None
+        location, stored_at = entry
+        if time.monotonic() - stored_at > settings.LOCATION_FLUSH_INTERVAL_SECONDS:
+            del _positions[user_id]
+            return None
+        return location
+
+
+def flush_locations() -> dict:
+    """Write every pending position, batch by batch. Failed batches stay pending for the next run."""
+    with _lock:
+        if not _pending:
+            return {}
+        pending = list(_pending.items())
+        _pending.clear()
+
+    batch_size = settings.LOCATION_FLUSH_BATCH_SIZE
+    written = 0
+    failed: List[tuple] = []
+    for start in range(0, len(pending), batch_size):
+        batch = pending[start:start + batch_size]
+        try:
+            response = supabase_admin.rpc("flush_user_locations", {
+                "p_locations": [{"user_id": user_id, "location": location} for user_id, location in batch]
+            }).execute()
+            written += response.data or 0
+        except Exception as e:
+            sys.stderr.write(f"[WARN] Could not flush {len(batch)} locations: {e}\n")
+            sys.stderr.flush()
+            failed.extend(batch)
+
+    if failed:
+        with _lock:
+            for user_id, location in failed:
+                # A newer position recorded meanwhile wins
+                _pending.setdefault(user_id, location)
+
+    summary = {"flushed": len(pending) - len(failed), "written": written}
+    if failed:
+        summary["failed"] = len(failed)
+    return summary
@@ -0,0 +1,139 @@
+"""
+Per-user notification preferences and quiet hours.
+
+Preferences decide whether a push is sent; the in-app notification row is
+always written. Rows are cached in memory for NOTIFICATION_PREFERENCES_CACHE_SECONDS
+so the check before every push is normally a dict lookup, and the cache entry
+is dropped whenever the user saves new preferences.
+"""
+import time
+from datetime import datetime, time as dt_time, timezone
+from typing import Any, Dict, Iterable, List, Optional, Tuple
+
+from app.config import settings
+from app.database import supabase_admin
+
+try:
+    from zoneinfo import ZoneInfo
+except ImportError:  # Python 3.8
+    ZoneInfo = None
+
+DEFAULT_PREFERENCES: Dict[str, Any] = {
+    "push_disabled_types": [],
+    "quiet_hours_start": None,
+    "quiet_hours_end": None,
+    "timezone": "UTC",
+}
+
+# user_id -> (expires_at monotonic, preferences dict)
+_cache: Dict[str, Tuple[float, Dict[str, Any]]] = {}
+
+
+def _normalize(row: Optional[Dict[str, Any]]) -> Dict[str, Any]:
+    preferences = dict(DEFAULT_PREFERENCES)
+    if row:
+        for key in DEFAULT_PREFERENCES:
+            if row.get(key) is not None:
+                preferences[key] = row[key]
+    return preferences
+
+
+def _store(user_id: str, preferences: Dict[str, Any]) -> None:
+    if len(_cache) >= settings.NOTIFICATION_PREFERENCES_CACHE_MAX_USERS:
+        # Cheap bound on memory: drop everything already expired, or the whole cache if nothing has
+        now = time.monotonic()
+        for key in [key for key, (expires_at, _) in _cache.items() if expires_at <= now]:
+            del _cache[key]
+        if len(_cache) >= settings.NOTIFICATION_PREFERENCES_CACHE_MAX_USERS:
+            _cache.clear()
+    _cache[user_id] = (time.monotonic() + settings.NOTIFICATION_PREFERENCES_CACHE_SECONDS, preferences)
+
+
+def get_preferences_many(user_ids: Iterable[str]) -> Dict[str, Dict[str, Any]]:
+    """Preferences for several users, loading all cache misses with one query."""
+    now = time.monotonic()
+    result: Dict[str, Dict[str, Any]] = {}
+    missing: List[str] = []
+    for user_id in user_ids:
+        user_id = str(user_id)
+        cached = _cache.get(user_id)
+        if cached and cached[0] > now:
+            result[user_id] = cached[1]
+        else:
+            missing.append(user_id)
+
+    if missing:
+        response = supabase_admin.table("notification_preferences").select("*").in_("user_id", missing).execute()
+        rows = {str(row["user_id"]): row for row in response.data or []}
+        for user_id in missing:
+            preferences = _normalize(rows.get(user_id))
+            _store(user_id, preferences)
+            result[user_id] = preferences
+    return result
+
+
+def get_preferences(user_id: str) -> Dict[str, Any]:
+    return get_preferences_many([user_id])[str(user_id)]
+
+
+def invalidate_preferences(user_id: str) -> None:
+    _cache.pop(str(user_id), None)
+
+
+def _parse_time(value: Any) -> Optional[dt_time]:
+    if value is None or isinstance(value, dt_time):
+        return value
+    return dt_time.fromisoformat(str(value))
+
+
+def in_quiet_hours(preferences: Dict[str, Any], now: Optional[datetime] = None) -> bool:
+    """True if `now` falls inside the user's quiet hours (ranges may span midnight)."""
+    start = _parse_time(preferences.get("quiet_hours_start"))
+    end = _parse_time(preferences.get("quiet_hours_end"))
+    if start is None or end is None or start == end:
+        return False
+
+    now = now or datetime.now(timezone.utc)
+    tz_name = preferences.get("timezone") or "UTC"
+    if ZoneInfo is not None and tz_name != "UTC":
+        try:
+            now = now.astimezone(ZoneInfo(tz_name))
+        except Exception:
+            pass
+    current = now.time().replace(tzinfo=None)
+
+    if start < end:
+        return start <= current < end
+    return current >= start or current < end
+
+
+def _allows_push(preferences: Dict[str, Any], notification_type: str, now: Optional[datetime]) -> bool:
+    if notification_type in (preferences.get("push_disabled_types") or []):
+        return False
+    return not in_quiet_hours(preferences, now)
+
+
+def should_send_push(user_id: str, notification_type: str, now: Optional[datetime] = None) -> bool:
+    """
+    Whether a push of this type may be sent to the user right now.
+
+    Fails open: if preferences cannot be loaded the push is sent as before.
+    """
+    try:
+        return _allows_push(get_preferences(user_id), notification_type, now)
+    except Exception as e:
+        import sys
+        print(f"⚠️ Could not load notification preferences for {user_id}: {e}", file=sys.stderr, flush=True)
+        return True
+
+
+def filter_push_recipients(user_ids: List[str], notification_type: str, now: Optional[datetime] = None) -> List[str]:
+    """Subset of `user_ids` that should receive a push of this type right now."""
+    try:
+        preferences = get_preferences_many(user_ids)
+    except Exception as e:
+        import sys
+        print(f"⚠️ Could not load notification preferences in bulk: {e}", file=sys.stderr, flush=True)
+        return list(user_ids)
+    now = now or datetime.now(timezone.utc)
+    return [user_id for user_id in user_ids if _allows_push(preferences[str(user_id)], notification_type, now)]
@@ -0,0 +1,35 @@
+"""
+Retention job for the notifications table.
+
+Read notifications older than NOTIFICATION_RETENTION_DAYS are deleted (or moved
+to `notifications_archive`) in bounded batches through the `prune_notifications`
+database function from database/migrations/add_notification_retention.sql.
+"""
+from app.config import settings
+from app.database import supabase_admin
+
+
+def prune_read_notifications() -> dict:
+    """
+    Remove old read notifications, one batch per database round-trip.
+
+    Stops after NOTIFICATION_RETENTION_MAX_BATCHES so a large backlog is worked
+    off across several runs instead of holding a worker for minutes.
+    """
+    batch_size = settings.NOTIFICATION_RETENTION_BATCH_SIZE
+    total_removed = 0
+    batches = 0
+
+    while batches < settings.NOTIFICATION_RETENTION_MAX_BATCHES:
+        response = supabase_admin.rpc("prune_notifications", {
+            "p_older_than": f"{settings.NOTIFICATION_RETENTION_DAYS} days",
+            "p_batch_size": batch_size,
+            "p_archive": settings.NOTIFICATION_RETENTION_ARCHIVE
+        }).execute()
+        removed = response.data or 0
+        total_removed += removed
+        batches += 1
+        if removed < batch_size:
+            break
+
+    return {"removed": total_removed, "batches": batches} if total_removed else {}
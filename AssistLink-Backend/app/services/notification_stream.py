@@ -0,0 +1,155 @@
+"""
+In-process broker for the notification Server-Sent Events stream.
+
+`create_notification` and the notification endpoints publish events here, and
+`GET /api/notifications/stream` subscribes to them. Each user keeps a small
+ring buffer of recent events so that a reconnecting client can resume from
+its `Last-Event-ID` without refetching the notification list.
+"""
+import asyncio
+import json
+import time
+from collections import defaultdict, deque
+from typing import Any, Deque, Dict, List, Optional, Set, Tuple
+
+from app.config import settings
+
+
+class StreamLimitExceeded(Exception):
+    """Raised when a user already has the maximum number of open streams."""
+
+
+class NotificationBroker:
+    """Fan-out of notification events to the open streams of each user."""
+
+    def __init__(self, max_streams_per_user: int, replay_buffer_size: int, resume_window_seconds: int):
+        self.max_streams_per_user = max_streams_per_user
+        self.replay_buffer_size = replay_buffer_size
+        self.resume_window_seconds = resume_window_seconds
+        self._subscribers: Dict[str, Set[asyncio.Queue]] = defaultdict(set)
+        self._buffers: Dict[str, Deque[Tuple[int, str, str]]] = {}
+        # user_id -> monotonic time their last stream closed; events keep being
+        # buffered for that long so a reconnect can resume without a gap.
+        self._disconnected_at: Dict[str, float] = {}
+        # Millisecond start keeps event ids increasing across server restarts,
+        # so a stale Last-Event-ID from a previous process is never replayed.
+        self._last_event_id = int(time.time() * 1000)
+
+    def has_subscribers(self, user_id: str) -> bool:
+        return bool(self._subscribers.get(str(user_id)))
+
+    def is_listening(self, user_id: str) -> bool:
+        """True if the user has an open stream or closed one within the resume window."""
+        user_id = str(user_id)
+        if self._subscribers.get(user_id):
+            return True
+        closed_at = self._disconnected_at.get(user_id)
+        if closed_at is None:
+            return False
+        if time.monotonic() - closed_at > self.resume_window_seconds:
+            del self._disconnected_at[user_id]
+            self._buffers.pop(user_id, None)
+            return False
+        return True
+
+    def subscribe(self, user_id: str) -> asyncio.Queue:
+        user_id = str(user_id)
+        if len(self._subscribers[user_id]) >= self.max_streams_per_user:
+            raise StreamLimitExceeded(
+                f"Maximum of {self.max_streams_per_user} notification streams per user reached"
+            )
+        queue: asyncio.Queue = asyncio.Queue(maxsize=self.replay_buffer_size)
+        self._subscribers[user_id].add(queue)
+        self._disconnected_at.pop(user_id, None)
+        return queue
+
+    def unsubscribe(self, user_id: str, queue: asyncio.Queue) -> None:
+        user_id = str(user_id)
+        subscribers = self._subscribers.get(user_id)
+        if subscribers is None:
+            return
+        subscribers.discard(queue)
+        if not subscribers:
+            del self._subscribers[user_id]
+            self._disconnected_at[user_id] = time.monotonic()
+
+    def publish(self, user_id: str, event: str, payload: Dict[str, Any]) -> Optional[int]:
+        """
+        Record an event for the user and push it to all of their open streams.
+
+        Users without a recent stream are skipped entirely and None is returned.
+        """
+        user_id = str(user_id)
+        if not self.is_listening(user_id):
+            return None
+        self._last_event_id += 1
+        event_id = self._last_event_id
+        data = json.dumps(payload, default=str)
+
+        buffer = self._buffers.get(user_id)
+        if buffer is None:
+            buffer = self._buffers[user_id] = deque(maxlen=self.replay_buffer_size)
+        buffer.append((event_id, event, data))
+
+        for queue in list(self._subscribers.get(user_id, ())):
+            try:
+                queue.put_nowait((event_id, event, data))
+            except asyncio.QueueFull:
+                # A client that stopped reading loses its oldest pending event;
+                # it can still recover the gap by reconnecting with Last-Event-ID.
+                queue.get_nowait()
+                queue.put_nowait((event_id, event, data))
+        return event_id
+
+    def replay_since(self, user_id: str, last_event_id: int) -> Optional[List[Tuple[int, str, str]]]:
+        """
+        Return buffered events newer than `last_event_id`.
+
+        Returns None when the buffer no longer reaches back that far, in which
+        case the caller has to resynchronise from the database.
+        """
+        buffer = self._buffers.get(str(user_id))
+        if not buffer:
+            return None
+        if buffer[0][0] > last_event_id + 1:
+            return None
+        return [item for item in buffer if item[0] > last_event_id]
+
+
+def format_sse(event_id: Optional[int], event: str, data: str) -> str:
+    """Serialise one event in text/event-stream framing."""
+    lines = []
+    if event_id is not None:
+        lines.append(f"id: {event_id}")
+    lines.append(f"event: {event}")
+    for line in data.splitlines() or [""]:
+        lines.append(f"data: {line}")
+    return "\n".join(lines) + "\n\n"
+
+
+def fetch_unread_count(user_id: str) -> int:
+    """Count unread notifications for a user straight from the database."""
+    from app.database import supabase_admin
+
+    response = supabase_admin.table("notifications").select("id", count="exact").eq("user_id", str(user_id)).eq("is_read", False).limit(1).execute()
+    return response.count if response.count is not None else len(response.data or [])
+
+
+def publish_unread_count(user_id: str, unread_count: Optional[int] = None) -> None:
+    """Push the current unread count to the user's streams, if any are open."""
+    if not notification_broker.is_listening(user_id):
+        return
+    try:
+        if unread_count is None:
+            unread_count = fetch_unread_count(user_id)
+        notification_broker.publish(user_id, "unread_count", {"unread_count": unread_count})
+    except Exception as e:
+        import sys
+        print(f"⚠️ Failed to publish unread count for {user_id}: {e}", file=sys.stderr, flush=True)
+
+
+notification_broker = NotificationBroker(
+    max_streams_per_user=settings.NOTIFICATION_STREAM_MAX_PER_USER,
+    replay_buffer_size=settings.NOTIFICATION_STREAM_REPLAY_BUFFER,
+    resume_window_seconds=settings.NOTIFICATION_STREAM_RESUME_WINDOW_SECONDS,
+)
@@ -1,11 +1,17 @@
 """
 Notification service for creating and managing notifications
 """
-from typing import Optional, Dict, Any
+from typing import Optional, Dict, Any, List
 from app.database import supabase_admin
+from app.services.notification_stream import notification_broker, publish_unread_count
+from app.services.notification_preferences import should_send_push, filter_push_recipients
 from datetime import datetime
+import asyncio
 import json
 
+# Strong references to fire-and-forget push tasks so they are not garbage collected mid-flight
+_background_tasks = set()
+
 
 async def create_notification(
     user_id: str,
@@ -50,6 +56,13 @@ async def create_notification(
             print(f"✅ Notification created in database with ID: {notification.get('id')}", file=sys.stderr, flush=True)
             print(f"   User ID: {notification.get('user_id')}", file=sys.stderr, flush=True)
             print(f"   Type: {notification.get('type')}", file=sys.stderr, flush=True)
+            # Push to any open notification streams before the (slower) FCM round-trip
+            if notification_broker.publish(user_id, "notification", notification) is not None:
+                publish_unread_count(user_id)
+            # Respect the user's push preferences / quiet hours before any device lookup
+            if not should_send_push(user_id, notification_type):
+                print(f"🔕 Push suppressed by user preferences (in-app notification kept)", file=sys.stderr, flush=True)
+                return notification
             # Trigger push notification (async, don't wait)
             print(f"📤 Triggering push notification...", file=sys.stderr, flush=True)
             try:
@@ -71,6 +84,120 @@ async def create_notification(
         return None
 
 
+def _get_firebase_messaging():
+    """
+    Initialize the Firebase Admin SDK on first use and return its messaging module.
+
+    Returns None when FCM credentials are not configured or initialization fails.
+    """
+    import sys
+    from app.config import settings
+    import os
+    from pathlib import Path
+    
+    # Check if FCM is configured
+    service_account_path = settings.FCM_SERVICE_ACCOUNT_PATH
+    google_app_creds = os.getenv("GOOGLE_APPLICATION_CREDENTIALS")
+    
+    print(f"Service Account Path (from config): {service_account_path}", file=sys.stderr, flush=True)
+    print(f"GOOGLE_APPLICATION_CREDENTIALS: {google_app_creds}", file=sys.stderr, flush=True)
+    
+    # Resolve relative path to absolute
+    if service_account_path:
+        # Handle relative paths
+        if not os.path.isabs(service_account_path):
+            # Get project root (assuming this file is in app/services/)
+            project_root = Path(__file__).parent.parent.parent
+            service_account_path = str(project_root / service_account_path)
+        
+        print(f"Resolved Service Account Path: {service_account_path}", file=sys.stderr, flush=True)
+        print(f"File exists: {os.path.exists(service_account_path)}", file=sys.stderr, flush=True)
+    
+    if not service_account_path and not google_app_creds:
+        print("❌ FCM Service Account not configured. Set FCM_SERVICE_ACCOUNT_PATH or GOOGLE_APPLICATION_CREDENTIALS", file=sys.stderr, flush=True)
+        return None
+    
+    # Initialize Firebase Admin SDK
+    try:
+        import firebase_admin
+        from firebase_admin import credentials, messaging
+        
+        # Initialize Firebase Admin if not already initialized
+        if not firebase_admin._apps:
+            if service_account_path:
+                # Use service account file path
+                cred = credentials.Certificate(service_account_path)
+                firebase_admin.initialize_app(cred)
+            elif google_app_creds:
+                # Use GOOGLE_APPLICATION_CREDENTIALS env var
+                cred = credentials.ApplicationDefault()
+                firebase_admin.initialize_app(cred)
+            else:
+                print("Firebase credentials not found")
+                return None
+        return messaging
+    except ImportError:
+        print("firebase-admin not installed. Install with: pip install firebase-admin")
+        return None
+    except Exception as e:
+        print(f"Error initializing Firebase Admin: {e}")
+        return None
+
+
+def _build_push_message(messaging, device_token: str, platform: str, title: str, body: str, data_payload: Dict[str, Any]):
+    """Create the FCM message for one device based on its platform"""
+    data = {str(k): str(v) for k, v in data_payload.items()}
+    if platform == "ios":
+        return messaging.Message(
+            token=device_token,
+            notification=messaging.Notification(
+                title=title,
+                body=body
+            ),
+            data=data,
+            apns=messaging.APNSConfig(
+                payload=messaging.APNSPayload(
+                    aps=messaging.Aps(
+                        sound="default",
+                        badge=1
+                    )
+                )
+            )
+        )
+    elif platform == "android":
+        return messaging.Message(
+            token=device_token,
+            notification=messaging.Notification(
+                title=title,
+                body=body
+            ),
+            data=data,
+            android=messaging.AndroidConfig(
+                priority="high",
+                notification=messaging.AndroidNotification(
+                    sound="default",
+                    channel_id="default"
+                )
+            )
+        )
+    else:  # web
+        return messaging.Message(
+            token=device_token,
+            notification=messaging.Notification(
+                title=title,
+                body=body
+            ),
+            data=data,
+            webpush=messaging.WebpushConfig(
+                notification=messaging.WebpushNotification(
+                    title=title,
+                    body=body,
+                    icon="/icon-192x192.png"
+                )
+            )
+        )
+
+
 async def send_push_notification(
     user_id: str,
     title: str,
@@ -91,37 +218,12 @@ async def send_push_notification(
     """
     try:
         import sys
-        from app.config import settings
-        import os
-        from pathlib import Path
         
         print(f"\n=== PUSH NOTIFICATION DEBUG ===", file=sys.stderr, flush=True)
         print(f"User ID: {user_id}", file=sys.stderr, flush=True)
         print(f"Title: {title}", file=sys.stderr, flush=True)
         print(f"Body: {body}", file=sys.stderr, flush=True)
         
-        # Check if FCM is configured
-        service_account_path = settings.FCM_SERVICE_ACCOUNT_PATH
-        google_app_creds = os.getenv("GOOGLE_APPLICATION_CREDENTIALS")
-        
-        print(f"Service Account Path (from config): {service_account_path}", file=sys.stderr, flush=True)
-        print(f"GOOGLE_APPLICATION_CREDENTIALS: {google_app_creds}", file=sys.stderr, flush=True)
-        
-        # Resolve relative path to absolute
-        if service_account_path:
-            # Handle relative paths
-            if not os.path.isabs(service_account_path):
-                # Get project root (assuming this file is in app/services/)
-                project_root = Path(__file__).parent.parent.parent
-                service_account_path = str(project_root / service_account_path)
-            
-            print(f"Resolved Service Account Path: {service_account_path}", file=sys.stderr, flush=True)
-            print(f"File exists: {os.path.exists(service_account_path)}", file=sys.stderr, flush=True)
-        
-        if not service_account_path and not google_app_creds:
-            print("❌ FCM Service Account not configured. Set FCM_SERVICE_ACCOUNT_PATH or GOOGLE_APPLICATION_CREDENTIALS", file=sys.stderr, flush=True)
-            return False
-        
         # Get all active device tokens for user
         print(f"Fetching devices for user_id: {user_id}", file=sys.stderr, flush=True)
         devices_response = supabase_admin.table("user_devices").select("device_token, platform").eq("user_id", user_id).eq("is_active", True).execute()
@@ -135,38 +237,16 @@ async def send_push_notification(
             print("❌ No devices registered for this user", file=sys.stderr, flush=True)
             return False
         
-        # Initialize Firebase Admin SDK
-        try:
-            import firebase_admin
-            from firebase_admin import credentials, messaging
-            
-            # Initialize Firebase Admin if not already initialized
-            if not firebase_admin._apps:
-                if service_account_path:
-                    # Use service account file path
-                    cred = credentials.Certificate(service_account_path)
-                    firebase_admin.initialize_app(cred)
-                elif google_app_creds:
-                    # Use GOOGLE_APPLICATION_CREDENTIALS env var
-                    cred = credentials.ApplicationDefault()
-                    firebase_admin.initialize_app(cred)
-                else:
-                    print("Firebase credentials not found")
-                    return False
-        except ImportError:
-            print("firebase-admin not installed. Install with: pip install firebase-admin")
-            return False
-        except Exception as e:
-            print(f"Error initializing Firebase Admin: {e}")
+        messaging = _get_firebase_messaging()
+        if messaging is None:
             return False
         
         # Prepare data payload
-        data_payload = data or {}
+        data_payload = dict(data or {})
         data_payload["type"] = data.get("type", "general") if data else "general"
         
         # Send to all devices
         results = []
-        from firebase_admin import messaging
         
         for device in devices_response.data:
             device_token = device["device_token"]
@@ -177,55 +257,7 @@ async def send_push_notification(
             
             try:
                 # Create message based on platform
-                if platform == "ios":
-                    message = messaging.Message(
-                        token=device_token,
-                        notification=messaging.Notification(
-                            title=title,
-                            body=body
-                        ),
-                        data={str(k): str(v) for k, v in data_payload.items()},
-                        apns=messaging.APNSConfig(
-                            payload=messaging.APNSPayload(
-                                aps=messaging.Aps(
-                                    sound="default",
-                                    badge=1
-                                )
-                            )
-                        )
-                    )
-                elif platform == "android":
-                    message = messaging.Message(
-                        token=device_token,
-                        notification=messaging.Notification(
-                            title=title,
-                            body=body
-                        ),
-                        data={str(k): str(v) for k, v in data_payload.items()},
-                        android=messaging.AndroidConfig(
-                            priority="high",
-                            notification=messaging.AndroidNotification(
-                                sound="default",
-                                channel_id="default"
-                            )
-                        )
-                    )
-                else:  # web
-                    message = messaging.Message(
-                        token=device_token,
-                        notification=messaging.Notification(
-                            title=title,
-                            body=body
-                        ),
-                        data={str(k): str(v) for k, v in data_payload.items()},
-                        webpush=messaging.WebpushConfig(
-                            notification=messaging.WebpushNotification(
-                                title=title,
-                                body=body,
-                                icon="/icon-192x192.png"
-                            )
-                        )
-                    )
+                message = _build_push_message(messaging, device_token, platform, title, body, data_payload)
                 
                 # Send message
                 print(f"Sending message to {platform} device...", file=sys.stderr, flush=True)
@@ -258,6 +290,270 @@ async def send_push_notification(
         return False
 
 
+def _insert_notification_rows(rows: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
+    """Insert notification rows in batches and publish them to open streams; returns the created rows."""
+    import sys
+    from app.config import settings
+    
+    created = []
+    batch_size = settings.NOTIFICATION_BULK_INSERT_BATCH_SIZE
+    for start in range(0, len(rows), batch_size):
+        try:
+            response = supabase_admin.table("notifications").insert(rows[start:start + batch_size]).execute()
+        except Exception as e:
+            print(f"❌ Error inserting notification batch at offset {start}: {e}", file=sys.stderr, flush=True)
+            continue
+        
+        for notification in response.data or []:
+            user_id = str(notification.get("user_id"))
+            created.append(notification)
+            if notification_broker.publish(user_id, "notification", notification) is not None:
+                publish_unread_count(user_id)
+    return created
+
+
+def _schedule_push(coroutine) -> None:
+    task = asyncio.create_task(coroutine)
+    _background_tasks.add(task)
+    task.add_done_callback(_background_tasks.discard)
+
+
+async def create_notifications_bulk(
+    user_ids: List[str],
+    notification_type: str,
+    title: str,
+    body: str,
+    data: Optional[Dict[str, Any]] = None,
+    send_push: bool = True
+) -> int:
+    """
+    Create the same notification for many users at once
+    
+    Rows are inserted in batches of NOTIFICATION_BULK_INSERT_BATCH_SIZE (one
+    statement per batch) and push delivery is scheduled in the background in
+    groups of NOTIFICATION_PUSH_GROUP_SIZE users, so the caller only waits for
+    the inserts.
+    
+    Args:
+        user_ids: UUIDs of the users to notify
+        notification_type: Type of notification (video_call, message, booking, etc.)
+        title: Notification title
+        body: Notification body/message
+        data: Additional data (JSONB) shared by every row
+        send_push: Whether to schedule FCM push for the created notifications
+    
+    Returns:
+        Number of notifications created
+    """
+    import sys
+    
+    # Keep order but drop duplicates so a user is never notified twice
+    unique_user_ids = list(dict.fromkeys(str(user_id) for user_id in user_ids if user_id))
+    if not unique_user_ids:
+        return 0
+    
+    print(f"\n🔔 CREATING {len(unique_user_ids)} NOTIFICATIONS IN BULK (type: {notification_type})", file=sys.stderr, flush=True)
+    
+    created = _insert_notification_rows([
+        {
+            "user_id": user_id,
+            "type": notification_type,
+            "title": title,
+            "body": body,
+            "is_read": False,
+            "data": data or {}
+        }
+        for user_id in unique_user_ids
+    ])
+    created_user_ids = [str(notification.get("user_id")) for notification in created]
+    
+    print(f"✅ Created {len(created_user_ids)}/{len(unique_user_ids)} notifications", file=sys.stderr, flush=True)
+    
+    if send_push and created_user_ids:
+        _schedule_push(_send_push_notifications_in_groups(created_user_ids, notification_type, title, body, data))
+    
+    return len(created_user_ids)
+
+
+async def create_notifications_many(
+    notifications: List[Dict[str, Any]],
+    notification_type: str,
+    send_push: bool = True
+) -> int:
+    """
+    Create many notifications that each have their own content
+    
+    Like create_notifications_bulk, but every entry (user_id, title, body,
+    data) becomes its own row, so a user may get several notifications.
+    Push delivery is batched the same way in the background.
+    
+    Returns:
+        Number of notifications created
+    """
+    import sys
+    
+    rows = [
+        {
+            "user_id": str(notification["user_id"]),
+            "type": notification_type,
+            "title": notification["title"],
+            "body": notification["body"],
+            "is_read": False,
+            "data": notification.get("data") or {}
+        }
+        for notification in notifications if notification.get("user_id")
+    ]
+    if not rows:
+        return 0
+    
+    print(f"\n🔔 CREATING {len(rows)} NOTIFICATIONS IN BULK (type: {notification_type})", file=sys.stderr, flush=True)
+    created = _insert_notification_rows(rows)
+    print(f"✅ Created {len(created)}/{len(rows)} notifications", file=sys.stderr, flush=True)
+    
+    if send_push and created:
+        _schedule_push(_send_push_notifications_each(created, notification_type))
+    
+    return len(created)
+
+
+async def broadcast_to_role(
+    role: str,
+    notification_type: str,
+    title: str,
+    body: str,
+    data: Optional[Dict[str, Any]] = None
+) -> int:
+    """
+    Send an announcement to every active user with the given role
+    (care_recipient or caregiver). Returns the number of notifications created.
+    """
+    from app.config import settings
+    
+    user_ids = []
+    page_size = settings.NOTIFICATION_BULK_INSERT_BATCH_SIZE
+    offset = 0
+    while True:
+        response = supabase_admin.table("users").select("id").eq("role", role).eq("is_active", True).order("id").range(offset, offset + page_size - 1).execute()
+        page = response.data or []
+        user_ids.extend(row["id"] for row in page)
+        if len(page) < page_size:
+            break
+        offset += page_size
+    
+    return await create_notifications_bulk(user_ids, notification_type, title, body, data)
+
+
+async def _send_push_notifications_in_groups(
+    user_ids: List[str],
+    notification_type: str,
+    title: str,
+    body: str,
+    data: Optional[Dict[str, Any]] = None
+) -> int:
+    """Deliver one push to many users, one device lookup and one FCM batch per group"""
+    import sys
+    from app.config import settings
+    
+    messaging = _get_firebase_messaging()
+    if messaging is None:
+        return 0
+    
+    data_payload = dict(data or {})
+    data_payload["type"] = data.get("type", "general") if data else "general"
+    
+    loop = asyncio.get_running_loop()
+    sent = 0
+    group_size = settings.NOTIFICATION_PUSH_GROUP_SIZE
+    for start in range(0, len(user_ids), group_size):
+        group = user_ids[start:start + group_size]
+        try:
+            # Users who muted this type or are in quiet hours are skipped before the device lookup
+            group = filter_push_recipients(group, notification_type)
+            if not group:
+                continue
+            devices_response = supabase_admin.table("user_devices").select("device_token, platform").in_("user_id", group).eq("is_active", True).execute()
+            devices = devices_response.data or []
+            # FCM accepts at most 500 messages per batch call
+            for chunk_start in range(0, len(devices), 500):
+                chunk = devices[chunk_start:chunk_start + 500]
+                messages = [
+                    _build_push_message(messaging, device["device_token"], device["platform"], title, body, data_payload)
+                    for device in chunk
+                ]
+                batch_response = await loop.run_in_executor(None, messaging.send_each, messages)
+                sent += batch_response.success_count
+                
+                unregistered_tokens = [
+                    device["device_token"]
+                    for device, result in zip(chunk, batch_response.responses)
+                    if not result.success and isinstance(result.exception, messaging.UnregisteredError)
+                ]
+                if unregistered_tokens:
+                    supabase_admin.table("user_devices").update({"is_active": False}).in_("device_token", unregistered_tokens).execute()
+        except Exception as e:
+            print(f"❌ Error sending push to group at offset {start}: {e}", file=sys.stderr, flush=True)
+    
+    print(f"📤 Bulk push delivered to {sent} devices for {len(user_ids)} users", file=sys.stderr, flush=True)
+    return sent
+
+
+async def _send_push_notifications_each(notifications: List[Dict[str, Any]], notification_type: str) -> int:
+    """Deliver each notification's own push, one device lookup and one FCM batch per group of notifications"""
+    import sys
+    from app.config import settings
+    
+    messaging = _get_firebase_messaging()
+    if messaging is None:
+        return 0
+    
+    loop = asyncio.get_running_loop()
+    sent = 0
+    group_size = settings.NOTIFICATION_PUSH_GROUP_SIZE
+    for start in range(0, len(notifications), group_size):
+        group = notifications[start:start + group_size]
+        try:
+            # Users who muted this type or are in quiet hours are skipped before the device lookup
+            recipients = set(filter_push_recipients(list({str(n["user_id"]) for n in group}), notification_type))
+            group = [n for n in group if str(n["user_id"]) in recipients]
+            if not group:
+                continue
+            devices_response = supabase_admin.table("user_devices").select("user_id, device_token, platform").in_("user_id", list(recipients)).eq("is_active", True).execute()
+            devices_by_user: Dict[str, List[Dict[str, Any]]] = {}
+            for device in devices_response.data or []:
+                devices_by_user.setdefault(str(device["user_id"]), []).append(device)
+            
+            deliveries = []
+            for notification in group:
+                data = notification.get("data") or {}
+                data_payload = dict(data)
+                data_payload["type"] = data.get("type", "general")
+                for device in devices_by_user.get(str(notification["user_id"]), []):
+                    deliveries.append((device, notification["title"], notification["body"], data_payload))
+            
+            # FCM accepts at most 500 messages per batch call
+            for chunk_start in range(0, len(deliveries), 500):
+                chunk = deliveries[chunk_start:chunk_start + 500]
+                messages = [
+                    _build_push_message(messaging, device["device_token"], device["platform"], title, body, data_payload)
+                    for device, title, body, data_payload in chunk
+                ]
+                batch_response = await loop.run_in_executor(None, messaging.send_each, messages)
+                sent += batch_response.success_count
+                
+                unregistered_tokens = [
+                    device["device_token"]
+                    for (device, _, _, _), result in zip(chunk, batch_response.responses)
+                    if not result.success and isinstance(result.exception, messaging.UnregisteredError)
+                ]
+                if unregistered_tokens:
+                    supabase_admin.table("user_devices").update({"is_active": False}).in_("device_token", unregistered_tokens).execute()
+        except Exception as e:
+            print(f"❌ Error sending push to group at offset {start}: {e}", file=sys.stderr, flush=True)
+    
+    print(f"📤 Bulk push delivered to {sent} devices for {len(notifications)} notifications", file=sys.stderr, flush=True)
+    return sent
+
+
 # Helper functions for specific notification types
 
 async def notify_video_call_request(caregiver_id: str, care_recipient_name: str, video_call_id: str):
@@ -373,6 +669,39 @@ async def notify_booking_status_change(user_id: str, booking_id: str, status: st
     )
 
 
+async def notify_bookings_created_bulk(caregiver_id: str, care_recipient_name: str, booking_ids: List[str]):
+    """Notify caregiver about several new bookings with a single notification"""
+    if len(booking_ids) == 1:
+        return await notify_booking_created(caregiver_id, care_recipient_name, booking_ids[0])
+    return await create_notification(
+        user_id=caregiver_id,
+        notification_type="booking",
+        title="New Booking Requests",
+        body=f"{care_recipient_name} has created {len(booking_ids)} new booking requests",
+        data={
+            "booking_ids": booking_ids,
+            "action": "view_bookings"
+        }
+    )
+
+
+async def notify_bookings_status_change_bulk(user_id: str, booking_ids: List[str], status: str, other_party_name: str):
+    """Notify user about a status change on several bookings with a single notification"""
+    if len(booking_ids) == 1:
+        return await notify_booking_status_change(user_id, booking_ids[0], status, other_party_name)
+    return await create_notification(
+        user_id=user_id,
+        notification_type="booking",
+        title="Booking Status Update",
+        body=f"{other_party_name} changed {len(booking_ids)} bookings to {status.replace('_', ' ')}",
+        data={
+            "booking_ids": booking_ids,
+            "status": status,
+            "action": "view_bookings"
+        }
+    )
+
+
 async def notify_chat_enabled(user_id: str, other_party_name: str, chat_session_id: str):
     """Notify user that chat session is now enabled"""
     return await create_notification(
@@ -0,0 +1,309 @@
+"""
+Payment gateway interface.
+
+Routers and jobs talk to Razorpay through get_payment_gateway() instead of the
+synchronous `razorpay.Client`, so a Razorpay round-trip no longer blocks the
+event loop.
+
+- RazorpayGateway: async REST client on one pooled keep-alive httpx client,
+  with per-call timeouts. GETs are retried on timeouts, connection errors,
+  429 and 5xx. Order creation is a POST and is never retried, because a retry
+  could create a second order.
+- StubGateway: in-memory orders and payments with optional simulated latency,
+  for local runs, tests and benchmarks (PAYMENT_GATEWAY=stub).
+
+Amounts are in the smallest currency unit (paise), as in the Razorpay API.
+"""
+import asyncio
+import hashlib
+import hmac
+import itertools
+import random
+import sys
+import time
+from abc import ABC, abstractmethod
+from typing import Any, Dict, List, Optional
+
+import httpx
+
+from app.config import settings
+
+
+class PaymentGatewayError(Exception):
+    """A gateway call failed; status_code is the gateway's HTTP status (None for network errors)."""
+
+    def __init__(self, message: str, status_code: Optional[int] = None):
+        super().__init__(message)
+        self.status_code = status_code
+
+
+class PaymentGateway(ABC):
+    """
+    Operations the app needs from a payment provider. A gateway missing one
+    of them cannot be instantiated.
+    """
+
+    name = "base"
+
+    @property
+    def is_configured(self) -> bool:
+        return True
+
+    @property
+    def key_id(self) -> Optional[str]:
+        return None
+
+    @abstractmethod
+    async def create_order(self, amount: int, currency: str = "INR", receipt: Optional[str] = None, notes: Optional[Dict[str, Any]] = None) -> Dict[str, Any]:
+        ...
+
+    @abstractmethod
+    async def fetch_order(self, order_id: str) -> Dict[str, Any]:
+        ...
+
+    @abstractmethod
+    async def fetch_payment(self, payment_id: str) -> Dict[str, Any]:
+        ...
+
+    @abstractmethod
+    async def list_orders(self, from_ts: Optional[int] = None, to_ts: Optional[int] = None, count: int = 100, skip: int = 0) -> List[Dict[str, Any]]:
+        """Newest first, at most 100 per call."""
+
+    @abstractmethod
+    async def list_payments(self, from_ts: Optional[int] = None, to_ts: Optional[int] = None, count: int = 100, skip: int = 0) -> List[Dict[str, Any]]:
+        """Newest first, at most 100 per call."""
+
+    @abstractmethod
+    def verify_payment_signature(self, order_id: str, payment_id: str, signature: str) -> bool:
+        ...
+
+    async def close(self) -> None:
+        pass
+
+
+def _hmac_sha256(secret: str, message: str) -> str:
+    return hmac.new(secret.encode(), message.encode(), hashlib.sha256).hexdigest()
+
+
+class RazorpayGateway(PaymentGateway):
+    name = "razorpay"
+
+    def __init__(self, key_id: Optional[str], key_secret: Optional[str]):
+        self._key_id = key_id
+        self._key_secret = key_secret
+        self._client: Optional[httpx.AsyncClient] = None
+
+    @property
+    def is_configured(self) -> bool:
+        return bool(self._key_id and self._key_secret)
+
+    @property
+    def key_id(self) -> Optional[str]:
+        return self._key_id
+
+    def _http(self) -> httpx.AsyncClient:
+        if not self.is_configured:
+            raise PaymentGatewayError("Payment service is not configured")
+        if self._client is None:
+            self._client = httpx.AsyncClient(
+                base_url=settings.RAZORPAY_API_BASE_URL,
+                auth=(self._key_id, self._key_secret),
+                timeout=httpx.Timeout(settings.RAZORPAY_TIMEOUT_SECONDS, connect=settings.RAZORPAY_CONNECT_TIMEOUT_SECONDS),
+                limits=httpx.Limits(
+                    max_connections=settings.RAZORPAY_MAX_CONNECTIONS,
+                    max_keepalive_connections=settings.RAZORPAY_MAX_CONNECTIONS
+                )
+            )
+        return self._client
+
+    async def _request(self, method: str, path: str, timeout: Optional[float] = None, **kwargs) -> Any:
+        client = self._http()
+        attempts = 1 + (settings.RAZORPAY_GET_RETRIES if method == "GET" else 0)
+        request_timeout = timeout if timeout is not None else httpx.USE_CLIENT_DEFAULT
+        for attempt in range(attempts):
+            retryable = False
+            try:
+                response = await client.request(method, path, timeout=request_timeout, **kwargs)
+            except (httpx.TimeoutException, httpx.TransportError) as e:
+                error = PaymentGatewayError(f"Razorpay {method} {path} failed: {e!r}")
+                # A POST that timed out may still have been applied, so only GETs are retried
+                retryable = True
+            else:
+                if response.status_code < 400:
+                    return response.json()
+                try:
+                    description = response.json().get("error", {}).get("description")
+                except ValueError:
+                    description = None
+                error = PaymentGatewayError(
+                    f"Razorpay {method} {path} returned {response.status_code}: {description or response.text[:200]}",
+                    status_code=response.status_code
+                )
+                retryable = response.status_code == 429 or response.status_code >= 500
+            if not retryable or attempt == attempts - 1:
+                raise error
+            delay = settings.RAZORPAY_RETRY_BACKOFF_SECONDS * (2 ** attempt)
+            sys.stderr.write(f"[WARN] {error}; retrying in {delay:.2f}s\n")
+            sys.stderr.flush()
+            await asyncio.sleep(delay + random.uniform(0, delay / 2))
+
+    async def create_order(self, amount: int, currency: str = "INR", receipt: Optional[str] = None, notes: Optional[Dict[str, Any]] = None) -> Dict[str, Any]:
+        body: Dict[str, Any] = {"amount": int(amount), "currency": currency}
+        if receipt:
+            body["receipt"] = receipt[:40]  # Razorpay's limit
+        if notes:
+            body["notes"] = notes
+        return await self._request("POST", "/orders", json=body)
+
+    async def fetch_order(self, order_id: str) -> Dict[str, Any]:
+        return await self._request("GET", f"/orders/{order_id}")
+
+    async def fetch_payment(self, payment_id: str) -> Dict[str, Any]:
+        return await self._request("GET", f"/payments/{payment_id}")
+
+    async def _list(self, path: str, from_ts: Optional[int], to_ts: Optional[int], count: int, skip: int) -> List[Dict[str, Any]]:
+        params: Dict[str, Any] = {"count": min(count, 100), "skip": skip}
+        if from_ts is not None:
+            params["from"] = from_ts
+        if to_ts is not None:
+            params["to"] = to_ts
+        collection = await self._request("GET", path, params=params)
+        return collection.get("items", [])
+
+    async def list_orders(self, from_ts: Optional[int] = None, to_ts: Optional[int] = None, count: int = 100, skip: int = 0) -> List[Dict[str, Any]]:
+        return await self._list("/orders", from_ts, to_ts, count, skip)
+
+    async def list_payments(self, from_ts: Optional[int] = None, to_ts: Optional[int] = None, count: int = 100, skip: int = 0) -> List[Dict[str, Any]]:
+        return await self._list("/payments", from_ts, to_ts, count, skip)
+
+    def verify_payment_signature(self, order_id: str, payment_id: str, signature: str) -> bool:
+        if not self._key_secret:
+            return False
+        return hmac.compare_digest(_hmac_sha256(self._key_secret, f"{order_id}|{payment_id}"), signature or "")
+
+    async def close(self) -> None:
+        if self._client is not None:
+            await self._client.aclose()
+            self._client = None
+
+
+class StubGateway(PaymentGateway):
+    """
+    In-memory gateway. Orders and payments behave like Razorpay's (ids,
+    statuses, newest-first listing with count/skip); capture_payment() plays
+    the customer paying an order.
+    """
+    name = "stub"
+
+    def __init__(self, latency_ms: float = 0.0, key_secret: str = "stub_secret"):
+        self.latency_ms = latency_ms
+        self._key_secret = key_secret
+        self._ids = itertools.count(1)
+        self.orders: Dict[str, Dict[str, Any]] = {}
+        self.payments: Dict[str, Dict[str, Any]] = {}
+
+    @property
+    def key_id(self) -> Optional[str]:
+        return "stub"
+
+    async def _wait(self) -> None:
+        if self.latency_ms:
+            await asyncio.sleep(self.latency_ms / 1000)
+
+    def _new_id(self, prefix: str) -> str:
+        return f"{prefix}_stub{next(self._ids):012d}"
+
+    async def create_order(self, amount: int, currency: str = "INR", receipt: Optional[str] = None, notes: Optional[Dict[str, Any]] = None) -> Dict[str, Any]:
+        await self._wait()
+        order = {
+            "id": self._new_id("order"),
+            "entity": "order",
+            "amount": int(amount),
+            "amount_paid": 0,
+            "amount_due": int(amount),
+            "currency": currency,
+            "receipt": receipt,
+            "status": "created",
+            "attempts": 0,
+            "notes": notes or {},
+            "created_at": int(time.time()),
+        }
+        self.orders[order["id"]] = order
+        return dict(order)
+
+    def capture_payment(self, order_id: str, status: str = "captured") -> Dict[str, Any]:
+        """Simulate a payment against an order; returns the payment with a valid signature."""
+        order = self.orders[order_id]
+        payment = {
+            "id": self._new_id("pay"),
+            "entity": "payment",
+            "amount": order["amount"],
+            "currency": order["currency"],
+            "status": status,
+            "order_id": order_id,
+            "method": "upi",
+            "captured": status == "captured",
+            "created_at": int(time.time()),
+        }
+        self.payments[payment["id"]] = payment
+        order["attempts"] += 1
+        if status in ("captured", "authorized"):
+            order.update(status="paid", amount_paid=order["amount"], amount_due=0)
+        else:
+            order["status"] = "attempted"
+        return dict(payment, signature=_hmac_sha256(self._key_secret, f"{order_id}|{payment['id']}"))
+
+    async def fetch_order(self, order_id: str) -> Dict[str, Any]:
+        await self._wait()
+        if order_id not in self.orders:
+            raise PaymentGatewayError(f"Order {order_id} does not exist", status_code=400)
+        return dict(self.orders[order_id])
+
+    async def fetch_payment(self, payment_id: str) -> Dict[str, Any]:
+        await self._wait()
+        if payment_id not in self.payments:
+            raise PaymentGatewayError(f"Payment {payment_id} does not exist", status_code=400)
+        return dict(self.payments[payment_id])
+
+    @staticmethod
+    def _page(items: List[Dict[str, Any]], from_ts: Optional[int], to_ts: Optional[int], count: int, skip: int) -> List[Dict[str, Any]]:
+        selected = [
+            item for item in items
+            if (from_ts is None or item["created_at"] >= from_ts) and (to_ts is None or item["created_at"] <= to_ts)
+        ]
+        selected.reverse()  # newest first, like Razorpay
+        return [dict(item) for item in selected[skip:skip + min(count, 100)]]
+
+    async def list_orders(self, from_ts: Optional[int] = None, to_ts: Optional[int] = None, count: int = 100, skip: int = 0) -> List[Dict[str, Any]]:
+        await self._wait()
+        return self._page(list(self.orders.values()), from_ts, to_ts, count, skip)
+
+    async def list_payments(self, from_ts: Optional[int] = None, to_ts: Optional[int] = None, count: int = 100, skip: int = 0) -> List[Dict[str, Any]]:
+        await self._wait()
+        return self._page(list(self.payments.values()), from_ts, to_ts, count, skip)
+
+    def verify_payment_signature(self, order_id: str, payment_id: str, signature: str) -> bool:
+        return hmac.compare_digest(_hmac_sha256(self._key_secret, f"{order_id}|{payment_id}"), signature or "")
+
+
+_gateway: Optional[PaymentGateway] = None
+
+
+def get_payment_gateway() -> PaymentGateway:
+    """The process-wide gateway selected by PAYMENT_GATEWAY ("razorpay" or "stub")."""
+    global _gateway
+    if _gateway is None:
+        if settings.PAYMENT_GATEWAY == "stub":
+            _gateway = StubGateway(latency_ms=settings.PAYMENT_STUB_LATENCY_MS)
+        else:
+            _gateway = RazorpayGateway(settings.RAZORPAY_KEY_ID, settings.RAZORPAY_KEY_SECRET)
+        sys.stderr.write(f"[INFO] Payment gateway: {_gateway.name} (configured: {_gateway.is_configured})\n")
+        sys.stderr.flush()
+    return _gateway
+
+
+async def close_payment_gateway() -> None:
+    global _gateway
+    if _gateway is not None:
+        await _gateway.close()
+        _gateway = None
@@ -0,0 +1,219 @@
+"""
+Payment reconciliation between Razorpay and `bookings.payment_status`.
+
+A booking can disagree with Razorpay when verify was never called and the
+webhook was lost (or the other way round). reconcile_payments() pages through
+the orders and payments created in the last PAYMENT_RECONCILIATION_LOOKBACK_HOURS
+through the gateway interface, loads the matching bookings in a few `in_`
+selects, indexes them by razorpay_order_id in memory and compares:
+
+    paid        gateway has a captured payment (or the order is paid) but the
+                booking is not completed -> mark_booking_paid (idempotent)
+    failed      every payment of the order failed and the booking is still
+                pending/initiated/processing -> one batch update to 'failed'
+    unpaid      booking completed but the gateway shows no captured payment
+                -> reported only, money is never taken away automatically
+    amount      captured amount differs from the booking amount -> reported
+    orphan      gateway order with no booking -> reported
+
+The report is logged by the job runner and returned. Runs against whatever
+get_payment_gateway() returns; pass a StubGateway (or point
+RAZORPAY_API_BASE_URL at a local Razorpay stand-in) to run it locally:
+
+    python -m app.services.payment_reconciliation --dry-run --hours 24
+"""
+import asyncio
+import sys
+import time
+from typing import Any, Dict, List, Optional
+
+from fastapi import HTTPException
+
+from app.config import settings
+from app.database import supabase_admin
+from app.services.booking_payments import mark_booking_paid, notify_booking_paid
+from app.services.dashboard_cache import invalidate_users
+from app.services.payment_gateway import PaymentGateway, get_payment_gateway
+
+CAPTURED_STATUSES = ("captured", "authorized")
+FAILABLE_STATUSES = ("pending", "initiated", "processing")
+REPORT_ENTRIES = 50
+BOOKING_COLUMNS = "id, care_recipient_id, caregiver_id, amount, currency, payment_status, razorpay_order_id, razorpay_payment_id"
+
+
+async def _list_all(list_page, from_ts: int, to_ts: int) -> List[Dict[str, Any]]:
+    """Page through a gateway listing (100 per page, Razorpay's maximum)."""
+    page_size = settings.PAYMENT_RECONCILIATION_PAGE_SIZE
+    items: List[Dict[str, Any]] = []
+    for _ in range(settings.PAYMENT_RECONCILIATION_MAX_PAGES):
+        page = await list_page(from_ts=from_ts, to_ts=to_ts, count=page_size, skip=len(items))
+        items.extend(page)
+        if len(page) < page_size:
+            return items
+    sys.stderr.write(f"[WARN] Reconciliation stopped after {len(items)} items; raise PAYMENT_RECONCILIATION_MAX_PAGES\n")
+    sys.stderr.flush()
+    return items
+
+
+def _load_bookings(order_ids: List[str]) -> Dict[str, Dict[str, Any]]:
+    """Bookings for the given orders, indexed by razorpay_order_id."""
+    index: Dict[str, Dict[str, Any]] = {}
+    chunk = settings.PAYMENT_RECONCILIATION_LOOKUP_CHUNK
+    for start in range(0, len(order_ids), chunk):
+        response = supabase_admin.table("bookings").select(BOOKING_COLUMNS).in_(
+            "razorpay_order_id", order_ids[start:start + chunk]
+        ).execute()
+        for booking in response.data or []:
+            index[booking["razorpay_order_id"]] = booking
+    return index
+
+
+def _amount_paise(amount: Any) -> Optional[int]:
+    return None if amount is None else int(round(float(amount) * 100))
+
+
+def diff_bookings(
+    orders: List[Dict[str, Any]],
+    payments: List[Dict[str, Any]],
+    bookings_by_order: Dict[str, Dict[str, Any]]
+) -> Dict[str, List[Dict[str, Any]]]:
+    """Compare gateway orders and payments with bookings; returns the findings by kind."""
+    payments_by_order: Dict[str, List[Dict[str, Any]]] = {}
+    for payment in payments:
+        if payment.get("order_id"):
+            payments_by_order.setdefault(payment["order_id"], []).append(payment)
+
+    findings: Dict[str, List[Dict[str, Any]]] = {"paid": [], "failed": [], "unpaid": [], "amount": [], "orphan": []}
+    order_ids = {order["id"] for order in orders} | set(payments_by_order)
+    orders_by_id = {order["id"]: order for order in orders}
+
+    for order_id in sorted(order_ids):
+        order = orders_by_id.get(order_id, {})
+        order_payments = payments_by_order.get(order_id, [])
+        booking = bookings_by_order.get(order_id)
+        if booking is None:
+            findings["orphan"].append({"order_id": order_id, "status": order.get("status")})
+            continue
+
+        captured = next((p for p in order_payments if p.get("status") in CAPTURED_STATUSES), None)
+        is_paid = captured is not None or order.get("status") == "paid"
+        entry = {"booking_id": booking["id"], "order_id": order_id, "payment_status": booking.get("payment_status")}
+
+        if is_paid:
+            if booking.get("payment_status") not in ("completed", "refunded"):
+                findings["paid"].append(dict(entry, payment_id=captured["id"] if captured else None))
+            paid_amount = captured.get("amount") if captured else order.get("amount_paid")
+            booking_amount = _amount_paise(booking.get("amount"))
+            if paid_amount is not None and booking_amount is not None and int(paid_amount) != booking_amount:
+                findings["amount"].append(dict(entry, gateway_amount=int(paid_amount), booking_amount=booking_amount))
+        elif order_payments and all(p.get("status") == "failed" for p in order_payments):
+            if booking.get("payment_status") in FAILABLE_STATUSES:
+                findings["failed"].append(entry)
+        elif booking.get("payment_status") == "completed" and order:
+            findings["unpaid"].append(dict(entry, order_status=order.get("status")))
+
+    return findings
+
+
+def _apply_fixes(findings: Dict[str, List[Dict[str, Any]]]) -> Dict[str, Any]:
+    """
+    Mark missed payments paid and flip failed ones in one batch update. Runs in
+    a worker thread; mark_booking_paid schedules booking timers from here, which
+    the transition scheduler's lock makes safe against tick() on the loop.
+    """
+    newly_paid: List[Dict[str, Any]] = []
+    errors: List[Dict[str, Any]] = []
+    for entry in findings["paid"]:
+        try:
+            result = mark_booking_paid(entry["booking_id"], razorpay_payment_id=entry.get("payment_id"), ledger_source="reconciliation")
+        except HTTPException as e:
+            errors.append(dict(entry, error=e.detail))
+            continue
+        except Exception as e:
+            errors.append(dict(entry, error=str(e)))
+            continue
+        if not result.get("already_paid"):
+            newly_paid.append(result)
+
+    failed_ids = [entry["booking_id"] for entry in findings["failed"]]
+    failed_count = 0
+    if failed_ids:
+        # Conditional on the status we saw, so a payment completed meanwhile wins
+        response = supabase_admin.table("bookings").update({"payment_status": "failed"}).in_(
+            "id", failed_ids
+        ).in_("payment_status", list(FAILABLE_STATUSES)).execute()
+        failed_count = len(response.data or [])
+        for booking in response.data or []:
+            invalidate_users(booking.get("care_recipient_id"), booking.get("caregiver_id"))
+
+    return {"newly_paid": newly_paid, "marked_failed": failed_count, "errors": errors}
+
+
+async def reconcile_payments(
+    gateway: Optional[PaymentGateway] = None,
+    lookback_hours: Optional[float] = None,
+    dry_run: bool = False
+) -> dict:
+    """
+    Reconcile the recent window and return a report. With dry_run the
+    findings are reported but nothing is changed.
+    """
+    gateway = gateway or get_payment_gateway()
+    if not gateway.is_configured:
+        return {}
+    hours = lookback_hours if lookback_hours is not None else settings.PAYMENT_RECONCILIATION_LOOKBACK_HOURS
+    to_ts = int(time.time())
+    from_ts = to_ts - int(hours * 3600)
+
+    orders, payments = await asyncio.gather(
+        _list_all(gateway.list_orders, from_ts, to_ts),
+        _list_all(gateway.list_payments, from_ts, to_ts)
+    )
+    order_ids = sorted({order["id"] for order in orders} | {p["order_id"] for p in payments if p.get("order_id")})
+    bookings_by_order = await asyncio.to_thread(_load_bookings, order_ids) if order_ids else {}
+    findings = diff_bookings(orders, payments, bookings_by_order)
+
+    report: Dict[str, Any] = {
+        "orders": len(orders),
+        "payments": len(payments),
+        "bookings": len(bookings_by_order),
+        "counts": {kind: len(entries) for kind, entries in findings.items() if entries},
+        # Entries are capped so a large backlog does not flood the log
+        "findings": {kind: entries[:REPORT_ENTRIES] for kind, entries in findings.items() if entries},
+    }
+    if dry_run or not (findings["paid"] or findings["failed"]):
+        return report
+
+    applied = await asyncio.to_thread(_apply_fixes, findings)
+    for result in applied["newly_paid"]:
+        await notify_booking_paid(result)
+    report["marked_paid"] = len(applied["newly_paid"])
+    report["marked_failed"] = applied["marked_failed"]
+    if applied["errors"]:
+        report["errors"] = applied["errors"]
+    return report
+
+
+async def run_reconciliation_job() -> dict:
+    """Periodic job entry point: the report without the clean-run noise."""
+    report = await reconcile_payments()
+    return report if report.get("findings") else {}
+
+
+if __name__ == "__main__":
+    import argparse
+    import json
+
+    parser = argparse.ArgumentParser(description="Reconcile booking payment status with the payment gateway")
+    parser.add_argument("--hours", type=float, default=None, help="Lookback window (default PAYMENT_RECONCILIATION_LOOKBACK_HOURS)")
+    parser.add_argument("--dry-run", action="store_true", help="Report findings without changing bookings")
+    args = parser.parse_args()
+
+    async def _main():
+        try:
+            return await reconcile_payments(lookback_hours=args.hours, dry_run=args.dry_run)
+        finally:
+            from app.services.payment_gateway import close_payment_gateway
+            await close_payment_gateway()
+
+    print(json.dumps(asyncio.run(_main()), indent=2, default=str), flush=True)
@@ -0,0 +1,246 @@
+"""
+Razorpay webhook inbox and worker.
+
+The webhook endpoint does the minimum before acknowledging: it verifies the
+signature over the raw body, stores the event in `payment_webhook_events`
+(database/migrations/add_payment_webhook_events.sql) keyed by Razorpay's event
+id, and returns 200. A redelivered event is recognised by its id (in memory
+first, then by the primary key) and not stored twice.
+
+process_pending_events() applies stored events. Events for the same order run
+one after another in the order Razorpay created them, and a failed event holds
+back the later events of its order until it succeeds or runs out of
+attempts. Failed attempts are retried with exponential backoff, so a short
+database outage does not use up PAYMENT_WEBHOOK_MAX_ATTEMPTS. Different orders do not wait for each other. The worker runs
+periodically and is also woken by each new event.
+
+Applying an event is idempotent (mark_booking_paid is a no-op for a paid
+booking, refunds are keyed by refund id), so a second instance or a retry
+cannot pay or refund a booking twice. refund.processed events append a
+refund to the payment ledger.
+"""
+import asyncio
+import hashlib
+import hmac
+import sys
+from collections import OrderedDict
+from datetime import datetime, timedelta, timezone
+from typing import Any, Dict, List, Optional, Tuple
+
+from fastapi import HTTPException
+
+from app.config import settings
+from app.database import supabase_admin
+from app.services.booking_payments import mark_booking_paid, notify_booking_paid, record_booking_refund
+from app.services.dashboard_cache import invalidate_users
+
+PAID_EVENTS = {"payment.captured", "order.paid"}
+FAILED_EVENTS = {"payment.failed"}
+REFUND_EVENTS = {"refund.processed"}
+
+# Recently stored event ids, so retried deliveries skip the database
+_recent_event_ids: "OrderedDict[str, None]" = OrderedDict()
+_worker_lock = asyncio.Lock()
+_worker_task: Optional[asyncio.Task] = None
+_rerun = False
+
+
+def webhook_secret() -> Optional[str]:
+    return settings.RAZORPAY_WEBHOOK_SECRET or settings.RAZORPAY_KEY_SECRET
+
+
+def verify_webhook_signature(body: bytes, signature: Optional[str]) -> bool:
+    """Razorpay signs the raw request body with HMAC-SHA256 and the webhook secret."""
+    secret = webhook_secret()
+    if not secret or not signature:
+        return False
+    expected = hmac.new(secret.encode(), body, hashlib.sha256).hexdigest()
+    return hmac.compare_digest(expected, signature)
+
+
+def _event_row(event_id: str, event: Dict[str, Any]) -> Dict[str, Any]:
+    payload = event.get("payload") or {}
+    payment = (payload.get("payment") or {}).get("entity") or {}
+    order = (payload.get("order") or {}).get("entity") or {}
+    created_at = event.get("created_at")
+    return {
+        "event_id": event_id,
+        "event": event.get("event") or "unknown",
+        "order_id": payment.get("order_id") or order.get("id"),
+        "payment_id": payment.get("id"),
+        "event_created_at": datetime.fromtimestamp(created_at, tz=timezone.utc).isoformat() if isinstance(created_at, (int, float)) else None,
+        "payload": event,
+    }
+
+
+def _remember(event_id: str) -> None:
+    _recent_event_ids[event_id] = None
+    while len(_recent_event_ids) > settings.PAYMENT_WEBHOOK_DEDUPE_CACHE_SIZE:
+        _recent_event_ids.popitem(last=False)
+
+
+def _insert_event(row: Dict[str, Any]) -> bool:
+    response = supabase_admin.table("payment_webhook_events").upsert(
+        row, on_conflict="event_id", ignore_duplicates=True
+    ).execute()
+    return bool(response.data)
+
+
+async def store_event(event_id: str, event: Dict[str, Any]) -> bool:
+    """
+    Persist a verified event. Returns False for a duplicate delivery. Raises
+    asyncio.TimeoutError when the database does not answer within
+    PAYMENT_WEBHOOK_PERSIST_TIMEOUT_SECONDS, so the caller can ask Razorpay to
+    retry rather than acknowledge an event it has not stored.
+    """
+    if event_id in _recent_event_ids:
+        return False
+    inserted = await asyncio.wait_for(
+        asyncio.to_thread(_insert_event, _event_row(event_id, event)),
+        timeout=settings.PAYMENT_WEBHOOK_PERSIST_TIMEOUT_SECONDS
+    )
+    _remember(event_id)
+    return inserted
+
+
+def wake_worker() -> None:
+    """Start processing now (or right after the current run) instead of at the next interval."""
+    global _worker_task, _rerun
+    if _worker_task is not None and not _worker_task.done():
+        _rerun = True
+        return
+    _worker_task = asyncio.create_task(_run_worker())
+
+
+async def _run_worker() -> None:
+    global _rerun
+    while True:
+        _rerun = False
+        try:
+            await process_pending_events()
+        except Exception as e:
+            sys.stderr.write(f"[ERROR] Payment webhook worker failed: {e}\n")
+            sys.stderr.flush()
+            return
+        if not _rerun:
+            return
+
+
+# Applying events
+
+def _fetch_pending() -> List[Dict[str, Any]]:
+    """Pending events that are due, skipping orders whose failed event waits for its retry time."""
+    response = supabase_admin.rpc("fetch_due_payment_webhook_events", {
+        "p_limit": settings.PAYMENT_WEBHOOK_BATCH_SIZE
+    }).execute()
+    return response.data or []
+
+
+def _retry_delay(attempts: int) -> float:
+    """Exponential backoff after the given number of failed attempts, capped."""
+    return min(
+        settings.PAYMENT_WEBHOOK_RETRY_BASE_SECONDS * 2 ** (attempts - 1),
+        settings.PAYMENT_WEBHOOK_RETRY_MAX_SECONDS
+    )
+
+
+def _apply_event(row: Dict[str, Any]) -> Tuple[str, Optional[str], Optional[Dict[str, Any]]]:
+    """
+    Apply one event to its booking. Returns (status, note, paid result): status
+    is 'processed' or 'ignored', note says why an event was ignored, and the
+    mark_booking_paid result is set for newly paid bookings (for
+    notifications). Raises to have the event retried.
+    """
+    event = row["event"]
+    order_id = row.get("order_id")
+    if event not in PAID_EVENTS | FAILED_EVENTS | REFUND_EVENTS:
+        return "ignored", None, None
+    if not order_id:
+        return "ignored", "event has no order id", None
+
+    booking_response = supabase_admin.table("bookings").select("id, payment_status").eq("razorpay_order_id", order_id).limit(1).execute()
+    if not booking_response.data:
+        # e.g. create-order replaced the booking's order while an older checkout was still open
+        note = f"no booking for order {order_id} (payment {row.get('payment_id')})"
+        level = "[WARN]" if event in PAID_EVENTS | REFUND_EVENTS else "[INFO]"
+        sys.stderr.write(f"{level} Payment webhook {row['event_id']} ({event}): {note}\n")
+        sys.stderr.flush()
+        return "ignored", note, None
+    booking = booking_response.data[0]
+
+    if event in PAID_EVENTS:
+        try:
+            result = mark_booking_paid(booking["id"], razorpay_payment_id=row.get("payment_id"), ledger_source="webhook")
+        except HTTPException as e:
+            raise RuntimeError(e.detail)
+        return "processed", None, None if result.get("already_paid") else result
+
+    if event in REFUND_EVENTS:
+        refund = ((row.get("payload") or {}).get("payload") or {}).get("refund", {}).get("entity") or {}
+        if not refund.get("id") or refund.get("amount") is None:
+            return "ignored", "refund event without refund id or amount", None
+        try:
+            record_booking_refund(booking["id"], refund["id"], refund["amount"] / 100, source="webhook")
+        except HTTPException as e:
+            raise RuntimeError(e.detail)
+        return "processed", None, None
+
+    # payment.failed: a later successful attempt on the same order must win
+    response = supabase_admin.table("bookings").update({"payment_status": "failed"}).eq("id", booking["id"]).not_.in_(
+        "payment_status", ["completed", "refunded"]
+    ).execute()
+    for updated in response.data or []:
+        invalidate_users(updated.get("care_recipient_id"), updated.get("caregiver_id"))
+    return "processed", None, None
+
+
+def _finish(row: Dict[str, Any], status: str, error: Optional[str] = None) -> None:
+    attempts = (row.get("attempts") or 0) + 1
+    now = datetime.now(timezone.utc)
+    update: Dict[str, Any] = {"status": status, "attempts": attempts, "last_error": error}
+    if status == "pending":
+        update["next_attempt_at"] = (now + timedelta(seconds=_retry_delay(attempts))).isoformat()
+    else:
+        update["processed_at"] = now.isoformat()
+    supabase_admin.table("payment_webhook_events").update(update).eq("event_id", row["event_id"]).execute()
+
+
+async def _apply_order_events(rows: List[Dict[str, Any]], summary: Dict[str, int]) -> None:
+    """Apply one order's events in sequence, stopping at the first failure."""
+    for row in rows:
+        try:
+            status, note, result = await asyncio.to_thread(_apply_event, row)
+        except Exception as e:
+            attempts = (row.get("attempts") or 0) + 1
+            status = "failed" if attempts >= settings.PAYMENT_WEBHOOK_MAX_ATTEMPTS else "pending"
+            sys.stderr.write(f"[WARN] Payment webhook event {row['event_id']} ({row['event']}) failed, attempt {attempts}: {e}\n")
+            sys.stderr.flush()
+            await asyncio.to_thread(_finish, row, status, str(e)[:500])
+            summary[status] = summary.get(status, 0) + 1
+            if status == "pending":
+                return  # later events of this order wait for this one
+            continue
+
+        await asyncio.to_thread(_finish, row, status, note)
+        summary[status] = summary.get(status, 0) + 1
+        if result:
+            await notify_booking_paid(result)
+
+
+async def process_pending_events() -> dict:
+    """Apply every pending event, batch by batch. Used by the periodic job and by wake_worker()."""
+    async with _worker_lock:
+        summary: Dict[str, int] = {}
+        while True:
+            rows = await asyncio.to_thread(_fetch_pending)
+            if not rows:
+                break
+            by_order: "OrderedDict[str, List[Dict[str, Any]]]" = OrderedDict()
+            for row in rows:
+                by_order.setdefault(row.get("order_id") or row["event_id"], []).append(row)
+            before = summary.get("pending", 0)
+            await asyncio.gather(*(_apply_order_events(order_rows, summary) for order_rows in by_order.values()))
+            if len(rows) < settings.PAYMENT_WEBHOOK_BATCH_SIZE or summary.get("pending", 0) > before:
+                # Short batch, or something is being retried: leave the rest for the next run
+                break
+        return summary
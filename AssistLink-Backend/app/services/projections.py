@@ -0,0 +1,108 @@
+"""
+Named column projections for Supabase selects.
+
+Routers select and embed related rows through these projections instead of
+`(*)`, so a booking list carries the other party's name and photo rather than
+their address, current_location and emergency contact.
+
+    select_list("booking_list", embeds={"caregiver": ("caregiver_id", "user_card")})
+    -> "id, care_recipient_id, ..., caregiver:caregiver_id(id, full_name, email, profile_photo_url)"
+
+List endpoints also accept a `?fields=` sparse fieldset: a comma-separated
+subset of the projection's columns and embed aliases. parse_fields() validates
+it, select_list() fetches only those (plus any columns the endpoint needs
+internally) and trim_rows() drops the internal extras from the response.
+"""
+from typing import Dict, Iterable, List, Optional, Set, Tuple
+
+from fastapi import HTTPException, status
+
+PROJECTIONS: Dict[str, Tuple[str, ...]] = {
+    # Another user as shown in lists: who they are, never where they are
+    "user_card": ("id", "full_name", "email", "profile_photo_url"),
+    "caregiver_list": (
+        "id", "full_name", "email", "profile_photo_url", "role", "is_active", "created_at", "updated_at",
+    ),
+    "caregiver_profile_public": (
+        "id", "user_id", "skills", "availability_status", "availability_schedule", "qualifications",
+        "experience_years", "bio", "hourly_rate", "avg_rating", "total_reviews", "updated_at",
+    ),
+    # Payment ids and signatures are left to the payment endpoints
+    "booking_list": (
+        "id", "care_recipient_id", "caregiver_id", "video_call_request_id", "chat_session_id",
+        "service_type", "scheduled_date", "duration_hours", "location", "specific_needs",
+        "recurring_pattern", "is_recurring", "status", "accepted_at", "completed_at",
+        "created_at", "updated_at", "amount", "currency", "payment_status",
+    ),
+    "video_call_list": (
+        "id", "care_recipient_id", "caregiver_id", "scheduled_time", "duration_seconds", "status",
+        "care_recipient_accepted", "caregiver_accepted", "video_call_url", "completed_at",
+        "created_at", "updated_at",
+    ),
+    "video_call_card": (
+        "id", "scheduled_time", "duration_seconds", "status", "care_recipient_accepted",
+        "caregiver_accepted", "video_call_url", "completed_at",
+    ),
+    "chat_session_card": (
+        "id", "is_enabled", "care_recipient_accepted", "caregiver_accepted", "enabled_at",
+    ),
+    "message_list": (
+        "id", "chat_session_id", "sender_id", "recipient_id", "content", "message_type",
+        "attachment_url", "read_at", "created_at",
+    ),
+}
+
+# Columns booking occurrence expansion reads (see app/services/recurrence.py)
+RECURRENCE_COLUMNS = ("id", "scheduled_date", "duration_hours", "is_recurring", "recurring_pattern", "updated_at", "created_at")
+
+# alias -> (foreign key column, projection name)
+Embeds = Dict[str, Tuple[str, str]]
+
+
+def columns(projection: str) -> str:
+    """Comma-separated column list of a projection."""
+    return ", ".join(PROJECTIONS[projection])
+
+
+def parse_fields(fields: Optional[str], projection: str, embeds: Optional[Embeds] = None) -> Optional[List[str]]:
+    """Validate a `?fields=` value against a projection and its embeds; None means all fields."""
+    if not fields:
+        return None
+    requested = list(dict.fromkeys(field.strip() for field in fields.split(",") if field.strip()))
+    allowed = set(PROJECTIONS[projection]) | set(embeds or {})
+    unknown = [field for field in requested if field not in allowed]
+    if unknown:
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail=f"Unknown fields: {', '.join(unknown)}. Valid fields: {', '.join(sorted(allowed))}"
+        )
+    return requested
+
+
+def select_list(
+    projection: str,
+    embeds: Optional[Embeds] = None,
+    fields: Optional[List[str]] = None,
+    required: Iterable[str] = ()
+) -> str:
+    """
+    Build a select string for `projection` with its embeds. With `fields`,
+    only those columns and embeds are selected, plus the `required` columns.
+    """
+    embeds = embeds or {}
+    wanted: Optional[Set[str]] = set(fields) | set(required) if fields is not None else None
+    parts = [column for column in PROJECTIONS[projection] if wanted is None or column in wanted]
+    for alias, (foreign_key, embed_projection) in embeds.items():
+        if wanted is None or alias in wanted:
+            parts.append(f"{alias}:{foreign_key}({columns(embed_projection)})")
+    return ", ".join(parts)
+
+
+def trim_rows(rows: List[dict], fields: Optional[List[str]], required: Iterable[str] = ()) -> List[dict]:
+    """Drop the `required` columns that were only fetched for internal use from a sparse response."""
+    if fields is None:
+        return rows
+    extra = set(required) - set(fields)
+    if not extra:
+        return rows
+    return [{key: value for key, value in row.items() if key not in extra} for row in rows]
@@ -0,0 +1,329 @@
+"""
+Recurring booking occurrence engine.
+
+A recurring booking is one template row whose scheduled_date is the first
+occurrence and whose recurring_pattern describes the rest:
+
+    {"frequency": "daily" | "weekly" | "monthly",
+     "interval": 1,                       # optional, every N days/weeks/months
+     "days_of_week": ["monday", ...],     # weekly only; names or numbers
+     "end_date": "2026-12-31"}            # optional, last day (inclusive)
+
+days_of_week numbers follow ISO (1 = Monday ... 7 = Sunday); 0 is also read as
+Sunday so JavaScript getDay() values work. Occurrences keep the template's
+UTC time of day.
+
+Occurrences are generated lazily for the requested window only, starting
+directly at the window instead of walking the series from its first date, so
+the cost depends on the window and not on how old the series is. Expansions
+are cached per booking for day-aligned windows, and per-occurrence exceptions
+(cancelled or rescheduled occurrences, stored in booking_occurrence_exceptions)
+are applied on top.
+"""
+import heapq
+import threading
+import time
+from collections import OrderedDict
+from datetime import date, datetime, timedelta, timezone
+from typing import Any, Dict, Iterable, Iterator, List, Optional, Tuple
+
+from app.config import settings
+from app.database import supabase_admin
+
+DAY_NAMES = {
+    "monday": 0, "mon": 0,
+    "tuesday": 1, "tue": 1, "tues": 1,
+    "wednesday": 2, "wed": 2,
+    "thursday": 3, "thu": 3, "thurs": 3,
+    "friday": 4, "fri": 4,
+    "saturday": 5, "sat": 5,
+    "sunday": 6, "sun": 6,
+}
+
+# (original start, start, duration_hours, is_exception)
+Occurrence = Tuple[datetime, datetime, float, bool]
+
+# (booking_id, version, window_start, window_end) -> (expires_at monotonic, occurrences)
+_expansion_cache: "OrderedDict[Tuple[str, str, datetime, datetime], Tuple[float, List[Occurrence]]]" = OrderedDict()
+# booking_id -> (expires_at monotonic, {original start: exception row})
+_exceptions_cache: Dict[str, Tuple[float, Dict[datetime, Dict[str, Any]]]] = {}
+# Expansions may run in worker threads (dashboard summary), so the LRU is guarded
+_expansion_lock = threading.Lock()
+
+
+def parse_datetime(value: Any) -> datetime:
+    """Parse a Supabase timestamp (or pass a datetime through) as an aware UTC datetime."""
+    if isinstance(value, datetime):
+        parsed = value
+    else:
+        parsed = datetime.fromisoformat(str(value).replace("Z", "+00:00"))
+    if parsed.tzinfo is None:
+        parsed = parsed.replace(tzinfo=timezone.utc)
+    return parsed.astimezone(timezone.utc)
+
+
+def _parse_end(value: Any) -> Optional[datetime]:
+    """Exclusive upper bound for occurrence starts from the pattern's end_date."""
+    if not value:
+        return None
+    text = str(value)
+    if len(text) == 10:
+        end_day = date.fromisoformat(text)
+        return datetime(end_day.year, end_day.month, end_day.day, tzinfo=timezone.utc) + timedelta(days=1)
+    return parse_datetime(text) + timedelta(microseconds=1)
+
+
+def _parse_days(values: Optional[Iterable[Any]], default: int) -> List[int]:
+    days = set()
+    for value in values or []:
+        if isinstance(value, str) and value.strip().lower() in DAY_NAMES:
+            days.add(DAY_NAMES[value.strip().lower()])
+            continue
+        try:
+            number = int(value)
+        except (TypeError, ValueError):
+            continue
+        if number in (0, 7):
+            days.add(6)
+        elif 1 <= number <= 6:
+            days.add(number - 1)
+    return sorted(days) if days else [default]
+
+
+def _add_months(year: int, month: int, months: int) -> Tuple[int, int]:
+    index = year * 12 + (month - 1) + months
+    return index // 12, index % 12 + 1
+
+
+def iter_occurrence_starts(booking: Dict[str, Any], window_start: datetime, window_end: datetime) -> Iterator[datetime]:
+    """
+    Yield, in order, the pattern start times of every occurrence of `booking`
+    that overlaps [window_start, window_end). Exceptions are not applied.
+    """
+    first = parse_datetime(booking["scheduled_date"])
+    duration = timedelta(hours=float(booking.get("duration_hours") or 2.0))
+    pattern = booking.get("recurring_pattern") or {}
+    lower = window_start - duration  # earliest start that still overlaps the window
+
+    frequency = str(pattern.get("frequency") or "").lower() if booking.get("is_recurring") else ""
+    if frequency not in ("daily", "weekly", "monthly"):
+        if lower < first < window_end:
+            yield first
+        return
+
+    stop = window_end
+    end_limit = _parse_end(pattern.get("end_date"))
+    if end_limit is not None:
+        stop = min(stop, end_limit)
+    try:
+        interval = max(1, int(pattern.get("interval") or 1))
+    except (TypeError, ValueError):
+        interval = 1
+
+    if frequency == "daily":
+        step = timedelta(days=interval)
+        skip = 0
+        if lower > first:
+            skip = -(-(lower - first) // step)  # ceiling division
+        start = first + skip * step
+        while start < stop:
+            if start > lower:
+                yield start
+            start += step
+        return
+
+    if frequency == "weekly":
+        days = _parse_days(pattern.get("days_of_week"), first.weekday())
+        anchor = first - timedelta(days=first.weekday())  # same time of day, Monday of the first week
+        week = 0
+        if lower > anchor:
+            week = (lower - anchor).days // 7
+            week -= week % interval
+        while True:
+            week_start = anchor + timedelta(weeks=week)
+            if week_start >= stop:
+                return
+            for day in days:
+                start = week_start + timedelta(days=day)
+                if start >= stop:
+                    return
+                if start >= first and start > lower:
+                    yield start
+            week += interval
+
+    # monthly: same day of month; months without that day are skipped
+    month = 0
+    if lower > first:
+        month = (lower.year - first.year) * 12 + (lower.month - first.month) - 1
+        month = max(0, month - month % interval)
+    while True:
+        year, month_number = _add_months(first.year, first.month, month)
+        month_start = datetime(year, month_number, 1, tzinfo=timezone.utc)
+        if month_start >= stop:
+            return
+        try:
+            start = first.replace(year=year, month=month_number)
+        except ValueError:
+            start = None
+        if start is not None:
+            if start >= stop:
+                return
+            if start > lower:
+                yield start
+        month += interval
+
+
+def load_exceptions(booking_ids: Iterable[str]) -> Dict[str, Dict[datetime, Dict[str, Any]]]:
+    """Occurrence exceptions per booking, fetching all cache misses with one query."""
+    now = time.monotonic()
+    result: Dict[str, Dict[datetime, Dict[str, Any]]] = {}
+    missing: List[str] = []
+    for booking_id in booking_ids:
+        booking_id = str(booking_id)
+        cached = _exceptions_cache.get(booking_id)
+        if cached and cached[0] > now:
+            result[booking_id] = cached[1]
+        else:
+            missing.append(booking_id)
+
+    if missing:
+        response = supabase_admin.table("booking_occurrence_exceptions").select("*").in_("booking_id", missing).execute()
+        loaded: Dict[str, Dict[datetime, Dict[str, Any]]] = {booking_id: {} for booking_id in missing}
+        for row in response.data or []:
+            loaded[str(row["booking_id"])][parse_datetime(row["occurrence_start"])] = row
+        if len(_exceptions_cache) + len(loaded) > settings.RECURRING_CACHE_MAX_ENTRIES:
+            _exceptions_cache.clear()
+        expires_at = now + settings.RECURRING_CACHE_SECONDS
+        for booking_id, exceptions in loaded.items():
+            _exceptions_cache[booking_id] = (expires_at, exceptions)
+        result.update(loaded)
+    return result
+
+
+def invalidate_booking(booking_id: str) -> None:
+    """Drop cached expansions and exceptions for a booking after it changes."""
+    booking_id = str(booking_id)
+    _exceptions_cache.pop(booking_id, None)
+    with _expansion_lock:
+        for key in [key for key in _expansion_cache if key[0] == booking_id]:
+            del _expansion_cache[key]
+
+
+def _day_floor(value: datetime) -> datetime:
+    return value.replace(hour=0, minute=0, second=0, microsecond=0)
+
+
+def _expand(
+    booking: Dict[str, Any],
+    window_start: datetime,
+    window_end: datetime,
+    exceptions: Dict[datetime, Dict[str, Any]]
+) -> List[Occurrence]:
+    duration = float(booking.get("duration_hours") or 2.0)
+    occurrences: List[Occurrence] = []
+    for original in iter_occurrence_starts(booking, window_start, window_end):
+        exception = exceptions.get(original)
+        if exception is None:
+            occurrences.append((original, original, duration, False))
+        elif not exception.get("is_cancelled"):
+            start = parse_datetime(exception["scheduled_date"]) if exception.get("scheduled_date") else original
+            length = float(exception["duration_hours"]) if exception.get("duration_hours") is not None else duration
+            if start < window_end and start + timedelta(hours=length) > window_start:
+                occurrences.append((original, start, length, True))
+
+    # Occurrences moved into the window from outside it
+    for original, exception in exceptions.items():
+        if exception.get("is_cancelled") or not exception.get("scheduled_date"):
+            continue
+        start = parse_datetime(exception["scheduled_date"])
+        length = float(exception["duration_hours"]) if exception.get("duration_hours") is not None else duration
+        original_overlaps = original < window_end and original + timedelta(hours=duration) > window_start
+        if not original_overlaps and start < window_end and start + timedelta(hours=length) > window_start:
+            occurrences.append((original, start, length, True))
+
+    occurrences.sort(key=lambda occurrence: occurrence[1])
+    return occurrences
+
+
+def _cached_expand(
+    booking: Dict[str, Any],
+    window_start: datetime,
+    window_end: datetime,
+    exceptions: Dict[datetime, Dict[str, Any]]
+) -> List[Occurrence]:
+    # Cache day-aligned windows so that "now"-relative views share entries
+    day_start = _day_floor(window_start)
+    day_end = _day_floor(window_end)
+    if day_end < window_end:
+        day_end += timedelta(days=1)
+    version = str(booking.get("updated_at") or booking.get("created_at") or "")
+    key = (str(booking["id"]), version, day_start, day_end)
+
+    now = time.monotonic()
+    with _expansion_lock:
+        cached = _expansion_cache.get(key)
+        if cached and cached[0] > now:
+            _expansion_cache.move_to_end(key)
+    if cached and cached[0] > now:
+        occurrences = cached[1]
+    else:
+        occurrences = _expand(booking, day_start, day_end, exceptions)
+        with _expansion_lock:
+            _expansion_cache[key] = (now + settings.RECURRING_CACHE_SECONDS, occurrences)
+            while len(_expansion_cache) > settings.RECURRING_CACHE_MAX_ENTRIES:
+                _expansion_cache.popitem(last=False)
+
+    return [
+        occurrence for occurrence in occurrences
+        if occurrence[1] < window_end and occurrence[1] + timedelta(hours=occurrence[2]) > window_start
+    ]
+
+
+def _as_row(booking: Dict[str, Any], occurrence: Occurrence) -> Dict[str, Any]:
+    original, start, duration, is_exception = occurrence
+    row = dict(booking)
+    row["scheduled_date"] = start.isoformat()
+    row["duration_hours"] = duration
+    row["occurrence_start"] = original.isoformat()
+    row["is_occurrence"] = bool(booking.get("is_recurring"))
+    row["is_exception"] = is_exception
+    return row
+
+
+def iter_booking_occurrences(
+    bookings: List[Dict[str, Any]],
+    window_start: datetime,
+    window_end: datetime
+) -> Iterator[Dict[str, Any]]:
+    """
+    Yield booking rows for every occurrence in [window_start, window_end),
+    ordered by start time. Non-recurring bookings yield themselves when they
+    fall in the window; recurring ones yield one copy per occurrence with
+    scheduled_date/duration_hours set for that occurrence and
+    occurrence_start set to its pattern start (the key for exceptions).
+    """
+    max_end = window_start + timedelta(days=settings.RECURRING_MAX_WINDOW_DAYS)
+    if window_end > max_end:
+        window_end = max_end
+
+    recurring_ids = [str(b["id"]) for b in bookings if b.get("is_recurring")]
+    exceptions = load_exceptions(recurring_ids) if recurring_ids else {}
+
+    streams = []
+    for booking in bookings:
+        booking_exceptions = exceptions.get(str(booking["id"]), {})
+        occurrences = _cached_expand(booking, window_start, window_end, booking_exceptions)
+        if occurrences:
+            streams.append([(booking, occurrence) for occurrence in occurrences])
+
+    for booking, occurrence in heapq.merge(*streams, key=lambda item: item[1][1]):
+        yield _as_row(booking, occurrence)
+
+
+def next_occurrence(booking: Dict[str, Any], after: datetime) -> Optional[Dict[str, Any]]:
+    """The first occurrence of the booking starting at or after `after`, if any."""
+    window_end = after + timedelta(days=settings.RECURRING_MAX_WINDOW_DAYS)
+    for row in iter_booking_occurrences([booking], after, window_end):
+        if parse_datetime(row["scheduled_date"]) >= after:
+            return row
+    return None
@@ -0,0 +1,110 @@
+"""
+Hierarchical timing wheel.
+
+Timers are kept in `levels` wheels of `wheel_size` buckets. Level 0 buckets are
+one tick wide, level 1 buckets are `wheel_size` ticks wide, and so on, so a
+4 x 64 wheel with 1 second ticks covers about 194 days. Adding and cancelling
+a timer is O(1), and each tick only touches the level 0 bucket that is due.
+When a level wraps, one bucket of the next level is cascaded down.
+Timers further out than the wheel covers wait in an overflow set that is
+re-examined every time the top level advances by one bucket, i.e. every
+wheel_size ** (levels - 1) ticks.
+
+The wheel only tracks time; what a timer does is up to the caller.
+"""
+import math
+from typing import Any, Dict, List, Optional, Set, Tuple
+
+
+class HierarchicalTimingWheel:
+    def __init__(self, tick_seconds: float = 1.0, wheel_size: int = 64, levels: int = 4, start_time: float = 0.0):
+        self.tick_seconds = tick_seconds
+        self.wheel_size = wheel_size
+        self.levels = levels
+        self._current_tick = int(start_time // tick_seconds)
+        self._wheels: List[List[Set[str]]] = [[set() for _ in range(wheel_size)] for _ in range(levels)]
+        # timer_id -> (expire_tick, payload, location); location is (level, bucket) or None for overflow/due
+        self._timers: Dict[str, Tuple[int, Any, Optional[Tuple[int, int]]]] = {}
+        self._overflow: Set[str] = set()
+        self._due: List[str] = []
+
+    def __len__(self) -> int:
+        return len(self._timers)
+
+    def __contains__(self, timer_id: str) -> bool:
+        return timer_id in self._timers
+
+    def _place(self, timer_id: str, expire_tick: int, payload: Any) -> None:
+        delta = expire_tick - self._current_tick
+        if delta <= 0:
+            self._timers[timer_id] = (expire_tick, payload, None)
+            self._due.append(timer_id)
+            return
+        span = 1
+        for level in range(self.levels):
+            if delta < span * self.wheel_size:
+                bucket = (expire_tick // span) % self.wheel_size
+                self._wheels[level][bucket].add(timer_id)
+                self._timers[timer_id] = (expire_tick, payload, (level, bucket))
+                return
+            span *= self.wheel_size
+        self._overflow.add(timer_id)
+        self._timers[timer_id] = (expire_tick, payload, None)
+
+    def add(self, timer_id: str, fire_at: float, payload: Any = None) -> None:
+        """Schedule (or reschedule) `timer_id` to fire at epoch time `fire_at`."""
+        self.cancel(timer_id)
+        self._place(timer_id, int(math.ceil(fire_at / self.tick_seconds)), payload)
+
+    def cancel(self, timer_id: str) -> bool:
+        """Remove a timer; returns False if it was not scheduled."""
+        entry = self._timers.pop(timer_id, None)
+        if entry is None:
+            return False
+        location = entry[2]
+        if location is not None:
+            self._wheels[location[0]][location[1]].discard(timer_id)
+        else:
+            self._overflow.discard(timer_id)
+            if timer_id in self._due:
+                self._due.remove(timer_id)
+        return True
+
+    def _cascade(self) -> None:
+        span = 1
+        for level in range(1, self.levels):
+            span *= self.wheel_size
+            if self._current_tick % span:
+                return
+            bucket = self._wheels[level][(self._current_tick // span) % self.wheel_size]
+            timer_ids = list(bucket)
+            bucket.clear()
+            for timer_id in timer_ids:
+                expire_tick, payload, _ = self._timers[timer_id]
+                self._place(timer_id, expire_tick, payload)
+        # The top level moved by one bucket: re-place overflow timers (still too far ones go back)
+        for timer_id in list(self._overflow):
+            self._overflow.discard(timer_id)
+            expire_tick, payload, _ = self._timers[timer_id]
+            self._place(timer_id, expire_tick, payload)
+
+    def advance(self, now: float) -> List[Tuple[str, Any]]:
+        """Move the wheel forward to epoch time `now`; returns the (timer_id, payload) pairs that fired."""
+        target_tick = int(now // self.tick_seconds)
+        while self._current_tick < target_tick:
+            self._current_tick += 1
+            self._cascade()
+            bucket = self._wheels[0][self._current_tick % self.wheel_size]
+            for timer_id in bucket:
+                expire_tick, payload, _ = self._timers[timer_id]
+                self._timers[timer_id] = (expire_tick, payload, None)
+                self._due.append(timer_id)
+            bucket.clear()
+
+        fired = []
+        for timer_id in self._due:
+            entry = self._timers.pop(timer_id, None)
+            if entry is not None:
+                fired.append((timer_id, entry[1]))
+        self._due = []
+        return fired
@@ -0,0 +1,66 @@
+"""
+Expiry job for pending video call requests.
+
+Requests still pending VIDEO_CALL_EXPIRY_GRACE_MINUTES after their
+scheduled_time are marked 'expired' in bounded batches through the
+`expire_stale_video_calls` database function from
+database/migrations/add_expire_video_calls_function.sql. Both parties of
+every expired request then get their own notification for it, naming the
+other party, written with bulk inserts.
+"""
+import asyncio
+from typing import Any, Dict, List
+
+from app.config import settings
+from app.database import supabase_admin
+from app.services.dashboard_cache import invalidate_users
+from app.services.notifications import create_notifications_many
+
+
+def _expire_batches() -> List[Dict[str, str]]:
+    """Expire stale requests, one batch per database round-trip."""
+    batch_size = settings.VIDEO_CALL_EXPIRY_BATCH_SIZE
+    expired: List[Dict[str, str]] = []
+    batches = 0
+
+    while batches < settings.VIDEO_CALL_EXPIRY_MAX_BATCHES:
+        response = supabase_admin.rpc("expire_stale_video_calls", {
+            "p_grace": f"{settings.VIDEO_CALL_EXPIRY_GRACE_MINUTES} minutes",
+            "p_batch_size": batch_size
+        }).execute()
+        rows = response.data or []
+        expired.extend(rows)
+        batches += 1
+        if len(rows) < batch_size:
+            break
+
+    return expired
+
+
+async def expire_stale_video_calls() -> dict:
+    """Expire stale pending video call requests and notify both sides."""
+    loop = asyncio.get_running_loop()
+    expired = await loop.run_in_executor(None, _expire_batches)
+    if not expired:
+        return {}
+
+    user_ids = []
+    notifications: List[Dict[str, Any]] = []
+    for row in expired:
+        video_call_id = str(row["id"])
+        parties = (
+            (row["care_recipient_id"], row.get("caregiver_name") or "the caregiver"),
+            (row["caregiver_id"], row.get("care_recipient_name") or "the care recipient"),
+        )
+        for user_id, other_party_name in parties:
+            user_ids.append(str(user_id))
+            notifications.append({
+                "user_id": str(user_id),
+                "title": "Video Call Request Expired",
+                "body": f"Your video call request with {other_party_name} expired because it was not accepted in time. You can send a new request anytime.",
+                "data": {"video_call_id": video_call_id, "action": "view_video_call", "status": "expired"}
+            })
+    invalidate_users(*user_ids)
+
+    notified = await create_notifications_many(notifications, notification_type="video_call")
+    return {"expired": len(expired), "notified": notified}
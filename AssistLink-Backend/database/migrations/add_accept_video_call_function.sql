@@ -0,0 +1,136 @@
+-- Migration: Atomic video call acceptance
+-- Run this in Supabase SQL Editor
+--
+-- accept_video_call() applies the whole accept/decline state transition for a
+-- video call request in one transaction: acceptance flags and status, the
+-- pending-payment booking, caregiver availability and the (disabled) chat
+-- session. The request row is locked FOR UPDATE, so concurrent accepts from
+-- both parties are serialised and can never create duplicate bookings.
+--
+-- Returns a JSON object with everything the API needs to respond and notify:
+--   video_call, booking_id, booking_created, chat_session_id,
+--   is_care_recipient, is_caregiver, care_recipient_name, caregiver_name
+--
+-- Raises 'video_call_not_found', 'access_denied' or 'video_call_not_pending'
+-- (the call is already expired, declined or completed) (SQLSTATE P0001).
+
+-- Existing-booking lookup inside the function
+CREATE INDEX IF NOT EXISTS idx_bookings_video_call_request ON bookings(video_call_request_id);
+
+CREATE OR REPLACE FUNCTION accept_video_call(
+  p_video_call_id UUID,
+  p_user_id UUID,
+  p_accept BOOLEAN
+)
+RETURNS JSONB AS $$
+DECLARE
+  v_call video_call_requests%ROWTYPE;
+  v_is_care_recipient BOOLEAN;
+  v_is_caregiver BOOLEAN;
+  v_cr_accepted BOOLEAN;
+  v_cg_accepted BOOLEAN;
+  v_cg_accepted_before BOOLEAN;
+  v_status TEXT;
+  v_should_create_booking BOOLEAN := false;
+  v_booking_id UUID;
+  v_booking_created BOOLEAN := false;
+  v_chat_session_id UUID;
+  v_care_recipient_name TEXT;
+  v_caregiver_name TEXT;
+BEGIN
+  SELECT * INTO v_call FROM video_call_requests WHERE id = p_video_call_id FOR UPDATE;
+  IF NOT FOUND THEN
+    RAISE EXCEPTION 'video_call_not_found';
+  END IF;
+
+  v_is_care_recipient := v_call.care_recipient_id = p_user_id;
+  v_is_caregiver := v_call.caregiver_id = p_user_id;
+  IF NOT v_is_care_recipient AND NOT v_is_caregiver THEN
+    RAISE EXCEPTION 'access_denied';
+  END IF;
+
+  -- Expired, declined and completed calls are final
+  IF v_call.status NOT IN ('pending', 'accepted') THEN
+    RAISE EXCEPTION 'video_call_not_pending';
+  END IF;
+
+  v_cg_accepted_before := COALESCE(v_call.caregiver_accepted, false);
+  v_cr_accepted := CASE WHEN v_is_care_recipient THEN p_accept ELSE COALESCE(v_call.care_recipient_accepted, false) END;
+  v_cg_accepted := CASE WHEN v_is_caregiver THEN p_accept ELSE v_cg_accepted_before END;
+
+  IF NOT p_accept THEN
+    v_status := 'declined';
+  ELSIF v_cr_accepted AND v_cg_accepted THEN
+    v_status := 'accepted';
+  ELSE
+    v_status := 'pending';
+  END IF;
+
+  UPDATE video_call_requests
+  SET care_recipient_accepted = v_cr_accepted,
+      caregiver_accepted = v_cg_accepted,
+      status = v_status
+  WHERE id = p_video_call_id
+  RETURNING * INTO v_call;
+
+  -- A booking is created as soon as the caregiver accepts, or once both have accepted
+  IF p_accept THEN
+    v_should_create_booking := (v_is_caregiver AND NOT v_cg_accepted_before)
+      OR (v_cr_accepted AND v_cg_accepted);
+  END IF;
+
+  IF v_should_create_booking THEN
+    SELECT id INTO v_booking_id FROM bookings
+    WHERE video_call_request_id = p_video_call_id
+    ORDER BY created_at
+    LIMIT 1;
+
+    IF v_booking_id IS NULL THEN
+      INSERT INTO bookings (care_recipient_id, caregiver_id, video_call_request_id, service_type, scheduled_date, duration_hours, status)
+      VALUES (
+        v_call.care_recipient_id,
+        v_call.caregiver_id,
+        p_video_call_id,
+        'video_call_session',
+        v_call.scheduled_time,
+        COALESCE(v_call.duration_seconds, 900) / 3600.0,
+        'pending' -- pending payment
+      )
+      RETURNING id INTO v_booking_id;
+      v_booking_created := true;
+
+      INSERT INTO caregiver_profile (user_id, availability_status)
+      VALUES (v_call.caregiver_id, 'unavailable')
+      ON CONFLICT (user_id) DO UPDATE SET availability_status = 'unavailable';
+    END IF;
+
+    -- Chat session starts disabled and is enabled after payment
+    INSERT INTO chat_sessions (care_recipient_id, caregiver_id, video_call_request_id, is_enabled, care_recipient_accepted, caregiver_accepted)
+    VALUES (v_call.care_recipient_id, v_call.caregiver_id, p_video_call_id, false, false, false)
+    ON CONFLICT (care_recipient_id, caregiver_id) DO NOTHING
+    RETURNING id INTO v_chat_session_id;
+
+    IF v_chat_session_id IS NULL THEN
+      SELECT id INTO v_chat_session_id FROM chat_sessions
+      WHERE care_recipient_id = v_call.care_recipient_id AND caregiver_id = v_call.caregiver_id;
+    END IF;
+  END IF;
+
+  SELECT full_name INTO v_care_recipient_name FROM users WHERE id = v_call.care_recipient_id;
+  SELECT full_name INTO v_caregiver_name FROM users WHERE id = v_call.caregiver_id;
+
+  RETURN jsonb_build_object(
+    'video_call', to_jsonb(v_call),
+    'booking_id', v_booking_id,
+    'booking_created', v_booking_created,
+    'chat_session_id', v_chat_session_id,
+    'is_care_recipient', v_is_care_recipient,
+    'is_caregiver', v_is_caregiver,
+    'care_recipient_name', v_care_recipient_name,
+    'caregiver_name', v_caregiver_name
+  );
+END;
+$$ LANGUAGE plpgsql SECURITY DEFINER;
+
+-- Only the backend (service role) may call this: p_user_id is trusted input
+REVOKE ALL ON FUNCTION accept_video_call(UUID, UUID, BOOLEAN) FROM PUBLIC, anon, authenticated;
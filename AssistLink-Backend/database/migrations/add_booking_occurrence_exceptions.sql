@@ -0,0 +1,36 @@
+-- Migration: Per-occurrence exceptions for recurring bookings
+-- Run this in Supabase SQL Editor
+--
+-- A recurring booking is stored once, as a template row with
+-- recurring_pattern; its occurrences are expanded by the backend for the date
+-- window being viewed (app/services/recurrence.py). This table records the
+-- occurrences that differ from the pattern: cancelled ones, and ones moved to a
+-- different time or length. occurrence_start is the start the occurrence would
+-- have had according to the pattern.
+
+CREATE TABLE IF NOT EXISTS booking_occurrence_exceptions (
+  id UUID PRIMARY KEY DEFAULT uuid_generate_v4(),
+  booking_id UUID NOT NULL REFERENCES bookings(id) ON DELETE CASCADE,
+  occurrence_start TIMESTAMPTZ NOT NULL,
+  is_cancelled BOOLEAN NOT NULL DEFAULT false,
+  scheduled_date TIMESTAMPTZ, -- new start when rescheduled
+  duration_hours DECIMAL(4, 2), -- new length when changed
+  created_at TIMESTAMPTZ DEFAULT NOW(),
+  updated_at TIMESTAMPTZ DEFAULT NOW(),
+  UNIQUE (booking_id, occurrence_start)
+);
+
+CREATE TRIGGER update_booking_occurrence_exceptions_updated_at BEFORE UPDATE ON booking_occurrence_exceptions
+  FOR EACH ROW EXECUTE FUNCTION update_updated_at_column();
+
+ALTER TABLE booking_occurrence_exceptions ENABLE ROW LEVEL SECURITY;
+
+-- Both parties of the booking can read its exceptions; writes go through the backend
+CREATE POLICY "Booking parties can view occurrence exceptions" ON booking_occurrence_exceptions
+  FOR SELECT USING (
+    EXISTS (
+      SELECT 1 FROM bookings b
+      WHERE b.id = booking_occurrence_exceptions.booking_id
+        AND (b.care_recipient_id = auth.uid() OR b.caregiver_id = auth.uid())
+    )
+  );
@@ -0,0 +1,58 @@
+-- Migration: Caregiver double-booking protection
+-- Run this in Supabase SQL Editor
+--
+-- Every booking gets a time_range column ([scheduled_date, scheduled_date +
+-- duration_hours)) kept up to date by a trigger, indexed with GiST together
+-- with caregiver_id. An exclusion constraint then rejects any booking whose
+-- range overlaps another active booking (pending, accepted or in_progress) of
+-- the same caregiver, and availability checks are a single index probe
+-- instead of a scan of the caregiver's bookings.
+--
+-- Conflicting inserts/updates fail with SQLSTATE 23P01 (exclusion_violation)
+-- and constraint name bookings_no_caregiver_overlap.
+--
+-- NOTE: the constraint cannot be added while overlapping active bookings
+-- already exist. Run the query at the bottom of this file first and cancel or
+-- reschedule what it returns.
+
+CREATE EXTENSION IF NOT EXISTS btree_gist;
+
+ALTER TABLE bookings ADD COLUMN IF NOT EXISTS time_range TSTZRANGE;
+
+-- timestamptz + interval is not IMMUTABLE, so this cannot be a generated column
+CREATE OR REPLACE FUNCTION set_booking_time_range()
+RETURNS TRIGGER AS $$
+BEGIN
+  NEW.time_range = tstzrange(
+    NEW.scheduled_date,
+    NEW.scheduled_date + make_interval(secs => COALESCE(NEW.duration_hours, 2.00) * 3600),
+    '[)'
+  );
+  RETURN NEW;
+END;
+$$ LANGUAGE plpgsql;
+
+DROP TRIGGER IF EXISTS set_bookings_time_range ON bookings;
+CREATE TRIGGER set_bookings_time_range BEFORE INSERT OR UPDATE OF scheduled_date, duration_hours ON bookings
+  FOR EACH ROW EXECUTE FUNCTION set_booking_time_range();
+
+-- Backfill existing rows
+UPDATE bookings
+SET time_range = tstzrange(
+  scheduled_date,
+  scheduled_date + make_interval(secs => COALESCE(duration_hours, 2.00) * 3600),
+  '[)'
+)
+WHERE time_range IS NULL;
+
+ALTER TABLE bookings DROP CONSTRAINT IF EXISTS bookings_no_caregiver_overlap;
+ALTER TABLE bookings ADD CONSTRAINT bookings_no_caregiver_overlap
+  EXCLUDE USING gist (caregiver_id WITH =, time_range WITH &&)
+  WHERE (caregiver_id IS NOT NULL AND status IN ('pending', 'accepted', 'in_progress'));
+
+-- Overlapping active bookings that would block the constraint:
+-- SELECT a.id, b.id, a.caregiver_id, a.time_range, b.time_range
+-- FROM bookings a
+-- JOIN bookings b ON a.caregiver_id = b.caregiver_id AND a.id < b.id AND a.time_range && b.time_range
+-- WHERE a.status IN ('pending', 'accepted', 'in_progress')
+--   AND b.status IN ('pending', 'accepted', 'in_progress');
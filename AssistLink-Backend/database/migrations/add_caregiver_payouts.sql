@@ -0,0 +1,67 @@
+-- Migration: Caregiver payout batches
+-- Run this in Supabase SQL Editor
+--
+-- A payout batch covers the bookings completed before period_end (and since
+-- the first batch's period_start) that were really paid, i.e. have a
+-- 'payment' entry in payment_ledger (run add_payment_ledger.sql first), have a
+-- caregiver and are in no earlier batch, so a booking paid after its own
+-- day's batch ran goes into the next one. Each booking is paid out
+-- hourly_rate x duration_hours, in the booking's currency, and is listed in
+-- payout_items; the UNIQUE booking_id there means a booking is paid out at
+-- most once across all batches. caregiver_payouts holds one total per
+-- caregiver and currency.
+--
+-- The engine (app/services/caregiver_payouts.py) writes a whole batch in one
+-- transaction under an advisory lock, so a batch is either complete or absent,
+-- and re-running the same period returns the existing batch. The daily job
+-- computes one batch per UTC day, catching up every day since the latest
+-- period_end.
+
+CREATE TABLE IF NOT EXISTS payout_batches (
+  id UUID PRIMARY KEY DEFAULT uuid_generate_v4(),
+  period_start TIMESTAMPTZ NOT NULL,
+  period_end TIMESTAMPTZ NOT NULL,
+  booking_count INTEGER NOT NULL DEFAULT 0,
+  caregiver_count INTEGER NOT NULL DEFAULT 0,
+  totals JSONB NOT NULL DEFAULT '{}'::jsonb,   -- currency -> total amount
+  created_at TIMESTAMPTZ NOT NULL DEFAULT NOW(),
+  UNIQUE (period_start, period_end),
+  CHECK (period_end > period_start)
+);
+
+CREATE TABLE IF NOT EXISTS payout_items (
+  booking_id UUID PRIMARY KEY,                 -- a booking is paid out once
+  batch_id UUID NOT NULL REFERENCES payout_batches(id) ON DELETE CASCADE,
+  caregiver_id UUID NOT NULL,
+  hourly_rate DECIMAL(10, 2) NOT NULL,
+  duration_hours DECIMAL(5, 2) NOT NULL,
+  amount DECIMAL(12, 2) NOT NULL,
+  currency TEXT NOT NULL
+);
+
+CREATE INDEX IF NOT EXISTS idx_payout_items_batch ON payout_items(batch_id, caregiver_id);
+
+CREATE TABLE IF NOT EXISTS caregiver_payouts (
+  id UUID PRIMARY KEY DEFAULT uuid_generate_v4(),
+  batch_id UUID NOT NULL REFERENCES payout_batches(id) ON DELETE CASCADE,
+  caregiver_id UUID NOT NULL REFERENCES users(id) ON DELETE CASCADE,
+  currency TEXT NOT NULL,
+  amount DECIMAL(12, 2) NOT NULL,
+  booking_count INTEGER NOT NULL,
+  hours DECIMAL(10, 2) NOT NULL,
+  status TEXT NOT NULL DEFAULT 'pending' CHECK (status IN ('pending', 'paid', 'on_hold')),
+  created_at TIMESTAMPTZ NOT NULL DEFAULT NOW(),
+  UNIQUE (batch_id, caregiver_id, currency)
+);
+
+CREATE INDEX IF NOT EXISTS idx_caregiver_payouts_caregiver ON caregiver_payouts(caregiver_id, created_at DESC);
+
+-- The engine's stream: completed, paid bookings by completion time
+CREATE INDEX IF NOT EXISTS idx_bookings_payout_eligible
+  ON bookings(completed_at)
+  WHERE status = 'completed' AND payment_status = 'completed' AND caregiver_id IS NOT NULL;
+
+-- Backend-only tables: no policies, so only the service role can read or write them
+ALTER TABLE payout_batches ENABLE ROW LEVEL SECURITY;
+ALTER TABLE payout_items ENABLE ROW LEVEL SECURITY;
+ALTER TABLE caregiver_payouts ENABLE ROW LEVEL SECURITY;
@@ -0,0 +1,66 @@
+-- Migration: Dashboard statistics in one aggregate query
+-- Run this in Supabase SQL Editor
+
+-- Per-party indexes so each counter is an index range scan on (party, status)
+CREATE INDEX IF NOT EXISTS idx_bookings_care_recipient_status
+  ON bookings(care_recipient_id, status, scheduled_date);
+CREATE INDEX IF NOT EXISTS idx_bookings_caregiver_status
+  ON bookings(caregiver_id, status, scheduled_date);
+CREATE INDEX IF NOT EXISTS idx_video_call_requests_care_recipient_status
+  ON video_call_requests(care_recipient_id, status);
+CREATE INDEX IF NOT EXISTS idx_video_call_requests_caregiver_status
+  ON video_call_requests(caregiver_id, status);
+
+-- Returns the five dashboard counters for a user in one round trip. Rows are
+-- counted in the database (COUNT ... FILTER) and "upcoming" is compared with
+-- NOW() server-side, so no booking rows are sent to the backend. p_role may
+-- be passed when the caller already knows it; otherwise it is read from users.
+CREATE OR REPLACE FUNCTION get_dashboard_stats(
+  p_user_id UUID,
+  p_role TEXT DEFAULT NULL
+)
+RETURNS TABLE (
+  upcoming_bookings INTEGER,
+  active_bookings INTEGER,
+  completed_bookings INTEGER,
+  pending_video_calls INTEGER,
+  active_chat_sessions INTEGER
+) AS $$
+DECLARE
+  v_role TEXT := p_role;
+BEGIN
+  IF v_role IS NULL THEN
+    SELECT u.role INTO v_role FROM users u WHERE u.id = p_user_id;
+  END IF;
+
+  -- Separate branches so each side uses its own (party, status) index
+  IF v_role = 'care_recipient' THEN
+    RETURN QUERY
+    SELECT
+      COUNT(*) FILTER (WHERE b.status IN ('pending', 'accepted') AND b.scheduled_date > NOW())::INTEGER,
+      COUNT(*) FILTER (WHERE b.status = 'in_progress')::INTEGER,
+      COUNT(*) FILTER (WHERE b.status = 'completed')::INTEGER,
+      (SELECT COUNT(*)::INTEGER FROM video_call_requests v
+        WHERE v.care_recipient_id = p_user_id AND v.status = 'pending'),
+      (SELECT COUNT(*)::INTEGER FROM chat_sessions c
+        WHERE c.care_recipient_id = p_user_id AND c.is_enabled)
+    FROM bookings b
+    WHERE b.care_recipient_id = p_user_id;
+  ELSE
+    RETURN QUERY
+    SELECT
+      COUNT(*) FILTER (WHERE b.status IN ('pending', 'accepted') AND b.scheduled_date > NOW())::INTEGER,
+      COUNT(*) FILTER (WHERE b.status = 'in_progress')::INTEGER,
+      COUNT(*) FILTER (WHERE b.status = 'completed')::INTEGER,
+      (SELECT COUNT(*)::INTEGER FROM video_call_requests v
+        WHERE v.caregiver_id = p_user_id AND v.status = 'pending'),
+      (SELECT COUNT(*)::INTEGER FROM chat_sessions c
+        WHERE c.caregiver_id = p_user_id AND c.is_enabled)
+    FROM bookings b
+    WHERE b.caregiver_id = p_user_id;
+  END IF;
+END;
+$$ LANGUAGE plpgsql STABLE SECURITY DEFINER;
+
+-- Only the backend (service role) may call this
+REVOKE ALL ON FUNCTION get_dashboard_stats(UUID, TEXT) FROM PUBLIC, anon, authenticated;
@@ -0,0 +1,50 @@
+-- Migration: Expiry of stale video call requests
+-- Run this in Supabase SQL Editor
+
+-- The expiry job only looks at pending requests, oldest scheduled_time first
+CREATE INDEX IF NOT EXISTS idx_video_call_requests_pending_scheduled
+  ON video_call_requests(scheduled_time)
+  WHERE status = 'pending';
+
+-- Marks one bounded batch of pending requests whose scheduled_time is more
+-- than p_grace in the past as 'expired' and returns the expired rows (both
+-- parties' ids and names) so the caller can notify them. Callers loop until
+-- fewer than p_batch_size rows come back. SKIP LOCKED lets several app
+-- instances run the job at the same time, and skips requests that are being
+-- accepted right now.
+-- The return type changed (names added), which CREATE OR REPLACE cannot do
+DROP FUNCTION IF EXISTS expire_stale_video_calls(INTERVAL, INTEGER);
+
+CREATE OR REPLACE FUNCTION expire_stale_video_calls(
+  p_grace INTERVAL,
+  p_batch_size INTEGER DEFAULT 500
+)
+RETURNS TABLE (
+  id UUID,
+  care_recipient_id UUID,
+  caregiver_id UUID,
+  care_recipient_name TEXT,
+  caregiver_name TEXT
+) AS $$
+#variable_conflict use_column
+BEGIN
+  RETURN QUERY
+  WITH batch AS (
+    SELECT v.id FROM video_call_requests v
+    WHERE v.status = 'pending' AND v.scheduled_time < NOW() - p_grace
+    ORDER BY v.scheduled_time
+    LIMIT p_batch_size
+    FOR UPDATE SKIP LOCKED
+  )
+  UPDATE video_call_requests v
+  SET status = 'expired'
+  FROM batch
+  WHERE v.id = batch.id
+  RETURNING v.id, v.care_recipient_id, v.caregiver_id,
+    (SELECT u.full_name FROM users u WHERE u.id = v.care_recipient_id),
+    (SELECT u.full_name FROM users u WHERE u.id = v.caregiver_id);
+END;
+$$ LANGUAGE plpgsql SECURITY DEFINER;
+
+-- Only the backend (service role) may call this
+REVOKE ALL ON FUNCTION expire_stale_video_calls(INTERVAL, INTEGER) FROM PUBLIC, anon, authenticated;
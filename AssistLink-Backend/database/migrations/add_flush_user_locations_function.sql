@@ -0,0 +1,28 @@
+-- Migration: Batched write of buffered user locations
+-- Run this in Supabase SQL Editor
+--
+-- PUT /api/location/update keeps positions in memory and the backend flushes
+-- the latest position per user every few seconds
+-- (app/services/location_buffer.py). This writes one flush with a single
+-- UPDATE instead of one round-trip (and one update_users_updated_at trigger
+-- run) per position. Rows whose location did not change are skipped.
+--
+-- p_locations: [{"user_id": "...", "location": {"latitude": .., "longitude": .., "address": .., "timestamp": ..}}, ...]
+-- Returns the number of users updated.
+CREATE OR REPLACE FUNCTION flush_user_locations(p_locations JSONB)
+RETURNS INTEGER AS $$
+DECLARE
+  v_updated INTEGER;
+BEGIN
+  UPDATE users u
+  SET current_location = l.location
+  FROM jsonb_to_recordset(p_locations) AS l(user_id UUID, location JSONB)
+  WHERE u.id = l.user_id
+    AND u.current_location IS DISTINCT FROM l.location;
+  GET DIAGNOSTICS v_updated = ROW_COUNT;
+  RETURN v_updated;
+END;
+$$ LANGUAGE plpgsql SECURITY DEFINER;
+
+-- Only the backend (service role) may call this
+REVOKE ALL ON FUNCTION flush_user_locations(JSONB) FROM PUBLIC, anon, authenticated;
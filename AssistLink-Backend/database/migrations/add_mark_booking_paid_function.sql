@@ -0,0 +1,98 @@
+-- Migration: Shared "booking paid" transition
+-- Run this in Supabase SQL Editor
+--
+-- mark_booking_paid() is called by every payment path (Razorpay verify,
+-- Razorpay webhook, the bypass create-order flow and complete-payment). In one
+-- transaction it marks the booking paid and accepted, records the Razorpay
+-- ids, marks the caregiver unavailable, enables (or creates) the chat session
+-- and links it to the booking.
+--
+-- It is idempotent: the booking row is locked FOR UPDATE and a booking that is
+-- already paid is returned unchanged with already_paid = true, so a webhook
+-- racing the verify call cannot apply the side effects twice.
+--
+-- Returns: booking, already_paid, chat_session_id, care_recipient_name, caregiver_name
+-- Raises 'booking_not_found' or 'access_denied' (when p_care_recipient_id is
+-- given and does not own the booking).
+
+CREATE OR REPLACE FUNCTION mark_booking_paid(
+  p_booking_id UUID,
+  p_care_recipient_id UUID DEFAULT NULL,
+  p_razorpay_payment_id TEXT DEFAULT NULL,
+  p_razorpay_signature TEXT DEFAULT NULL,
+  p_amount NUMERIC DEFAULT NULL,
+  p_currency TEXT DEFAULT NULL
+)
+RETURNS JSONB AS $$
+DECLARE
+  v_booking bookings%ROWTYPE;
+  v_already_paid BOOLEAN;
+  v_chat_session_id UUID;
+  v_care_recipient_name TEXT;
+  v_caregiver_name TEXT;
+BEGIN
+  SELECT * INTO v_booking FROM bookings WHERE id = p_booking_id FOR UPDATE;
+  IF NOT FOUND THEN
+    RAISE EXCEPTION 'booking_not_found';
+  END IF;
+
+  IF p_care_recipient_id IS NOT NULL AND v_booking.care_recipient_id <> p_care_recipient_id THEN
+    RAISE EXCEPTION 'access_denied';
+  END IF;
+
+  v_already_paid := v_booking.payment_status = 'completed';
+
+  IF NOT v_already_paid THEN
+    UPDATE bookings
+    SET payment_status = 'completed',
+        payment_completed_at = NOW(),
+        status = 'accepted',
+        accepted_at = NOW(),
+        razorpay_payment_id = COALESCE(p_razorpay_payment_id, razorpay_payment_id),
+        razorpay_signature = COALESCE(p_razorpay_signature, razorpay_signature),
+        amount = COALESCE(p_amount, amount),
+        currency = COALESCE(p_currency, currency)
+    WHERE id = p_booking_id
+    RETURNING * INTO v_booking;
+
+    IF v_booking.caregiver_id IS NOT NULL THEN
+      INSERT INTO caregiver_profile (user_id, availability_status)
+      VALUES (v_booking.caregiver_id, 'unavailable')
+      ON CONFLICT (user_id) DO UPDATE SET availability_status = 'unavailable';
+
+      INSERT INTO chat_sessions (care_recipient_id, caregiver_id, is_enabled, care_recipient_accepted, caregiver_accepted, enabled_at)
+      VALUES (v_booking.care_recipient_id, v_booking.caregiver_id, true, true, true, NOW())
+      ON CONFLICT (care_recipient_id, caregiver_id) DO UPDATE
+        SET is_enabled = true,
+            care_recipient_accepted = true,
+            caregiver_accepted = true,
+            enabled_at = NOW()
+      RETURNING id INTO v_chat_session_id;
+
+      IF v_booking.chat_session_id IS NULL THEN
+        UPDATE bookings SET chat_session_id = v_chat_session_id
+        WHERE id = p_booking_id
+        RETURNING * INTO v_booking;
+      END IF;
+    END IF;
+  ELSE
+    v_chat_session_id := v_booking.chat_session_id;
+  END IF;
+
+  SELECT full_name INTO v_care_recipient_name FROM users WHERE id = v_booking.care_recipient_id;
+  IF v_booking.caregiver_id IS NOT NULL THEN
+    SELECT full_name INTO v_caregiver_name FROM users WHERE id = v_booking.caregiver_id;
+  END IF;
+
+  RETURN jsonb_build_object(
+    'booking', to_jsonb(v_booking),
+    'already_paid', v_already_paid,
+    'chat_session_id', v_chat_session_id,
+    'care_recipient_name', v_care_recipient_name,
+    'caregiver_name', v_caregiver_name
+  );
+END;
+$$ LANGUAGE plpgsql SECURITY DEFINER;
+
+-- Only the backend (service role) may call this
+REVOKE ALL ON FUNCTION mark_booking_paid(UUID, UUID, TEXT, TEXT, NUMERIC, TEXT) FROM PUBLIC, anon, authenticated;
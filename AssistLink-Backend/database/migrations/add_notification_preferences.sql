@@ -0,0 +1,22 @@
+-- Migration: Per-user notification preferences and quiet hours
+-- Run this in Supabase SQL Editor
+-- Preferences only gate push delivery; in-app notifications are always created.
+
+CREATE TABLE IF NOT EXISTS notification_preferences (
+  user_id UUID PRIMARY KEY REFERENCES users(id) ON DELETE CASCADE,
+  push_disabled_types TEXT[] NOT NULL DEFAULT '{}', -- e.g. {'message', 'system'}
+  quiet_hours_start TIME, -- local time; NULL disables quiet hours
+  quiet_hours_end TIME,
+  timezone TEXT NOT NULL DEFAULT 'UTC', -- IANA name, e.g. 'Asia/Kolkata'
+  created_at TIMESTAMPTZ DEFAULT NOW(),
+  updated_at TIMESTAMPTZ DEFAULT NOW()
+);
+
+CREATE TRIGGER update_notification_preferences_updated_at BEFORE UPDATE ON notification_preferences
+  FOR EACH ROW EXECUTE FUNCTION update_updated_at_column();
+
+ALTER TABLE notification_preferences ENABLE ROW LEVEL SECURITY;
+
+CREATE POLICY "Users can manage their own notification preferences"
+  ON notification_preferences FOR ALL
+  USING (auth.uid() = user_id);
@@ -0,0 +1,86 @@
+-- Migration: Notification retention and index tuning
+-- Run this in Supabase SQL Editor
+
+-- Listing (WHERE user_id = ? ORDER BY created_at DESC) is served by a single index scan
+CREATE INDEX IF NOT EXISTS idx_notifications_user_created
+  ON notifications(user_id, created_at DESC);
+
+-- Unread badge count and "unread only" listing only touch the (small) unread subset
+CREATE INDEX IF NOT EXISTS idx_notifications_user_unread
+  ON notifications(user_id, created_at DESC)
+  WHERE is_read = false;
+
+-- Retention job scans old read notifications oldest-first
+CREATE INDEX IF NOT EXISTS idx_notifications_read_created
+  ON notifications(created_at)
+  WHERE is_read = true;
+
+-- Superseded by the indexes above
+DROP INDEX IF EXISTS idx_notifications_user_id;
+DROP INDEX IF EXISTS idx_notifications_is_read;
+DROP INDEX IF EXISTS idx_notifications_created_at;
+
+-- Archive for pruned notifications (only written when archiving is enabled)
+CREATE TABLE IF NOT EXISTS notifications_archive (
+  LIKE notifications INCLUDING DEFAULTS,
+  archived_at TIMESTAMPTZ DEFAULT NOW(),
+  PRIMARY KEY (id)
+);
+
+CREATE INDEX IF NOT EXISTS idx_notifications_archive_user_created
+  ON notifications_archive(user_id, created_at DESC);
+
+ALTER TABLE notifications_archive ENABLE ROW LEVEL SECURITY;
+
+-- Deletes (and optionally archives) one bounded batch of read notifications
+-- older than p_older_than. Returns the number of rows removed; callers loop
+-- until it returns less than p_batch_size. SKIP LOCKED lets several app
+-- instances run the job at the same time without blocking each other.
+CREATE OR REPLACE FUNCTION prune_notifications(
+  p_older_than INTERVAL,
+  p_batch_size INTEGER DEFAULT 1000,
+  p_archive BOOLEAN DEFAULT false
+)
+RETURNS INTEGER AS $$
+DECLARE
+  v_count INTEGER;
+BEGIN
+  IF p_archive THEN
+    WITH batch AS (
+      SELECT id FROM notifications
+      WHERE is_read = true AND created_at < NOW() - p_older_than
+      ORDER BY created_at
+      LIMIT p_batch_size
+      FOR UPDATE SKIP LOCKED
+    ), removed AS (
+      DELETE FROM notifications n
+      USING batch
+      WHERE n.id = batch.id
+      RETURNING n.*
+    ), archived AS (
+      INSERT INTO notifications_archive (id, user_id, type, title, body, data, is_read, read_at, created_at)
+      SELECT id, user_id, type, title, body, data, is_read, read_at, created_at FROM removed
+      ON CONFLICT (id) DO NOTHING
+    )
+    -- Count the deleted rows: rows already in the archive are not inserted again
+    SELECT count(*) INTO v_count FROM removed;
+  ELSE
+    WITH batch AS (
+      SELECT id FROM notifications
+      WHERE is_read = true AND created_at < NOW() - p_older_than
+      ORDER BY created_at
+      LIMIT p_batch_size
+      FOR UPDATE SKIP LOCKED
+    )
+    DELETE FROM notifications n
+    USING batch
+    WHERE n.id = batch.id;
+
+    GET DIAGNOSTICS v_count = ROW_COUNT;
+  END IF;
+
+  RETURN v_count;
+END;
+$$ LANGUAGE plpgsql SECURITY DEFINER;
+
+REVOKE ALL ON FUNCTION prune_notifications(INTERVAL, INTEGER, BOOLEAN) FROM PUBLIC, anon, authenticated;
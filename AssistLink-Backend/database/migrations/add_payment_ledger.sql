@@ -0,0 +1,272 @@
+-- Migration: Append-only payment ledger with per-user balances
+-- Run this in Supabase SQL Editor (after add_mark_booking_paid_function.sql)
+--
+-- payment_ledger records every money movement once and is never updated or
+-- deleted (a trigger rejects both). Each insert also adds the entry to the
+-- caregiver's and the care recipient's row in payment_balances, in the same
+-- transaction, so earnings, spend and refund totals are one-row reads instead
+-- of a scan over bookings.
+--
+-- mark_booking_paid() is replaced by a version that takes p_ledger_source and
+-- writes the 'payment' entry in the same transaction as the booking update.
+-- The Razorpay verify and webhook paths (and reconciliation) pass a source;
+-- the bypass flow passes none, since no money moved.
+--
+-- record_booking_refund() appends a 'refund' entry (Razorpay refund.processed
+-- webhook) and marks the booking refunded once refunds cover its amount.
+
+CREATE TABLE IF NOT EXISTS payment_ledger (
+  id BIGSERIAL PRIMARY KEY,
+  idempotency_key TEXT NOT NULL UNIQUE,      -- e.g. 'payment:<booking_id>', one entry per movement
+  entry_type TEXT NOT NULL CHECK (entry_type IN ('payment', 'refund')),
+  booking_id UUID NOT NULL,                  -- no foreign key: history outlives the booking
+  care_recipient_id UUID NOT NULL,
+  caregiver_id UUID,
+  amount DECIMAL(10, 2) NOT NULL CHECK (amount >= 0),
+  currency TEXT NOT NULL DEFAULT 'INR',
+  razorpay_order_id TEXT,
+  razorpay_payment_id TEXT,
+  source TEXT NOT NULL,                      -- 'verify', 'webhook', 'reconciliation', 'backfill'
+  created_at TIMESTAMPTZ NOT NULL DEFAULT NOW()
+);
+
+CREATE INDEX IF NOT EXISTS idx_payment_ledger_booking ON payment_ledger(booking_id);
+CREATE INDEX IF NOT EXISTS idx_payment_ledger_caregiver ON payment_ledger(caregiver_id, created_at DESC);
+CREATE INDEX IF NOT EXISTS idx_payment_ledger_care_recipient ON payment_ledger(care_recipient_id, created_at DESC);
+
+-- role: 'caregiver' (earned) or 'care_recipient' (spent)
+CREATE TABLE IF NOT EXISTS payment_balances (
+  user_id UUID NOT NULL,
+  role TEXT NOT NULL CHECK (role IN ('caregiver', 'care_recipient')),
+  currency TEXT NOT NULL,
+  total_paid DECIMAL(12, 2) NOT NULL DEFAULT 0,
+  total_refunded DECIMAL(12, 2) NOT NULL DEFAULT 0,
+  balance DECIMAL(12, 2) NOT NULL DEFAULT 0,  -- total_paid - total_refunded
+  entry_count INTEGER NOT NULL DEFAULT 0,
+  last_entry_at TIMESTAMPTZ,
+  PRIMARY KEY (user_id, role, currency)
+);
+
+-- Backend-only tables: no policies, so only the service role can read or write them
+ALTER TABLE payment_ledger ENABLE ROW LEVEL SECURITY;
+ALTER TABLE payment_balances ENABLE ROW LEVEL SECURITY;
+
+CREATE OR REPLACE FUNCTION payment_ledger_append_only()
+RETURNS TRIGGER AS $$
+BEGIN
+  RAISE EXCEPTION 'payment_ledger is append-only';
+END;
+$$ LANGUAGE plpgsql;
+
+DROP TRIGGER IF EXISTS payment_ledger_no_update ON payment_ledger;
+CREATE TRIGGER payment_ledger_no_update BEFORE UPDATE OR DELETE ON payment_ledger
+  FOR EACH ROW EXECUTE FUNCTION payment_ledger_append_only();
+
+CREATE OR REPLACE FUNCTION apply_payment_ledger_entry()
+RETURNS TRIGGER AS $$
+DECLARE
+  v_paid NUMERIC := CASE WHEN NEW.entry_type = 'payment' THEN NEW.amount ELSE 0 END;
+  v_refunded NUMERIC := CASE WHEN NEW.entry_type = 'refund' THEN NEW.amount ELSE 0 END;
+BEGIN
+  INSERT INTO payment_balances (user_id, role, currency, total_paid, total_refunded, balance, entry_count, last_entry_at)
+  VALUES (NEW.care_recipient_id, 'care_recipient', NEW.currency, v_paid, v_refunded, v_paid - v_refunded, 1, NEW.created_at)
+  ON CONFLICT (user_id, role, currency) DO UPDATE
+    SET total_paid = payment_balances.total_paid + EXCLUDED.total_paid,
+        total_refunded = payment_balances.total_refunded + EXCLUDED.total_refunded,
+        balance = payment_balances.balance + EXCLUDED.balance,
+        entry_count = payment_balances.entry_count + 1,
+        last_entry_at = GREATEST(payment_balances.last_entry_at, EXCLUDED.last_entry_at);
+
+  IF NEW.caregiver_id IS NOT NULL THEN
+    INSERT INTO payment_balances (user_id, role, currency, total_paid, total_refunded, balance, entry_count, last_entry_at)
+    VALUES (NEW.caregiver_id, 'caregiver', NEW.currency, v_paid, v_refunded, v_paid - v_refunded, 1, NEW.created_at)
+    ON CONFLICT (user_id, role, currency) DO UPDATE
+      SET total_paid = payment_balances.total_paid + EXCLUDED.total_paid,
+          total_refunded = payment_balances.total_refunded + EXCLUDED.total_refunded,
+          balance = payment_balances.balance + EXCLUDED.balance,
+          entry_count = payment_balances.entry_count + 1,
+          last_entry_at = GREATEST(payment_balances.last_entry_at, EXCLUDED.last_entry_at);
+  END IF;
+  RETURN NEW;
+END;
+$$ LANGUAGE plpgsql;
+
+DROP TRIGGER IF EXISTS payment_ledger_apply_balances ON payment_ledger;
+CREATE TRIGGER payment_ledger_apply_balances AFTER INSERT ON payment_ledger
+  FOR EACH ROW EXECUTE FUNCTION apply_payment_ledger_entry();
+
+-- mark_booking_paid with a ledger entry (see add_mark_booking_paid_function.sql)
+DROP FUNCTION IF EXISTS mark_booking_paid(UUID, UUID, TEXT, TEXT, NUMERIC, TEXT);
+
+CREATE OR REPLACE FUNCTION mark_booking_paid(
+  p_booking_id UUID,
+  p_care_recipient_id UUID DEFAULT NULL,
+  p_razorpay_payment_id TEXT DEFAULT NULL,
+  p_razorpay_signature TEXT DEFAULT NULL,
+  p_amount NUMERIC DEFAULT NULL,
+  p_currency TEXT DEFAULT NULL,
+  p_ledger_source TEXT DEFAULT NULL
+)
+RETURNS JSONB AS $$
+DECLARE
+  v_booking bookings%ROWTYPE;
+  v_already_paid BOOLEAN;
+  v_chat_session_id UUID;
+  v_care_recipient_name TEXT;
+  v_caregiver_name TEXT;
+BEGIN
+  SELECT * INTO v_booking FROM bookings WHERE id = p_booking_id FOR UPDATE;
+  IF NOT FOUND THEN
+    RAISE EXCEPTION 'booking_not_found';
+  END IF;
+
+  IF p_care_recipient_id IS NOT NULL AND v_booking.care_recipient_id <> p_care_recipient_id THEN
+    RAISE EXCEPTION 'access_denied';
+  END IF;
+
+  v_already_paid := v_booking.payment_status = 'completed';
+
+  IF NOT v_already_paid THEN
+    UPDATE bookings
+    SET payment_status = 'completed',
+        payment_completed_at = NOW(),
+        status = 'accepted',
+        accepted_at = NOW(),
+        razorpay_payment_id = COALESCE(p_razorpay_payment_id, razorpay_payment_id),
+        razorpay_signature = COALESCE(p_razorpay_signature, razorpay_signature),
+        amount = COALESCE(p_amount, amount),
+        currency = COALESCE(p_currency, currency)
+    WHERE id = p_booking_id
+    RETURNING * INTO v_booking;
+
+    IF p_ledger_source IS NOT NULL AND v_booking.amount IS NOT NULL THEN
+      INSERT INTO payment_ledger (
+        idempotency_key, entry_type, booking_id, care_recipient_id, caregiver_id,
+        amount, currency, razorpay_order_id, razorpay_payment_id, source
+      )
+      VALUES (
+        'payment:' || v_booking.id, 'payment', v_booking.id, v_booking.care_recipient_id, v_booking.caregiver_id,
+        v_booking.amount, COALESCE(v_booking.currency, 'INR'), v_booking.razorpay_order_id, v_booking.razorpay_payment_id, p_ledger_source
+      )
+      ON CONFLICT (idempotency_key) DO NOTHING;
+    END IF;
+
+    IF v_booking.caregiver_id IS NOT NULL THEN
+      INSERT INTO caregiver_profile (user_id, availability_status)
+      VALUES (v_booking.caregiver_id, 'unavailable')
+      ON CONFLICT (user_id) DO UPDATE SET availability_status = 'unavailable';
+
+      INSERT INTO chat_sessions (care_recipient_id, caregiver_id, is_enabled, care_recipient_accepted, caregiver_accepted, enabled_at)
+      VALUES (v_booking.care_recipient_id, v_booking.caregiver_id, true, true, true, NOW())
+      ON CONFLICT (care_recipient_id, caregiver_id) DO UPDATE
+        SET is_enabled = true,
+            care_recipient_accepted = true,
+            caregiver_accepted = true,
+            enabled_at = NOW()
+      RETURNING id INTO v_chat_session_id;
+
+      IF v_booking.chat_session_id IS NULL THEN
+        UPDATE bookings SET chat_session_id = v_chat_session_id
+        WHERE id = p_booking_id
+        RETURNING * INTO v_booking;
+      END IF;
+    END IF;
+  ELSE
+    v_chat_session_id := v_booking.chat_session_id;
+  END IF;
+
+  SELECT full_name INTO v_care_recipient_name FROM users WHERE id = v_booking.care_recipient_id;
+  IF v_booking.caregiver_id IS NOT NULL THEN
+    SELECT full_name INTO v_caregiver_name FROM users WHERE id = v_booking.caregiver_id;
+  END IF;
+
+  RETURN jsonb_build_object(
+    'booking', to_jsonb(v_booking),
+    'already_paid', v_already_paid,
+    'chat_session_id', v_chat_session_id,
+    'care_recipient_name', v_care_recipient_name,
+    'caregiver_name', v_caregiver_name
+  );
+END;
+$$ LANGUAGE plpgsql SECURITY DEFINER;
+
+-- Only the backend (service role) may call this
+REVOKE ALL ON FUNCTION mark_booking_paid(UUID, UUID, TEXT, TEXT, NUMERIC, TEXT, TEXT) FROM PUBLIC, anon, authenticated;
+
+-- Appends a refund of p_amount for a booking, keyed by the Razorpay refund id
+-- so a redelivered webhook adds nothing. Once the booking's refunds add up to
+-- its amount, payment_status becomes 'refunded'.
+-- Returns: booking, recorded (false for a refund already in the ledger)
+-- Raises 'booking_not_found'.
+CREATE OR REPLACE FUNCTION record_booking_refund(
+  p_booking_id UUID,
+  p_razorpay_refund_id TEXT,
+  p_amount NUMERIC,
+  p_source TEXT
+)
+RETURNS JSONB AS $$
+DECLARE
+  v_booking bookings%ROWTYPE;
+  v_recorded BOOLEAN;
+  v_refunded NUMERIC;
+BEGIN
+  SELECT * INTO v_booking FROM bookings WHERE id = p_booking_id FOR UPDATE;
+  IF NOT FOUND THEN
+    RAISE EXCEPTION 'booking_not_found';
+  END IF;
+
+  INSERT INTO payment_ledger (
+    idempotency_key, entry_type, booking_id, care_recipient_id, caregiver_id,
+    amount, currency, razorpay_order_id, razorpay_payment_id, source
+  )
+  VALUES (
+    'refund:' || p_razorpay_refund_id, 'refund', v_booking.id, v_booking.care_recipient_id, v_booking.caregiver_id,
+    p_amount, COALESCE(v_booking.currency, 'INR'), v_booking.razorpay_order_id, v_booking.razorpay_payment_id, p_source
+  )
+  ON CONFLICT (idempotency_key) DO NOTHING;
+  v_recorded := FOUND;
+
+  IF v_recorded AND v_booking.payment_status <> 'refunded' THEN
+    SELECT COALESCE(SUM(amount), 0) INTO v_refunded FROM payment_ledger
+    WHERE booking_id = v_booking.id AND entry_type = 'refund';
+    IF v_booking.amount IS NULL OR v_refunded >= v_booking.amount THEN
+      UPDATE bookings SET payment_status = 'refunded'
+      WHERE id = p_booking_id
+      RETURNING * INTO v_booking;
+    END IF;
+  END IF;
+
+  RETURN jsonb_build_object('booking', to_jsonb(v_booking), 'recorded', v_recorded);
+END;
+$$ LANGUAGE plpgsql SECURITY DEFINER;
+
+-- Only the backend (service role) may call this
+REVOKE ALL ON FUNCTION record_booking_refund(UUID, TEXT, NUMERIC, TEXT) FROM PUBLIC, anon, authenticated;
+
+-- Entries for Razorpay payments completed before this migration (the trigger
+-- builds their balances)
+INSERT INTO payment_ledger (
+  idempotency_key, entry_type, booking_id, care_recipient_id, caregiver_id,
+  amount, currency, razorpay_order_id, razorpay_payment_id, source, created_at
+)
+SELECT 'payment:' || id, 'payment', id, care_recipient_id, caregiver_id,
+       amount, COALESCE(currency, 'INR'), razorpay_order_id, razorpay_payment_id, 'backfill',
+       COALESCE(payment_completed_at, updated_at, NOW())
+FROM bookings
+WHERE payment_status IN ('completed', 'refunded') AND amount IS NOT NULL AND razorpay_payment_id IS NOT NULL
+ORDER BY COALESCE(payment_completed_at, updated_at)
+ON CONFLICT (idempotency_key) DO NOTHING;
+
+-- Refunded bookings get their refund too (their refund ids are not stored,
+-- so the key is the booking id), so balances net them out
+INSERT INTO payment_ledger (
+  idempotency_key, entry_type, booking_id, care_recipient_id, caregiver_id,
+  amount, currency, razorpay_order_id, razorpay_payment_id, source, created_at
+)
+SELECT 'refund:' || id, 'refund', id, care_recipient_id, caregiver_id,
+       amount, COALESCE(currency, 'INR'), razorpay_order_id, razorpay_payment_id, 'backfill',
+       COALESCE(updated_at, NOW())
+FROM bookings
+WHERE payment_status = 'refunded' AND amount IS NOT NULL AND razorpay_payment_id IS NOT NULL
+ORDER BY updated_at
+ON CONFLICT (idempotency_key) DO NOTHING;
@@ -0,0 +1,70 @@
+-- Migration: Durable inbox for Razorpay webhook events
+-- Run this in Supabase SQL Editor
+--
+-- POST /api/payments/webhook only verifies the signature and stores the raw
+-- event here, keyed by Razorpay's event id (X-Razorpay-Event-Id), then returns
+-- 200. Redelivered events hit the primary key and are ignored. A background
+-- worker (app/services/payment_webhooks.py) applies pending events in order
+-- per order id and records the outcome. A failed attempt is retried with
+-- exponential backoff (next_attempt_at), and holds back the later events of
+-- its order until then.
+
+CREATE TABLE IF NOT EXISTS payment_webhook_events (
+  event_id TEXT PRIMARY KEY,
+  event TEXT NOT NULL,                       -- e.g. 'payment.captured'
+  order_id TEXT,                             -- Razorpay order id, the ordering key
+  payment_id TEXT,
+  event_created_at TIMESTAMPTZ,              -- Razorpay's created_at for the event
+  payload JSONB NOT NULL,                    -- raw event body
+  status TEXT NOT NULL DEFAULT 'pending' CHECK (status IN ('pending', 'processed', 'ignored', 'failed')),
+  attempts INTEGER NOT NULL DEFAULT 0,
+  last_error TEXT,                           -- error of the last attempt, or why the event was ignored
+  next_attempt_at TIMESTAMPTZ,               -- after a failed attempt: not retried before this
+  received_at TIMESTAMPTZ NOT NULL DEFAULT NOW(),
+  processed_at TIMESTAMPTZ
+);
+
+-- The worker only reads pending events, oldest first
+CREATE INDEX IF NOT EXISTS idx_payment_webhook_events_pending
+  ON payment_webhook_events(event_created_at, received_at)
+  WHERE status = 'pending';
+CREATE INDEX IF NOT EXISTS idx_payment_webhook_events_order ON payment_webhook_events(order_id);
+
+-- For tables created before the column existed
+ALTER TABLE payment_webhook_events ADD COLUMN IF NOT EXISTS next_attempt_at TIMESTAMPTZ;
+
+-- Pending events the worker may apply now, oldest first: an order with an
+-- event waiting for its retry time is skipped as a whole, so its later events
+-- are not applied before it.
+CREATE OR REPLACE FUNCTION fetch_due_payment_webhook_events(p_limit INTEGER DEFAULT 200)
+RETURNS TABLE (
+  event_id TEXT,
+  event TEXT,
+  order_id TEXT,
+  payment_id TEXT,
+  attempts INTEGER,
+  payload JSONB
+) AS $$
+#variable_conflict use_column
+BEGIN
+  RETURN QUERY
+  SELECT e.event_id, e.event, e.order_id, e.payment_id, e.attempts, e.payload
+  FROM payment_webhook_events e
+  WHERE e.status = 'pending'
+    AND NOT EXISTS (
+      SELECT 1 FROM payment_webhook_events w
+      WHERE w.status = 'pending'
+        AND w.order_id = e.order_id
+        AND w.next_attempt_at > NOW()
+    )
+    AND (e.order_id IS NOT NULL OR e.next_attempt_at IS NULL OR e.next_attempt_at <= NOW())
+  ORDER BY e.event_created_at ASC NULLS FIRST, e.received_at ASC
+  LIMIT p_limit;
+END;
+$$ LANGUAGE plpgsql SECURITY DEFINER;
+
+-- Only the backend (service role) may call this
+REVOKE ALL ON FUNCTION fetch_due_payment_webhook_events(INTEGER) FROM PUBLIC, anon, authenticated;
+
+-- Backend-only table: no policies, so only the service role can read or write it
+ALTER TABLE payment_webhook_events ENABLE ROW LEVEL SECURITY;
@@ -0,0 +1,36 @@
+-- Migration: Persisted timers for automatic booking / video call transitions
+-- Run this in Supabase SQL Editor
+--
+-- The backend keeps pending transitions in an in-memory timing wheel
+-- (app/services/booking_transitions.py). Every timer is also stored here so
+-- it survives restarts: rows are written when a timer is scheduled, removed
+-- when it fires or is cancelled, and reloaded on startup.
+--
+-- kind: 'booking_start'   accepted -> in_progress at scheduled_date
+--       'booking_end'     accepted/in_progress -> completed at scheduled_date + duration_hours
+--       'video_call_end'  accepted -> completed at scheduled_time + VIDEO_CALL_DURATION_SECONDS
+
+CREATE TABLE IF NOT EXISTS scheduled_transitions (
+  id UUID PRIMARY KEY DEFAULT uuid_generate_v4(),
+  kind TEXT NOT NULL CHECK (kind IN ('booking_start', 'booking_end', 'video_call_end')),
+  target_id UUID NOT NULL,
+  fire_at TIMESTAMPTZ NOT NULL,
+  created_at TIMESTAMPTZ DEFAULT NOW(),
+  UNIQUE (kind, target_id)
+);
+
+CREATE INDEX IF NOT EXISTS idx_scheduled_transitions_fire_at ON scheduled_transitions(fire_at);
+
+-- Backend-only table: no policies, so only the service role can read or write it
+ALTER TABLE scheduled_transitions ENABLE ROW LEVEL SECURITY;
+
+-- Timers for bookings and calls that were already accepted before this migration
+INSERT INTO scheduled_transitions (kind, target_id, fire_at)
+SELECT 'booking_start', id, scheduled_date FROM bookings
+WHERE status = 'accepted' AND NOT COALESCE(is_recurring, false)
+ON CONFLICT (kind, target_id) DO NOTHING;
+
+INSERT INTO scheduled_transitions (kind, target_id, fire_at)
+SELECT 'booking_end', id, scheduled_date + make_interval(secs => COALESCE(duration_hours, 2.00) * 3600) FROM bookings
+WHERE status IN ('accepted', 'in_progress') AND NOT COALESCE(is_recurring, false)
+ON CONFLICT (kind, target_id) DO NOTHING;
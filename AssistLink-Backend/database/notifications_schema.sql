@@ -25,14 +25,16 @@ CREATE TABLE IF NOT EXISTS user_devices (
 );
 
 -- Indexes for performance
-CREATE INDEX IF NOT EXISTS idx_notifications_user_id ON notifications(user_id);
-CREATE INDEX IF NOT EXISTS idx_notifications_is_read ON notifications(is_read);
-CREATE INDEX IF NOT EXISTS idx_notifications_created_at ON notifications(created_at);
+CREATE INDEX IF NOT EXISTS idx_notifications_user_created ON notifications(user_id, created_at DESC);
+CREATE INDEX IF NOT EXISTS idx_notifications_user_unread ON notifications(user_id, created_at DESC) WHERE is_read = false;
+CREATE INDEX IF NOT EXISTS idx_notifications_read_created ON notifications(created_at) WHERE is_read = true;
 CREATE INDEX IF NOT EXISTS idx_notifications_type ON notifications(type);
 CREATE INDEX IF NOT EXISTS idx_user_devices_user_id ON user_devices(user_id);
 CREATE INDEX IF NOT EXISTS idx_user_devices_device_token ON user_devices(device_token);
 CREATE INDEX IF NOT EXISTS idx_user_devices_is_active ON user_devices(is_active);
 
+-- Retention (notifications_archive, prune_notifications): see migrations/add_notification_retention.sql
+
 -- Note: No updated_at trigger needed for notifications table
 -- We track read_at timestamp instead
 
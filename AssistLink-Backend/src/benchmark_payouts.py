@@ -0,0 +1,97 @@
+"""
+Benchmark for the caregiver payout engine (app/services/caregiver_payouts.py).
+
+Without arguments, synthetic bookings are fed through PayoutAccumulator in
+chunks, the way rows arrive from the server-side cursor, and pricing time and
+peak Python memory are reported per chunk size:
+
+    python -m src.benchmark_payouts --bookings 100000 --caregivers 2000
+
+With --database, a real payout batch is computed for the given period over
+DATABASE_URL and rolled back (dry run):
+
+    python -m src.benchmark_payouts --database --days 30
+"""
+import argparse
+import random
+import time
+import tracemalloc
+import uuid
+from datetime import datetime, timedelta, timezone
+from decimal import Decimal
+
+from dotenv import load_dotenv
+
+load_dotenv()
+
+
+def synthetic_rows(bookings: int, caregivers: int, seed: int = 7):
+    """(booking_id, caregiver_id, currency, hourly_rate, duration_hours) rows, generated lazily."""
+    rng = random.Random(seed)
+    caregiver_ids = [str(uuid.UUID(int=rng.getrandbits(128))) for _ in range(caregivers)]
+    rates = {caregiver_id: Decimal(rng.randrange(20000, 150000)) / 100 for caregiver_id in caregiver_ids}
+    for _ in range(bookings):
+        caregiver_id = rng.choice(caregiver_ids)
+        yield (
+            str(uuid.UUID(int=rng.getrandbits(128))),
+            caregiver_id,
+            "INR",
+            rates[caregiver_id],
+            Decimal(rng.choice((100, 150, 200, 300, 400, 800))) / 100,
+        )
+
+
+def bench_accumulator(bookings: int, caregivers: int, chunk_size: int) -> dict:
+    from app.services.caregiver_payouts import PayoutAccumulator
+
+    rows = synthetic_rows(bookings, caregivers)
+    accumulator = PayoutAccumulator()
+    elapsed = 0.0  # time spent pricing, without generating the rows
+    tracemalloc.start()
+    while True:
+        chunk = [row for _, row in zip(range(chunk_size), rows)]
+        if not chunk:
+            break
+        started = time.perf_counter()
+        accumulator.add_chunk(chunk)
+        elapsed += time.perf_counter() - started
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return {
+        "chunk_size": chunk_size,
+        "bookings": accumulator.booking_count,
+        "caregivers": len(accumulator.totals),
+        "seconds": round(elapsed, 3),
+        "bookings_per_second": int(accumulator.booking_count / elapsed) if elapsed else None,
+        "peak_mb": round(peak / 1024 / 1024, 2),
+        "totals": accumulator.currency_totals(),
+    }
+
+
+def bench_database(days: int, chunk_size: int) -> dict:
+    from app.services.caregiver_payouts import compute_payout_batch
+
+    period_end = datetime.now(timezone.utc)
+    started = time.perf_counter()
+    summary = compute_payout_batch(period_end - timedelta(days=days), period_end, chunk_size=chunk_size, dry_run=True)
+    summary["seconds"] = round(time.perf_counter() - started, 3)
+    return summary
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Benchmark the caregiver payout engine")
+    parser.add_argument("--bookings", type=int, default=100_000)
+    parser.add_argument("--caregivers", type=int, default=2_000)
+    parser.add_argument("--chunk-sizes", default="1000,5000,20000", help="Comma-separated chunk sizes to compare")
+    parser.add_argument("--database", action="store_true", help="Dry-run a real batch over DATABASE_URL instead")
+    parser.add_argument("--days", type=int, default=30, help="Period length for --database")
+    args = parser.parse_args()
+
+    chunk_sizes = [int(size) for size in args.chunk_sizes.split(",") if size.strip()]
+    if args.database:
+        for chunk_size in chunk_sizes:
+            print(bench_database(args.days, chunk_size))
+    else:
+        print(f"Payout accumulator: {args.bookings} bookings, {args.caregivers} caregivers")
+        for chunk_size in chunk_sizes:
+            print(bench_accumulator(args.bookings, args.caregivers, chunk_size))